@@ -17,16 +17,20 @@ from core.web_search import duckduckgo_search
 
 # This comment is added to force Streamlit to clear its cache.
 
-from config.settings import APP_TITLE, APP_ICON
+from config.settings import APP_TITLE, APP_ICON, HISTORY_PAGE_SIZE, DASHBOARD_RECENT_ANALYSES, MAX_IMAGES_PER_ANALYSIS
 from config.database import init_db # Import init_db
 from components.sidebar import create_sidebar
 from components.image_upload import image_upload_component
 from components.analysis_display import analysis_display_component
+from components.recommendation_card import recommendation_card
+from components.similar_cases import similar_cases_component
 from core.disease_analyzer import DiseaseAnalyzer
 from core.recommendation_engine import RecommendationEngine
+from core.gemini_client import get_gemini_client
 from services.database_service import DatabaseService
 from services.image_service import ImageService
-from models.analysis import Analysis
+from services.similarity_index import SimilarityIndex
+from core.analysis_pipeline import AnalysisPipeline, BatchAnalyzer
 from models.user import User
 from duckduckgo_search import DDGS # Buradan DDGS'i import ediyoruz
 
@@ -56,10 +60,26 @@ def get_recommendation_engine():
 def get_image_service():
     return ImageService()
 
+@st.cache_resource
+def get_similarity_index():
+    return SimilarityIndex()
+
+@st.cache_resource
+def get_analysis_pipeline():
+    # One pipeline per process, so its thread pools are shared by every session and rerun
+    return AnalysisPipeline(get_disease_analyzer(), get_recommendation_engine(), get_image_service(), get_database_service(), get_similarity_index())
+
+@st.cache_resource
+def get_batch_analyzer():
+    return BatchAnalyzer(get_analysis_pipeline())
+
 db_service = get_database_service()
 disease_analyzer = get_disease_analyzer()
 recommendation_engine = get_recommendation_engine()
 image_service = get_image_service()
+similarity_index = get_similarity_index()
+analysis_pipeline = get_analysis_pipeline()
+batch_analyzer = get_batch_analyzer()
 
 # --- Session State Management ---
 if 'current_analysis' not in st.session_state:
@@ -71,6 +91,9 @@ if 'current_recommendations' not in st.session_state:
 if 'raw_gemini_recommendation_response' not in st.session_state:
     st.session_state.raw_gemini_recommendation_response = None
 
+if 'similar_cases' not in st.session_state:
+    st.session_state.similar_cases = []
+
 if 'logged_in' not in st.session_state:
     st.session_state.logged_in = False
 
@@ -85,6 +108,10 @@ def perform_web_search(query: str):
     # Sadece yeni oluşturduğumuz fonksiyonu çağırıyoruz:
     return duckduckgo_search(query)
 
+def override_quality_rejection(image_names):
+    # Reruns the analysis of these photos without the quality gate, for rejections the user considers wrong
+    st.session_state.quality_override = image_names
+
 def register_user(name, email, password):
     hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
     new_user = User(name=name, email=email, password_hash=hashed_password)
@@ -152,6 +179,8 @@ def main():
         st.session_state.current_analysis = None
         st.session_state.current_recommendations = []
         st.session_state.raw_gemini_recommendation_response = None
+        st.session_state.similar_cases = []
+        st.session_state.history_cursors = [None]
         st.rerun()
         return
 
@@ -175,11 +204,12 @@ def main():
         col1, col2 = st.columns(2)
         with col1:
             st.subheader("Son Analizler")
-            recent_analyses = db_service.get_analyses_by_user_id(st.session_state.user_id)
+            # Only the newest few rows, without the raw AI response; numbering comes from the stats count
+            recent_analyses, _ = db_service.get_analyses_page(st.session_state.user_id, page_size=DASHBOARD_RECENT_ANALYSES, summary=True)
             if recent_analyses:
-                for i, analysis in enumerate(recent_analyses[:5]):
+                for i, analysis in enumerate(recent_analyses):
                     display_date = analysis.analysis_date.strftime('%Y-%m-%d %H:%M') if analysis.analysis_date else "Bilinmiyor"
-                    st.markdown(f"**Analiz #{len(recent_analyses) - i}: {display_date}**")
+                    st.markdown(f"**Analiz #{dashboard_stats['total_analyses'] - i}: {display_date}**")
                     st.write(f"Tespit Edilen Hastalık: {analysis.disease_detected}")
                     st.write(f"Güven Skoru: {analysis.confidence_score:.2f}")
                     st.markdown("--- ")
@@ -192,80 +222,161 @@ def main():
 
         st.markdown("--- ")
         st.subheader("📈 Hastalık Trend Grafikleri")
-        st.info("Hastalık trend grafikleri ve genel istatistikler burada görüntülenecektir.")
+        trend_period = st.radio("Dönem", ["Haftalık", "Aylık"], horizontal=True, key="trend_period")
+        disease_trend = db_service.get_disease_trend(st.session_state.user_id, period="week" if trend_period == "Haftalık" else "month")
+        if not disease_trend.empty:
+            st.bar_chart(disease_trend)
+        else:
+            st.info("Trend grafiği için henüz yeterli hastalık tespiti bulunmamaktadır.")
 
     elif page == "Image Analysis":
         st.header("📷 Görüntü Analizi")
-        image_data, image_name = image_upload_component()
-
-        if st.button("Analizi Başlat") and image_data is not None:
-            with st.spinner("Görüntü analiz ediliyor..."):
-                try:
-                    processed_image_data = image_service.resize_image(image_data, max_size=(1024, 1024))
-                    processed_image_data = image_service.convert_to_jpeg(processed_image_data)
-                    unique_filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{image_name.replace(' ', '_') if image_name else 'uploaded_image.jpeg'}"
-                    saved_image_path = image_service.save_image(processed_image_data, unique_filename)
-                    analysis_result, raw_gemini_analysis_response = disease_analyzer.analyze_grape_image(processed_image_data)
-                    new_analysis = Analysis(
-                        user_id=st.session_state.user_id,
-                        image_path=saved_image_path,
-                        disease_detected=str(analysis_result.get('disease_detected', "Unknown")),
-                        confidence_score=float(analysis_result.get('confidence_score', 0.0)),
-                        gemini_response=raw_gemini_analysis_response
-                    )
-                    analysis_id = db_service.add_analysis(new_analysis)
-                    if analysis_id is not None:
-                        new_analysis.id = analysis_id
-                        st.session_state.current_analysis = new_analysis
-                        recommendations_list, raw_gemini_recommendation_response = recommendation_engine.generate_recommendations(new_analysis)
-                        for rec in recommendations_list:
-                            rec.analysis_id = analysis_id
-                            db_service.add_recommendation(rec)
-                        st.session_state.current_recommendations = recommendations_list
-                        st.session_state.raw_gemini_recommendation_response = raw_gemini_recommendation_response
-                        st.success("Analiz tamamlandı!")
-                        if st.session_state.raw_gemini_recommendation_response:
-                            st.subheader("📝 AI Açıklaması (Türkçe)")
-                            st.info(st.session_state.raw_gemini_recommendation_response)
+        uploaded_images = image_upload_component()
+        # The first photo is the analysis' main image (list views, similar cases)
+        image_data = uploaded_images[0][0] if uploaded_images else None
+
+        batch_mode = False
+        if len(uploaded_images) > 1:
+            analysis_mode = st.radio(
+                "Fotoğraflar",
+                ["Aynı bitkiye ait (tek analiz)", "Farklı bitkiler (toplu analiz, her fotoğraf ayrı)"],
+                index=0 if len(uploaded_images) <= MAX_IMAGES_PER_ANALYSIS else 1,
+                key="analysis_mode"
+            )
+            batch_mode = analysis_mode.startswith("Farklı") or len(uploaded_images) > MAX_IMAGES_PER_ANALYSIS
+            if len(uploaded_images) > MAX_IMAGES_PER_ANALYSIS and not analysis_mode.startswith("Farklı"):
+                st.info(f"Tek analizde en fazla {MAX_IMAGES_PER_ANALYSIS} fotoğraf kullanılabilir; fotoğraflar toplu olarak analiz edilecek.")
+
+        skip_quality_check = st.checkbox("Görüntü kalite kontrolünü atla", value=False, help="Bulanık, karanlık veya yaprak içermeyen görüntüler normalde analize gönderilmez.")
+        tiled_analysis = st.checkbox("Yüksek çözünürlüklü analiz (küçük lekeler için)", value=False, help="Fotoğraf tam çözünürlükte parçalara bölünür ve şüpheli bölgeler ayrı ayrı incelenir. Daha yavaştır. Tek fotoğrafla kullanılır.")
+        fused_analysis = st.checkbox("Hızlı mod (tanı ve öneriler tek istekte)", value=False, help="Hastalık tespiti ve öneriler tek bir yapay zeka isteğiyle alınır; yaklaşık iki kat hızlıdır. Yüksek çözünürlüklü analizle birlikte kullanılmaz.")
+        # Set by the "Yine de analiz et" button after a quality rejection: names of the photos to rerun
+        quality_override = st.session_state.pop('quality_override', None)
+        if (st.button("Analizi Başlat") or quality_override is not None) and image_data is not None:
+            if quality_override is not None:
+                skip_quality_check = True
+            if batch_mode:
+                # Photos are analyzed concurrently; progress and results appear as each one finishes
+                batch_images = [image for image in uploaded_images if quality_override is None or image[1] in quality_override]
+                progress_bar = st.progress(0.0, text=f"0/{len(batch_images)} fotoğraf analiz edildi")
+                results_container = st.container()
+                failed_count = 0
+                rejected_names = []
+                for completed, outcome in enumerate(batch_analyzer.run(st.session_state.user_id, batch_images, skip_quality_check=skip_quality_check, fused=fused_analysis), start=1):
+                    progress_bar.progress(completed / len(batch_images), text=f"{completed}/{len(batch_images)} fotoğraf analiz edildi")
+                    with results_container:
+                        if outcome.analysis is not None:
+                            st.success(f"{outcome.image_name}: {outcome.analysis.disease_detected} (Güven: {outcome.analysis.confidence_score * 100:.0f}%)")
+                        elif outcome.quality_issues:
+                            failed_count += 1
+                            rejected_names.append(outcome.image_name)
+                            st.warning(f"{outcome.image_name}: {' '.join(outcome.quality_issues)}")
+                        else:
+                            failed_count += 1
+                            st.error(f"{outcome.image_name}: Analiz sırasında bir hata oluştu: {outcome.error}")
+                st.session_state.current_analysis = None
+                st.session_state.current_recommendations = []
+                st.info(f"Toplu analiz tamamlandı: {len(batch_images) - failed_count} başarılı, {failed_count} başarısız. Sonuçlar 'Geçmiş Analizler' sayfasında.")
+                if rejected_names:
+                    st.button(f"Kalite kontrolünden geçmeyen {len(rejected_names)} fotoğrafı yine de analiz et", on_click=override_quality_rejection, args=(rejected_names,))
+            else:
+                # Recommendations are drawn here while they stream in, then replaced by the full result below
+                live_recommendations = st.empty()
+                live_container = live_recommendations.container()
+
+                def show_recommendation(rec):
+                    with live_container:
+                        recommendation_card(rec)
+
+                with st.spinner("Görüntü analiz ediliyor..."):
+                    outcome = analysis_pipeline.run(st.session_state.user_id, uploaded_images, skip_quality_check=skip_quality_check, tiled=tiled_analysis, fused=fused_analysis, on_recommendation=show_recommendation)
+                live_recommendations.empty()
+                if outcome.analysis is not None:
+                    st.success("Analiz tamamlandı!")
+                    st.caption(f"Süre: {outcome.timings['total'] / 1000:.1f} sn (aşamalar sırayla çalışsaydı ~{outcome.sequential_ms() / 1000:.1f} sn)")
+                    if outcome.raw_recommendation_response:
+                        st.subheader("📝 AI Açıklaması (Türkçe)")
+                        st.info(outcome.raw_recommendation_response)
+                # The result above is already on screen while the analysis is being stored
+                if outcome.analysis is not None and outcome.wait_persisted():
+                    st.session_state.current_analysis = outcome.analysis
+                    st.session_state.current_recommendations = outcome.recommendations
+                    st.session_state.raw_gemini_recommendation_response = outcome.raw_recommendation_response
+                    st.session_state.similar_cases = outcome.similar_cases
+                else:
+                    if outcome.quality_issues:
+                        # Rejected locally before any API call; nothing is stored
+                        for issue in outcome.quality_issues:
+                            st.warning(issue)
+                        st.button("Yine de analiz et", on_click=override_quality_rejection, args=([name for _, name in uploaded_images],), help="Kalite kontrolü hatalı bir ret verdiyse fotoğrafları kontrol olmadan analize gönderir.")
                     else:
-                        st.error("Analiz veritabanına kaydedilemedi.")
-                except Exception as e:
-                    st.error(f"Analiz sırasında bir hata oluştu: {e}")
+                        st.error(f"Analiz sırasında bir hata oluştu: {outcome.error}")
                     st.session_state.current_analysis = None
                     st.session_state.current_recommendations = []
 
         if st.session_state.current_analysis:
-            analysis_display_component(st.session_state.current_analysis, st.session_state.current_recommendations)
+            analysis_display_component(st.session_state.current_analysis, st.session_state.current_recommendations, db_service)
+            similar_cases_component(st.session_state.similar_cases)
         elif image_data is None:
             st.info("Lütfen bir görüntü yükleyin veya kamera ile çekin.")
 
     elif page == "History":
         st.header("📋 Geçmiş Analizler")
+        # Cursors of the pages visited so far; the last one is the page being shown
+        if 'history_cursors' not in st.session_state:
+            st.session_state.history_cursors = [None]
+
+        next_cursor = None
         if st.session_state.user_id is not None:
-            user_analyses = db_service.get_analyses_by_user_id(st.session_state.user_id)
+            total_analyses = db_service.count_analyses(st.session_state.user_id)
+            # Recommendations and follow-ups for the page come from a fixed number of queries
+            user_analyses, next_cursor = db_service.get_analyses_page_with_details(
+                st.session_state.user_id,
+                page_size=HISTORY_PAGE_SIZE,
+                cursor=st.session_state.history_cursors[-1]
+            )
         else:
             user_analyses = []
             st.warning("Kullanıcı ID'si bulunamadı. Lütfen giriş yapın.")
 
         if user_analyses:
-            st.write("Son analizleriniz:")
-            for i, analysis in enumerate(user_analyses):
-                recommendations = db_service.get_recommendations_by_analysis_id(analysis.id) if analysis.id else []
+            page_index = len(st.session_state.history_cursors) - 1
+            st.write(f"Son analizleriniz (Sayfa {page_index + 1}):")
+            for i, (analysis, recommendations, follow_ups) in enumerate(user_analyses):
                 display_date = analysis.analysis_date.strftime('%Y-%m-%d %H:%M') if analysis.analysis_date else "Bilinmiyor"
-                with st.expander(f"Analiz #{len(user_analyses) - i}: {display_date} - {analysis.disease_detected}"):
-                    analysis_display_component(analysis, recommendations)
+                with st.expander(f"Analiz #{total_analyses - page_index * HISTORY_PAGE_SIZE - i}: {display_date} - {analysis.disease_detected}"):
+                    analysis_display_component(analysis, recommendations, db_service, follow_ups)
                     if analysis.gemini_response:
                         st.subheader("📝 AI Açıklaması (Türkçe)")
                         st.info(analysis.gemini_response)
 
                     # Add a delete button for the analysis
                     if st.button(f"Analizi Sil (ID: {analysis.id})", key=f"delete_analysis_{analysis.id}", type="secondary"):
+                        # Read before deleting: analysis_images rows go with the analysis
+                        image_paths = set(db_service.get_analysis_images(analysis.id)) | ({analysis.image_path} if analysis.image_path else set())
                         if db_service.delete_analysis(analysis.id):
+                            for image_path in image_paths:
+                                image_service.release_image(image_path, db_service.count_image_references(image_path))
+                            similarity_index.remove(analysis.id)
                             st.success(f"Analiz ID: {analysis.id} başarıyla silindi.")
                             st.session_state.current_analysis = None # Clear current analysis if it was deleted
                             st.rerun()
                         else:
                             st.error(f"Analiz ID: {analysis.id} silinirken bir hata oluştu.")
+
+            col_prev, col_next = st.columns(2)
+            with col_prev:
+                if page_index > 0 and st.button("← Önceki Sayfa", key="history_prev_page"):
+                    st.session_state.history_cursors.pop()
+                    st.rerun()
+            with col_next:
+                if next_cursor is not None and st.button("Sonraki Sayfa →", key="history_next_page"):
+                    st.session_state.history_cursors.append(next_cursor)
+                    st.rerun()
+        elif len(st.session_state.history_cursors) > 1:
+            # The page became empty, e.g. after deleting its last analysis
+            st.session_state.history_cursors.pop()
+            st.rerun()
         else:
             st.info("Henüz bir analiz geçmişiniz bulunmamaktadır.")
 
@@ -327,5 +438,13 @@ def main():
         else:
             st.warning("Kullanıcı bilgileri yüklenemedi.")
 
+        with st.expander("Yapay Zeka İstek İstatistikleri"):
+            # Identical requests that overlap (double clicks, several users sending the same photo) share one API call
+            gemini_stats = get_gemini_client().stats()
+            stats_col1, stats_col2, stats_col3 = st.columns(3)
+            stats_col1.metric("API Çağrısı", gemini_stats["upstream_calls"])
+            stats_col2.metric("Birleştirilen İstek", gemini_stats["coalesced_calls"])
+            stats_col3.metric("Tasarruf Oranı", f"{gemini_stats['saved_rate'] * 100:.1f}%")
+
 if __name__ == "__main__":
     main()
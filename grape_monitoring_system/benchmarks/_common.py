@@ -0,0 +1,42 @@
+"""
+Helpers shared by the benchmark scripts. Run the scripts from the grape_monitoring_system directory,
+e.g. `python -m benchmarks.bench_db_concurrency`; every script works on a throwaway database or files.
+"""
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+from config import database
+from services import database_service
+from services.database_service import DatabaseService
+from models.user import User
+
+
+@contextlib.contextmanager
+def temporary_database():
+    """Points init_db and every DatabaseService at a freshly migrated database in a temp dir; yields its path."""
+    directory = tempfile.mkdtemp(prefix="grape-bench-")
+    path = os.path.join(directory, "database.db")
+    saved = database.DATABASE_NAME, database_service.connection_manager
+    database.DATABASE_NAME = path
+    database_service.connection_manager = database.ConnectionManager(path)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()): # Migration progress lines
+            database.init_db()
+        yield path
+    finally:
+        database_service.connection_manager.close_connection()
+        database.DATABASE_NAME, database_service.connection_manager = saved
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def add_user(service: DatabaseService, number: int = 0) -> int:
+    return service.add_user(User(name=f"Bağcı {number}", email=f"bagci{number}@example.com", password_hash="x"))
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
@@ -0,0 +1,113 @@
+"""
+Read/write throughput of DatabaseService with N simultaneous sessions (threads, as Streamlit runs them).
+Compares the per-thread WAL connections of ConnectionManager with the previous setup: one connection shared
+by every thread, rollback journal, and a SELECT 1 liveness probe before each call.
+
+    python -m benchmarks.bench_db_concurrency [--sessions 8] [--seconds 3] [--write-share 0.1]
+"""
+import argparse
+import contextlib
+import io
+import random
+import sqlite3
+import threading
+import time
+from config.database import BUSY_TIMEOUT_MS
+from services import database_service
+from services.database_service import DatabaseService
+from models.analysis import Analysis
+from models.recommendation import Recommendation
+from benchmarks._common import add_user, percentile, temporary_database
+
+
+class SharedConnectionManager:
+    """The setup before ConnectionManager: a single connection for all threads, probed with SELECT 1 before every use."""
+
+    def __init__(self, database_name: str):
+        self._conn = sqlite3.connect(database_name, timeout=BUSY_TIMEOUT_MS / 1000, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode = DELETE")
+        self._conn.execute("PRAGMA foreign_keys = ON")
+
+    def get_connection(self) -> sqlite3.Connection:
+        self._conn.execute("SELECT 1")
+        return self._conn
+
+    def close_connection(self):
+        pass
+
+
+def _session(service: DatabaseService, user_ids: list[int], deadline: float, write_share: float, seed: int, results: dict):
+    rng = random.Random(seed)
+    reads, writes, errors = [], [], 0
+    while time.perf_counter() < deadline:
+        user_id = rng.choice(user_ids)
+        start = time.perf_counter()
+        try:
+            if rng.random() < write_share:
+                saved = service.save_analysis_bundle(
+                    Analysis(user_id=user_id, image_path="uploads/bench.jpg", disease_detected=rng.choice(["Mildew", "Botrytis", "Sağlıklı"]),
+                             confidence_score=0.8, gemini_response="{}"),
+                    [Recommendation(recommendation_type="tedavi", description=f"Öneri {n}", priority=3) for n in range(3)]
+                )
+                if saved is None:
+                    errors += 1
+                    continue
+                writes.append(time.perf_counter() - start)
+            else:
+                service.get_analyses_page(user_id, page_size=20, summary=True)
+                service.get_dashboard_stats(user_id)
+                reads.append(time.perf_counter() - start)
+        except sqlite3.Error:
+            errors += 1
+    results[seed] = (reads, writes, errors)
+
+
+def run(manager, sessions: int, seconds: float, write_share: float, user_ids: list[int]) -> dict:
+    database_service.connection_manager = manager
+    service = DatabaseService()
+    results = {}
+    deadline = time.perf_counter() + seconds
+    threads = [threading.Thread(target=_session, args=(service, user_ids, deadline, write_share, seed, results)) for seed in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    reads = [latency for session_reads, _, _ in results.values() for latency in session_reads]
+    writes = [latency for _, session_writes, _ in results.values() for latency in session_writes]
+    return {
+        "reads_per_s": len(reads) / seconds,
+        "writes_per_s": len(writes) / seconds,
+        "read_p95_ms": percentile(reads, 0.95) * 1000,
+        "write_p95_ms": percentile(writes, 0.95) * 1000,
+        "errors": sum(errors for _, _, errors in results.values()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--write-share", type=float, default=0.1)
+    args = parser.parse_args()
+
+    print(f"{args.sessions} sessions, {args.seconds:.0f} s each, {args.write_share:.0%} writes")
+    print(f"{'setup':<28}{'reads/s':>10}{'writes/s':>10}{'read p95':>12}{'write p95':>12}{'errors':>8}")
+    # Each setup gets its own database: WAL mode is a persistent property of the file
+    for name, make_manager in (("shared connection, DELETE", SharedConnectionManager), ("per-thread, WAL", None)):
+        with temporary_database() as path:
+            service = DatabaseService()
+            user_ids = [add_user(service, number) for number in range(20)]
+            if make_manager:
+                service.close_connection() # Leaving WAL mode needs the file to itself
+                manager = make_manager(path)
+            else:
+                manager = database_service.connection_manager
+            with contextlib.redirect_stdout(io.StringIO()): # Failed writes are counted as errors instead of printed
+                stats = run(manager, args.sessions, args.seconds, args.write_share, user_ids)
+            print(f"{name:<28}{stats['reads_per_s']:>10.0f}{stats['writes_per_s']:>10.0f}"
+                  f"{stats['read_p95_ms']:>10.2f}ms{stats['write_p95_ms']:>10.2f}ms{stats['errors']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Query latency of DatabaseService.search_forum (FTS5 + BM25) on a forum with --posts questions and answers,
+next to a LIKE '%...%' scan of the same text as the no-index baseline.
+
+    python -m benchmarks.bench_forum_search [--posts 500000] [--answers-per-question 4] [--repeat 20]
+"""
+import argparse
+import random
+import time
+from services.database_service import DatabaseService
+from benchmarks._common import add_user, percentile, temporary_database
+
+# Topic words appear in a small share of posts each, like real forum vocabulary; the rest of a post is filler
+TOPIC_WORDS = (
+    "üzüm asma yaprak salkım külleme mildiyö kurşuni küf botrytis antraknoz pas leke sararma kuruma budama "
+    "sulama gübre kükürt bakır fungisit ilaç uygulama ilkbahar hasat toprak nem yağmur sıcaklık ılık "
+    "haftada doz litre dekar belirti beyaz toz kahverengi siyah nokta çürüme filiz sürgün"
+).split()
+SYLLABLES = "ba be bı bo bu da de dı do ka ke kı ko la le lı lo ma me mı mo na ne nı no ra re rı ro sa se sı so ta te tı to ya ye".split()
+TOPIC_WORDS_PER_POST = 0.6 # On average; each topic word then occurs in about 1-2% of posts
+QUERIES = ["külleme", "kulleme", "mildiyö bakır", "botrytis salkım", "sulama", "ILIK", "fungisit uygulama", "asm"]
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(
+        rng.choice(TOPIC_WORDS) if rng.random() < TOPIC_WORDS_PER_POST / words else "".join(rng.choices(SYLLABLES, k=3))
+        for _ in range(words)
+    )
+
+
+def populate(service: DatabaseService, posts: int, answers_per_question: int, seed: int = 1) -> tuple[int, int]:
+    """Bulk-inserts questions and answers; the triggers fill forum_search exactly as for posts made in the app."""
+    rng = random.Random(seed)
+    user_id = add_user(service)
+    questions = posts // (answers_per_question + 1)
+    conn = service._get_connection()
+    with conn:
+        conn.executemany(
+            "INSERT INTO questions (user_id, title, question_text) VALUES (?, ?, ?)",
+            ((user_id, _sentence(rng, 6).capitalize() + "?", _sentence(rng, 40)) for _ in range(questions))
+        )
+        conn.executemany(
+            "INSERT INTO answers (question_id, user_id, answer_text) VALUES (?, ?, ?)",
+            ((rng.randint(1, questions), user_id, _sentence(rng, 30)) for _ in range(posts - questions))
+        )
+    return questions, posts - questions
+
+
+def like_search(service: DatabaseService, query: str) -> list:
+    # What a search without the index has to do before it can rank anything: scan every post for the first word
+    pattern = f"%{query.split()[0]}%"
+    return service._get_connection().execute("""
+        SELECT -id FROM questions WHERE title LIKE ? OR question_text LIKE ?
+        UNION ALL
+        SELECT question_id FROM answers WHERE answer_text LIKE ?
+    """, (pattern, pattern, pattern)).fetchall()
+
+
+def timed(function, repeat: int) -> list[float]:
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--posts", type=int, default=500_000)
+    parser.add_argument("--answers-per-question", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with temporary_database():
+        service = DatabaseService()
+        start = time.perf_counter()
+        questions, answers = populate(service, args.posts, args.answers_per_question)
+        print(f"Indexed {questions} questions and {answers} answers in {time.perf_counter() - start:.1f} s")
+
+        print(f"{'query':<30}{'hits':>6}{'FTS p50':>12}{'FTS p95':>12}{'LIKE p50':>12}")
+        for query in QUERIES:
+            hits = len(service.search_forum(query, limit=20))
+            fts = timed(lambda: service.search_forum(query, limit=20), args.repeat)
+            like = timed(lambda: like_search(service, query), max(1, args.repeat // 10))
+            print(f"{query:<30}{hits:>6}{percentile(fts, 0.5) * 1000:>10.1f}ms{percentile(fts, 0.95) * 1000:>10.1f}ms"
+                  f"{percentile(like, 0.5) * 1000:>10.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
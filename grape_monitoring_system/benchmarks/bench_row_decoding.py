@@ -0,0 +1,96 @@
+"""
+Rows/sec and memory per object when loading analyses: the connection's TIMESTAMP converter plus the slotted
+model row factory (DatabaseService.get_analyses_by_user_id), against the previous decoding of dict(row),
+datetime.strptime per row and a regular (__dict__) dataclass.
+
+    python -m benchmarks.bench_row_decoding [--rows 100000] [--repeat 5]
+"""
+import argparse
+import dataclasses
+import sqlite3
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from services.database_service import DatabaseService
+from models.analysis import Analysis
+from benchmarks._common import add_user, temporary_database
+
+# The Analysis model as it was before slots=True
+LegacyAnalysis = dataclasses.make_dataclass(
+    "LegacyAnalysis", [(field.name, field.type, dataclasses.field(default=None)) for field in dataclasses.fields(Analysis)]
+)
+
+
+def load_legacy(database_name: str, user_id: int) -> list:
+    conn = sqlite3.connect(database_name)
+    conn.row_factory = sqlite3.Row
+    try:
+        cursor = conn.execute("SELECT * FROM analyses WHERE user_id = ? ORDER BY analysis_date DESC", (user_id,))
+        analyses = []
+        for row in cursor.fetchall():
+            analysis_data = dict(row)
+            if analysis_data['analysis_date']:
+                analysis_data['analysis_date'] = datetime.strptime(analysis_data['analysis_date'], '%Y-%m-%d %H:%M:%S')
+            analyses.append(LegacyAnalysis(**analysis_data))
+        return analyses
+    finally:
+        conn.close()
+
+
+def load_current(service: DatabaseService, user_id: int) -> list:
+    return service.get_analyses_by_user_id(user_id)
+
+
+def populate(service: DatabaseService, rows: int) -> int:
+    user_id = add_user(service)
+    start = datetime(2024, 1, 1)
+    conn = service._get_connection()
+    with conn:
+        conn.executemany(
+            "INSERT INTO analyses (user_id, image_path, disease_detected, confidence_score, analysis_date, gemini_response) VALUES (?, ?, ?, ?, ?, ?)",
+            ((user_id, f"uploads/{n:06d}.jpg", ("Mildew", "Botrytis", "Sağlıklı")[n % 3], 0.8, (start + timedelta(minutes=n)).strftime('%Y-%m-%d %H:%M:%S'), "{}")
+             for n in range(rows))
+        )
+    return user_id
+
+
+def measure(load, repeat: int) -> dict:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        analyses = load()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    del analyses
+    tracemalloc.start()
+    analyses = load()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "rows_per_s": len(analyses) / best,
+        "instance_bytes": sys.getsizeof(analyses[0]) + (sys.getsizeof(analyses[0].__dict__) if hasattr(analyses[0], "__dict__") else 0),
+        "retained_bytes": retained / len(analyses), # Instance plus its field values (datetime, strings)
+        "type": type(analyses[0].analysis_date).__name__,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with temporary_database() as path:
+        service = DatabaseService()
+        user_id = populate(service, args.rows)
+        print(f"{args.rows} analyses, best of {args.repeat} fetches")
+        print(f"{'decoding':<34}{'rows/s':>10}{'object':>10}{'retained':>10}  analysis_date")
+        for name, load in (("dict(row) + strptime, dataclass", lambda: load_legacy(path, user_id)),
+                           ("converter + slotted row factory", lambda: load_current(service, user_id))):
+            stats = measure(load, args.repeat)
+            print(f"{name:<34}{stats['rows_per_s']:>10.0f}{stats['instance_bytes']:>9}B{stats['retained_bytes']:>9.0f}B  {stats['type']}")
+
+
+if __name__ == '__main__':
+    main()
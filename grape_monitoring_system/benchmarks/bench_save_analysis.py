@@ -0,0 +1,79 @@
+"""
+Latency and commit count of storing one analysis result: save_analysis_bundle (one transaction, executemany)
+against the previous path of add_analysis, then add_recommendation / add_follow_up per row, each committing.
+
+    python -m benchmarks.bench_save_analysis [--analyses 300] [--recommendations 5] [--synchronous NORMAL|FULL]
+"""
+import argparse
+import time
+from services.database_service import DatabaseService
+from models.analysis import Analysis
+from models.recommendation import Recommendation
+from benchmarks._common import add_user, percentile, temporary_database
+
+
+def _analysis(user_id: int) -> Analysis:
+    return Analysis(user_id=user_id, image_path="uploads/bench.jpg", disease_detected="Mildew", confidence_score=0.8, gemini_response="{}")
+
+
+def _recommendations(count: int) -> list[Recommendation]:
+    return [Recommendation(recommendation_type="tedavi", description=f"Öneri {n}", priority=3) for n in range(count)]
+
+
+def save_row_by_row(service: DatabaseService, user_id: int, recommendation_count: int):
+    analysis = _analysis(user_id)
+    analysis_id = service.add_analysis(analysis)
+    for recommendation in _recommendations(recommendation_count):
+        recommendation.analysis_id = analysis_id
+        service.add_recommendation(recommendation)
+    service.add_follow_up(analysis_id, "Beklemede", "")
+
+
+def save_bundle(service: DatabaseService, user_id: int, recommendation_count: int):
+    service.save_analysis_bundle(_analysis(user_id), _recommendations(recommendation_count), follow_ups=[{"status": "Beklemede", "notes": ""}])
+
+
+def measure(save, analyses: int, recommendation_count: int, synchronous: str) -> dict:
+    with temporary_database():
+        service = DatabaseService()
+        user_id = add_user(service)
+        conn = service._get_connection()
+        conn.execute(f"PRAGMA synchronous = {synchronous}")
+        commits = 0
+
+        def count_commits(statement: str):
+            nonlocal commits
+            if statement.strip().upper().startswith("COMMIT"):
+                commits += 1
+
+        conn.set_trace_callback(count_commits)
+        latencies = []
+        for _ in range(analyses):
+            start = time.perf_counter()
+            save(service, user_id, recommendation_count)
+            latencies.append(time.perf_counter() - start)
+        conn.set_trace_callback(None)
+    return {
+        "commits_per_analysis": commits / analyses,
+        "mean_ms": sum(latencies) / len(latencies) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--analyses", type=int, default=300)
+    parser.add_argument("--recommendations", type=int, default=5)
+    parser.add_argument("--synchronous", choices=["NORMAL", "FULL"], default="NORMAL",
+                        help="NORMAL is what ConnectionManager uses; FULL shows the cost of an fsync per commit")
+    args = parser.parse_args()
+
+    print(f"{args.analyses} analyses with {args.recommendations} recommendations and 1 follow-up each, synchronous={args.synchronous}")
+    print(f"{'path':<16}{'commits':>10}{'mean':>12}{'p95':>12}")
+    for name, save in (("row by row", save_row_by_row), ("bundle", save_bundle)):
+        stats = measure(save, args.analyses, args.recommendations, args.synchronous)
+        print(f"{name:<16}{stats['commits_per_analysis']:>10.1f}{stats['mean_ms']:>10.3f}ms{stats['p95_ms']:>10.3f}ms")
+
+
+if __name__ == '__main__':
+    main()
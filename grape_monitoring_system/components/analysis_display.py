@@ -3,16 +3,16 @@ from models.analysis import Analysis
 from models.recommendation import Recommendation
 from components.recommendation_card import recommendation_card
 from services.database_service import DatabaseService
+from config.settings import HEALTHY_LABELS
 from datetime import datetime
+from typing import Optional
 import json
 
-db_service = DatabaseService()
-
-def analysis_display_component(analysis: Analysis, recommendations: list[Recommendation]):
+def analysis_display_component(analysis: Analysis, recommendations: list[Recommendation], db_service: DatabaseService, follow_ups: Optional[list[dict]] = None):
     st.header("🔬 Analiz Sonuçları")
     if analysis:
         st.subheader("Tespit Edilen Hastalık")
-        if analysis.disease_detected and analysis.disease_detected != "Unknown":
+        if analysis.disease_detected and analysis.disease_detected != "Unknown" and analysis.disease_detected not in HEALTHY_LABELS:
             st.success(f"**{analysis.disease_detected}**")
             st.info(f"Güven Skoru: {analysis.confidence_score * 100:.2f}%")
             
@@ -28,7 +28,7 @@ def analysis_display_component(analysis: Analysis, recommendations: list[Recomme
             if explanation_from_json:
                 st.write(f"Açıklama: {explanation_from_json}")
             
-        elif analysis.disease_detected == "Healthy":
+        elif analysis.disease_detected in HEALTHY_LABELS:
             st.success("Hastalık belirtisi tespit edilmedi. Üzüm bitkiniz sağlıklı!")
             st.info(f"Güven Skoru: {analysis.confidence_score * 100:.2f}%")
             
@@ -71,7 +71,8 @@ def analysis_display_component(analysis: Analysis, recommendations: list[Recomme
         
         st.markdown("**Mevcut Takip Notları:**")
         if analysis.id:
-            follow_ups = db_service.get_follow_ups_by_analysis_id(analysis.id)
+            if follow_ups is None: # Callers rendering many analyses pass them in pre-loaded
+                follow_ups = db_service.get_follow_ups_by_analysis_id(analysis.id)
             if follow_ups:
                 for fu in follow_ups:
                     st.markdown(f"- **{fu.get('follow_up_date', 'Bilinmiyor')}** ({fu.get('status', 'Bilinmiyor')}): {fu.get('notes', '')}")
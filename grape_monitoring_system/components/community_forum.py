@@ -1,13 +1,48 @@
 import streamlit as st
 from services.database_service import DatabaseService
 from datetime import datetime
+from config.settings import FORUM_PAGE_SIZE
+
+def _render_question(db_service: DatabaseService, user_id: int, q: dict, answers: list[dict]):
+    display_date = q['created_at'].strftime('%Y-%m-%d %H:%M') if isinstance(q['created_at'], datetime) else (q['created_at'] or "Bilinmiyor")
+    activity = f"{q['answer_count']} cevap"
+    if isinstance(q['last_activity_at'], datetime):
+        activity += f", son etkinlik {q['last_activity_at'].strftime('%Y-%m-%d %H:%M')}"
+
+    with st.expander(f"**{q['title']}** - {q['user_name']} ({display_date}) · {activity}"):
+        st.write(q['question_text'])
+        st.markdown("--- ")
+        st.subheader("Cevaplar")
+        if answers:
+            for a in answers:
+                answer_display_date = a['created_at'].strftime('%Y-%m-%d %H:%M') if isinstance(a['created_at'], datetime) else (a['created_at'] or "Bilinmiyor")
+                st.markdown(f"**{a['user_name']}** ({answer_display_date}): {a['answer_text']}")
+            st.markdown("--- ")
+        else:
+            st.info("Henüz bir cevap yok.")
+
+        # Answer Submission Form
+        with st.form(key=f"answer_form_{q['id']}"):
+            answer_text = st.text_area("Cevabınızı Yazın", key=f"answer_text_{q['id']}")
+            submit_answer = st.form_submit_button("Cevapla")
+
+            if submit_answer:
+                if not answer_text:
+                    st.warning("Lütfen cevabınızı girin.")
+                else:
+                    added_id = db_service.add_answer(q['id'], user_id, answer_text)
+                    if added_id:
+                        st.success("Cevabınız eklendi!")
+                        st.rerun()
+                    else:
+                        st.error("Cevabınız eklenirken bir hata oluştu.")
 
 def community_forum_component(db_service: DatabaseService, user_id: int):
     st.header("💬 Topluluk Forumu")
 
-    # Display existing questions
-    st.subheader("Sorular")
-    questions = db_service.get_questions()
+    # Cursors of the pages visited so far; the last one is the page being shown
+    if 'forum_cursors' not in st.session_state:
+        st.session_state.forum_cursors = [None]
 
     # Question Submission Form
     with st.expander("Yeni Soru Sor", expanded=False):
@@ -27,47 +62,41 @@ def community_forum_component(db_service: DatabaseService, user_id: int):
                     else:
                         st.error("Sorunuz eklenirken bir hata oluştu.")
 
+    # Search across titles, questions and answers before asking again
+    search_query = st.text_input("🔍 Forumda ara (örn: külleme, mildiyö)", key="forum_search_query")
+    if search_query.strip():
+        st.subheader("Arama Sonuçları")
+        results = db_service.search_forum(search_query, limit=FORUM_PAGE_SIZE)
+        if results:
+            answers_by_question = db_service.get_answers_for_questions([q['id'] for q in results])
+            for q in results:
+                _render_question(db_service, user_id, q, answers_by_question.get(q['id'], []))
+        else:
+            st.info(f"'{search_query}' ile eşleşen soru bulunamadı.")
+        return
+
+    # Display existing questions
+    st.subheader("Sorular")
+    questions, next_cursor = db_service.get_questions_page(page_size=FORUM_PAGE_SIZE, cursor=st.session_state.forum_cursors[-1])
+
     if questions:
+        # Answers for the visible page only, in a single query
+        answers_by_question = db_service.get_answers_for_questions([q['id'] for q in questions])
         for q in questions:
-            display_date = q['created_at'] if q['created_at'] else "Bilinmiyor"
-            if isinstance(display_date, str):
-                try:
-                    display_date = datetime.strptime(display_date, '%Y-%m-%d %H:%M:%S').strftime('%Y-%m-%d %H:%M')
-                except ValueError:
-                    pass # Keep as is if parsing fails
-            
-            with st.expander(f"**{q['title']}** - {q['user_name']} ({display_date})"):
-                st.write(q['question_text'])
-                st.markdown("--- ")
-                st.subheader("Cevaplar")
-                answers = db_service.get_answers_for_question(q['id'])
-                if answers:
-                    for a in answers:
-                        answer_display_date = a['created_at'] if a['created_at'] else "Bilinmiyor"
-                        if isinstance(answer_display_date, str):
-                            try:
-                                answer_display_date = datetime.strptime(answer_display_date, '%Y-%m-%d %H:%M:%S').strftime('%Y-%m-%d %H:%M')
-                            except ValueError:
-                                pass # Keep as is if parsing fails
-                        st.markdown(f"**{a['user_name']}** ({answer_display_date}): {a['answer_text']}")
-                    st.markdown("--- ")
-                else:
-                    st.info("Henüz bir cevap yok.")
-
-                # Answer Submission Form
-                with st.form(key=f'answer_form_{q['id']}'):
-                    answer_text = st.text_area("Cevabınızı Yazın", key=f"answer_text_{q['id']}")
-                    submit_answer = st.form_submit_button("Cevapla")
+            _render_question(db_service, user_id, q, answers_by_question.get(q['id'], []))
 
-                    if submit_answer:
-                        if not answer_text:
-                            st.warning("Lütfen cevabınızı girin.")
-                        else:
-                            added_id = db_service.add_answer(q['id'], user_id, answer_text)
-                            if added_id:
-                                st.success("Cevabınız eklendi!")
-                                st.rerun()
-                            else:
-                                st.error("Cevabınız eklenirken bir hata oluştu.")
+        page_index = len(st.session_state.forum_cursors) - 1
+        col_prev, col_next = st.columns(2)
+        with col_prev:
+            if page_index > 0 and st.button("← Önceki Sayfa", key="forum_prev_page"):
+                st.session_state.forum_cursors.pop()
+                st.rerun()
+        with col_next:
+            if next_cursor is not None and st.button("Sonraki Sayfa →", key="forum_next_page"):
+                st.session_state.forum_cursors.append(next_cursor)
+                st.rerun()
+    elif len(st.session_state.forum_cursors) > 1:
+        st.session_state.forum_cursors.pop()
+        st.rerun()
     else:
-        st.info("Henüz soru sorulmamış.") 
\ No newline at end of file
+        st.info("Henüz soru sorulmamış.")
@@ -1,25 +1,61 @@
 import streamlit as st
-from PIL import Image
-import io
+from config.settings import MAX_UPLOAD_BYTES, MAX_IMAGES_PER_ANALYSIS, MAX_BATCH_IMAGES, UPLOAD_PREVIEW_SIZE
+from utils.image_utils import preview_thumbnail
+from utils.validators import validate_image_upload
 
-def image_upload_component():
+def image_upload_component() -> list[tuple[bytes, str]]:
+    """
+    Lets the user upload one or more photos (several views of one plant, or a whole batch of plants)
+    and/or take one with the camera. Returns the accepted images as (image_data, image_name) pairs.
+    """
     st.header("📷 Görüntü Yükle")
 
-    uploaded_file = st.file_uploader("Görüntü Yükle", type=["png", "jpg", "jpeg", "webp"])
+    uploaded_files = st.file_uploader(
+        "Görüntü Yükle",
+        type=["png", "jpg", "jpeg", "webp"],
+        accept_multiple_files=True,
+        help=f"Aynı asmanın en fazla {MAX_IMAGES_PER_ANALYSIS} fotoğrafını (yaprak üstü, yaprak altı, salkım) ya da toplu analiz için en fazla {MAX_BATCH_IMAGES} fotoğraf yükleyebilirsiniz."
+    )
 
     camera_image = st.camera_input("Veya kameradan görüntü çek")
 
-    image_data = None
-    image_name = None
-
-    if uploaded_file is not None:
-        image_data = uploaded_file.read()
-        image_name = uploaded_file.name
-        st.image(image_data, caption='Yüklenen Görüntü', use_container_width=True)
-    elif camera_image is not None:
-        image_data = camera_image.read()
+    candidates = []
+    for uploaded_file in uploaded_files or []:
+        if uploaded_file.size > MAX_UPLOAD_BYTES:
+            st.error(f"{uploaded_file.name}: Dosya çok büyük (en fazla {MAX_UPLOAD_BYTES // (1024 * 1024)} MB).")
+            continue
+        candidates.append((uploaded_file.read(), uploaded_file.name, f"Yüklenen Görüntü ({uploaded_file.name})"))
+    if camera_image is not None:
         image_name = f"camera_capture_{len(st.session_state.get('analyses', [])) + 1}.jpeg"
-        st.image(image_data, caption='Kameradan Çekilen Görüntü', use_container_width=True)
-    
-    return image_data, image_name
+        candidates.append((camera_image.read(), image_name, 'Kameradan Çekilen Görüntü'))
+
+    if len(candidates) > MAX_BATCH_IMAGES:
+        st.warning(f"Tek seferde en fazla {MAX_BATCH_IMAGES} fotoğraf yüklenebilir; ilk {MAX_BATCH_IMAGES} fotoğraf alındı.")
+        candidates = candidates[:MAX_BATCH_IMAGES]
+
+    images = []
+    captions = []
+    for image_data, image_name, caption in candidates:
+        # Header-only check, so oversized or malformed files are rejected before any preview is decoded
+        upload_error = validate_image_upload(image_data)
+        if upload_error:
+            st.error(f"{image_name}: {upload_error}")
+            continue
+        images.append((image_data, image_name))
+        captions.append(caption)
+
+    if len(images) > MAX_IMAGES_PER_ANALYSIS:
+        # Previewing a whole batch would decode every photo in the browser
+        st.caption(f"{len(images)} fotoğraf yüklendi.")
+    elif images:
+        for column, (image_data, _), caption in zip(st.columns(len(images)), images, captions):
+            with column:
+                # A reduced-scale decode instead of handing the full photo to st.image, which would decode,
+                # rescale and re-encode it on the server and send it to the browser at full size
+                try:
+                    st.image(preview_thumbnail(image_data, UPLOAD_PREVIEW_SIZE), caption=caption, use_container_width=True, output_format="JPEG")
+                except Exception as e:
+                    print(f"Error creating preview for {caption}: {e}")
+                    st.caption(caption)
 
+    return images
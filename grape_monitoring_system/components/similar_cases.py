@@ -0,0 +1,22 @@
+import os
+import streamlit as st
+from datetime import datetime
+from models.analysis import Analysis
+
+def similar_cases_component(similar_cases: list[tuple[Analysis, float]]):
+    """
+    Displays previously analyzed images that look like the current one, with their diagnosis.
+    """
+    st.subheader("🔍 Benzer Geçmiş Vakalar")
+    if not similar_cases:
+        st.info("Benzer bir geçmiş vaka bulunamadı.")
+        return
+
+    columns = st.columns(len(similar_cases))
+    for column, (analysis, similarity) in zip(columns, similar_cases):
+        with column:
+            if analysis.image_path and os.path.exists(analysis.image_path):
+                st.image(analysis.image_path, use_container_width=True)
+            display_date = analysis.analysis_date.strftime('%Y-%m-%d') if isinstance(analysis.analysis_date, datetime) else (analysis.analysis_date or "Bilinmiyor")
+            st.markdown(f"**{analysis.disease_detected}**")
+            st.caption(f"Benzerlik: {similarity * 100:.0f}% · Güven: {analysis.confidence_score * 100:.0f}% · {display_date}")
@@ -1,123 +1,661 @@
 import sqlite3
 import os
+import sys
+import threading
+from datetime import date, datetime
+from config.settings import HEALTHY_LABELS
 
 DATABASE_NAME = 'data/database.db' # Corrected relative path
 
+# Connection tuning shared by every DatabaseService in the process
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KIB = 16000
+MMAP_SIZE_BYTES = 128 * 1024 * 1024
+
+
+def _convert_timestamp(value: bytes):
+    """Decodes TIMESTAMP columns once, in C, as rows come out of SQLite."""
+    text = value.decode()
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        return text # Leave unexpected values readable instead of failing the whole fetch
+
+
+# Columns declared TIMESTAMP/BOOLEAN come back typed on connections opened with PARSE_DECLTYPES
+sqlite3.register_converter("TIMESTAMP", _convert_timestamp)
+sqlite3.register_converter("BOOLEAN", lambda value: value not in (b"0", b""))
+# Write dates in the same text format CURRENT_TIMESTAMP uses, instead of the deprecated default adapters
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+
+
+class ConnectionManager:
+    """
+    Hands out one SQLite connection per thread for the whole process.
+    Streamlit runs every session in its own thread, so sessions never share a
+    connection object, while WAL mode lets readers proceed alongside a writer.
+    """
+
+    def __init__(self, database_name: str = DATABASE_NAME):
+        self.database_name = database_name
+        self._local = threading.local()
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.database_name, timeout=BUSY_TIMEOUT_MS / 1000, detect_types=sqlite3.PARSE_DECLTYPES)
+        conn.row_factory = sqlite3.Row # Allows accessing columns by name
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL") # Safe with WAL, avoids an fsync per commit
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KIB}")
+        conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE_BYTES}")
+        return conn
+
+    def get_connection(self) -> sqlite3.Connection:
+        """Returns the calling thread's connection, opening it on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+        return conn
+
+    def close_connection(self):
+        """Closes the calling thread's connection if it has one."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+connection_manager = ConnectionManager()
+
+def _migration_1_base_schema(cursor: sqlite3.Cursor):
+    """Creates the original tables and back-fills columns added before versioning existed."""
+    # Users table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            email TEXT UNIQUE,
+            password_hash TEXT,
+            phone TEXT,
+            location TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # Databases created before versioning may predate this column
+    cursor.execute("PRAGMA table_info(users);")
+    columns = [col[1] for col in cursor.fetchall()]
+    if 'receive_email_notifications' not in columns:
+        cursor.execute("ALTER TABLE users ADD COLUMN receive_email_notifications BOOLEAN DEFAULT 1;")
+
+    # Analyses table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS analyses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            image_path TEXT NOT NULL,
+            disease_detected TEXT,
+            confidence_score REAL,
+            analysis_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            gemini_response TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    """)
+
+    # Recommendations table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS recommendations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            analysis_id INTEGER,
+            recommendation_type TEXT NOT NULL,
+            description TEXT NOT NULL,
+            priority INTEGER,
+            implementation_date TEXT,
+            FOREIGN KEY (analysis_id) REFERENCES analyses (id)
+        )
+    """)
+    cursor.execute("PRAGMA table_info(recommendations);")
+    rec_columns = [col[1] for col in cursor.fetchall()]
+    if 'estimated_cost' not in rec_columns:
+        cursor.execute("ALTER TABLE recommendations ADD COLUMN estimated_cost REAL;")
+
+    # Follow-ups table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS follow_ups (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            analysis_id INTEGER,
+            status TEXT,
+            notes TEXT,
+            follow_up_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (analysis_id) REFERENCES analyses (id)
+        )
+    """)
+
+    # Questions table for community forum
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS questions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            question_text TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    """)
+
+    # Answers table for community forum
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS answers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            question_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            answer_text TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (question_id) REFERENCES questions (id),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    """)
+
+
+def _migration_2_cascading_foreign_keys(cursor: sqlite3.Cursor):
+    """
+    Rebuilds the child tables so their rows are removed together with their parent.
+    SQLite cannot alter a foreign key in place, so each table is copied into a new definition.
+    """
+    # Rows whose parent is already gone would violate the new constraints
+    cursor.execute("DELETE FROM recommendations WHERE analysis_id IS NOT NULL AND analysis_id NOT IN (SELECT id FROM analyses)")
+    cursor.execute("DELETE FROM follow_ups WHERE analysis_id IS NOT NULL AND analysis_id NOT IN (SELECT id FROM analyses)")
+    cursor.execute("DELETE FROM answers WHERE question_id NOT IN (SELECT id FROM questions)")
+
+    cursor.execute("""
+        CREATE TABLE recommendations_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            analysis_id INTEGER,
+            recommendation_type TEXT NOT NULL,
+            description TEXT NOT NULL,
+            priority INTEGER,
+            implementation_date TEXT,
+            estimated_cost REAL,
+            FOREIGN KEY (analysis_id) REFERENCES analyses (id) ON DELETE CASCADE
+        )
+    """)
+    cursor.execute("""
+        INSERT INTO recommendations_new (id, analysis_id, recommendation_type, description, priority, implementation_date, estimated_cost)
+        SELECT id, analysis_id, recommendation_type, description, priority, implementation_date, estimated_cost FROM recommendations
+    """)
+
+    cursor.execute("""
+        CREATE TABLE follow_ups_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            analysis_id INTEGER,
+            status TEXT,
+            notes TEXT,
+            follow_up_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (analysis_id) REFERENCES analyses (id) ON DELETE CASCADE
+        )
+    """)
+    cursor.execute("""
+        INSERT INTO follow_ups_new (id, analysis_id, status, notes, follow_up_date)
+        SELECT id, analysis_id, status, notes, follow_up_date FROM follow_ups
+    """)
+
+    cursor.execute("""
+        CREATE TABLE answers_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            question_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            answer_text TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (question_id) REFERENCES questions (id) ON DELETE CASCADE,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    """)
+    cursor.execute("""
+        INSERT INTO answers_new (id, question_id, user_id, answer_text, created_at)
+        SELECT id, question_id, user_id, answer_text, created_at FROM answers
+    """)
+
+    for table in ("recommendations", "follow_ups", "answers"):
+        cursor.execute(f"DROP TABLE {table}")
+        cursor.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+
+def _migration_3_lookup_indexes(cursor: sqlite3.Cursor):
+    """Adds the secondary indexes behind the per-user and per-parent lookups."""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_analyses_user_date ON analyses (user_id, analysis_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_recommendations_analysis ON recommendations (analysis_id, priority)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_follow_ups_analysis ON follow_ups (analysis_id, follow_up_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_questions_created ON questions (created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_answers_question ON answers (question_id, created_at)")
+
+
+def _migration_4_question_activity(cursor: sqlite3.Cursor):
+    """Keeps each question's answer count and last activity time up to date as answers come and go."""
+    cursor.execute("ALTER TABLE questions ADD COLUMN answer_count INTEGER NOT NULL DEFAULT 0")
+    cursor.execute("ALTER TABLE questions ADD COLUMN last_activity_at TIMESTAMP")
+    cursor.execute("""
+        UPDATE questions SET
+            answer_count = (SELECT COUNT(*) FROM answers WHERE answers.question_id = questions.id),
+            last_activity_at = MAX(created_at, COALESCE((SELECT MAX(created_at) FROM answers WHERE answers.question_id = questions.id), created_at))
+    """)
+    cursor.execute("""
+        CREATE TRIGGER trg_questions_activity_insert AFTER INSERT ON questions
+        BEGIN
+            UPDATE questions SET last_activity_at = new.created_at WHERE id = new.id;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER trg_answers_activity_insert AFTER INSERT ON answers
+        BEGIN
+            UPDATE questions
+            SET answer_count = answer_count + 1,
+                last_activity_at = MAX(COALESCE(last_activity_at, created_at), new.created_at)
+            WHERE id = new.question_id;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER trg_answers_activity_delete AFTER DELETE ON answers
+        BEGIN
+            UPDATE questions
+            SET answer_count = answer_count - 1,
+                last_activity_at = MAX(created_at, COALESCE((SELECT MAX(created_at) FROM answers WHERE question_id = old.question_id), created_at))
+            WHERE id = old.question_id;
+        END
+    """)
+
+
+def _migration_5_forum_search(cursor: sqlite3.Cursor):
+    """
+    Adds a full-text index over questions and answers, kept in sync by triggers.
+    Question rows use rowid -question_id and answer rows use rowid answer_id, so every row is found by primary key.
+    unicode61 folds case and most Turkish diacritics (ş, ç, ğ, ö, ü, İ); dotless ı is folded to i explicitly.
+    """
+    cursor.execute("""
+        CREATE VIRTUAL TABLE forum_search USING fts5(
+            title,
+            body,
+            question_id UNINDEXED,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+    """)
+    cursor.execute("""
+        INSERT INTO forum_search (rowid, title, body, question_id)
+        SELECT -id, replace(title, 'ı', 'i'), replace(question_text, 'ı', 'i'), id FROM questions
+    """)
+    cursor.execute("""
+        INSERT INTO forum_search (rowid, title, body, question_id)
+        SELECT id, '', replace(answer_text, 'ı', 'i'), question_id FROM answers
+    """)
+    cursor.execute("""
+        CREATE TRIGGER trg_questions_search_insert AFTER INSERT ON questions
+        BEGIN
+            INSERT INTO forum_search (rowid, title, body, question_id)
+            VALUES (-new.id, replace(new.title, 'ı', 'i'), replace(new.question_text, 'ı', 'i'), new.id);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER trg_questions_search_update AFTER UPDATE OF title, question_text ON questions
+        BEGIN
+            UPDATE forum_search SET title = replace(new.title, 'ı', 'i'), body = replace(new.question_text, 'ı', 'i')
+            WHERE rowid = -new.id;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER trg_questions_search_delete AFTER DELETE ON questions
+        BEGIN
+            DELETE FROM forum_search WHERE rowid = -old.id;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER trg_answers_search_insert AFTER INSERT ON answers
+        BEGIN
+            INSERT INTO forum_search (rowid, title, body, question_id)
+            VALUES (new.id, '', replace(new.answer_text, 'ı', 'i'), new.question_id);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER trg_answers_search_update AFTER UPDATE OF answer_text ON answers
+        BEGIN
+            UPDATE forum_search SET body = replace(new.answer_text, 'ı', 'i') WHERE rowid = new.id;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER trg_answers_search_delete AFTER DELETE ON answers
+        BEGIN
+            DELETE FROM forum_search WHERE rowid = old.id;
+        END
+    """)
+
+
+# Follow-up statuses counted as "Aktif Takipler" on the Dashboard
+ACTIVE_FOLLOW_UP_STATUSES = ('pending', 'in_progress')
+# disease_detected values that do not count as a distinct disease
+NON_DISEASE_LABELS = ('Unknown', *HEALTHY_LABELS)
+
+_ACTIVE_STATUSES_SQL = ", ".join(f"'{status}'" for status in ACTIVE_FOLLOW_UP_STATUSES)
+_NON_DISEASE_SQL = ", ".join(f"'{label}'" for label in NON_DISEASE_LABELS)
+
+
+def _user_stats_add_analysis_sql(ref: str) -> str:
+    """Trigger statements counting the analysis row `ref` ('new' or 'old') into its user's stats."""
+    return f"""
+        INSERT INTO user_stats (user_id, total_analyses) VALUES ({ref}.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET total_analyses = total_analyses + 1;
+        INSERT INTO user_disease_counts (user_id, disease_detected, analysis_count)
+            SELECT {ref}.user_id, {ref}.disease_detected, 1
+            WHERE {ref}.disease_detected IS NOT NULL AND {ref}.disease_detected NOT IN ({_NON_DISEASE_SQL})
+            ON CONFLICT (user_id, disease_detected) DO UPDATE SET analysis_count = analysis_count + 1;
+        UPDATE user_stats
+            SET unique_diseases = (SELECT COUNT(*) FROM user_disease_counts WHERE user_id = {ref}.user_id),
+                active_follow_ups = active_follow_ups + (SELECT COUNT(*) FROM follow_ups WHERE analysis_id = {ref}.id AND status IN ({_ACTIVE_STATUSES_SQL}))
+            WHERE user_id = {ref}.user_id;
+    """
+
+
+def _user_stats_remove_analysis_sql(ref: str) -> str:
+    """Trigger statements taking the analysis row `ref` ('new' or 'old') out of its user's stats."""
+    return f"""
+        UPDATE user_disease_counts SET analysis_count = analysis_count - 1
+            WHERE user_id = {ref}.user_id AND disease_detected = {ref}.disease_detected;
+        DELETE FROM user_disease_counts
+            WHERE user_id = {ref}.user_id AND disease_detected = {ref}.disease_detected AND analysis_count <= 0;
+        UPDATE user_stats
+            SET total_analyses = total_analyses - 1,
+                unique_diseases = (SELECT COUNT(*) FROM user_disease_counts WHERE user_id = {ref}.user_id),
+                active_follow_ups = active_follow_ups - (SELECT COUNT(*) FROM follow_ups WHERE analysis_id = {ref}.id AND status IN ({_ACTIVE_STATUSES_SQL}))
+            WHERE user_id = {ref}.user_id;
+    """
+
+
+def _follow_up_delta_sql(ref: str, sign: str) -> str:
+    """Trigger statement adding (sign '+') or removing (sign '-') the follow-up row `ref` from the active count."""
+    return f"""
+        UPDATE user_stats SET active_follow_ups = active_follow_ups {sign} 1
+            WHERE {ref}.status IN ({_ACTIVE_STATUSES_SQL})
+            AND user_id = (SELECT user_id FROM analyses WHERE id = {ref}.analysis_id);
+    """
+
+
+def rebuild_user_stats(cursor: sqlite3.Cursor) -> int:
+    """
+    Recomputes user_stats and user_disease_counts from the base tables.
+    Returns how many users had stored stats that differed from the recomputed ones (0 means consistent).
+    The caller owns the transaction.
+    """
+    fresh_stats_query = f"""
+        SELECT a.user_id,
+               COUNT(*) AS total_analyses,
+               COUNT(DISTINCT CASE WHEN a.disease_detected NOT IN ({_NON_DISEASE_SQL}) THEN a.disease_detected END) AS unique_diseases,
+               COALESCE(SUM(fu.active_count), 0) AS active_follow_ups
+        FROM analyses a
+        LEFT JOIN (
+            SELECT analysis_id, COUNT(*) AS active_count FROM follow_ups
+            WHERE status IN ({_ACTIVE_STATUSES_SQL}) GROUP BY analysis_id
+        ) fu ON fu.analysis_id = a.id
+        WHERE a.user_id IS NOT NULL
+        GROUP BY a.user_id
+    """
+    stored_stats_query = """
+        SELECT user_id, total_analyses, unique_diseases, active_follow_ups FROM user_stats
+        WHERE total_analyses != 0 OR unique_diseases != 0 OR active_follow_ups != 0
+    """
+    cursor.execute(f"""
+        SELECT COUNT(*) FROM (
+            SELECT user_id FROM ({fresh_stats_query} EXCEPT {stored_stats_query})
+            UNION
+            SELECT user_id FROM ({stored_stats_query} EXCEPT {fresh_stats_query})
+        )
+    """)
+    drifted = cursor.fetchone()[0]
+
+    cursor.execute("DELETE FROM user_disease_counts")
+    cursor.execute(f"""
+        INSERT INTO user_disease_counts (user_id, disease_detected, analysis_count)
+        SELECT user_id, disease_detected, COUNT(*) FROM analyses
+        WHERE user_id IS NOT NULL AND disease_detected IS NOT NULL AND disease_detected NOT IN ({_NON_DISEASE_SQL})
+        GROUP BY user_id, disease_detected
+    """)
+    cursor.execute("DELETE FROM user_stats")
+    cursor.execute(f"INSERT INTO user_stats (user_id, total_analyses, unique_diseases, active_follow_ups) {fresh_stats_query}")
+    return drifted
+
+
+def _migration_6_user_stats(cursor: sqlite3.Cursor):
+    """Adds per-user Dashboard counters that triggers keep current on every write."""
+    cursor.execute("""
+        CREATE TABLE user_stats (
+            user_id INTEGER PRIMARY KEY,
+            total_analyses INTEGER NOT NULL DEFAULT 0,
+            unique_diseases INTEGER NOT NULL DEFAULT 0,
+            active_follow_ups INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE user_disease_counts (
+            user_id INTEGER NOT NULL,
+            disease_detected TEXT NOT NULL,
+            analysis_count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, disease_detected)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER trg_analyses_stats_insert AFTER INSERT ON analyses WHEN new.user_id IS NOT NULL
+        BEGIN
+            {_user_stats_add_analysis_sql('new')}
+        END
+    """)
+    # BEFORE DELETE: cascaded follow-up deletes run after the analysis row is gone and can no longer find its user
+    cursor.execute(f"""
+        CREATE TRIGGER trg_analyses_stats_delete BEFORE DELETE ON analyses WHEN old.user_id IS NOT NULL
+        BEGIN
+            {_user_stats_remove_analysis_sql('old')}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER trg_analyses_stats_update_old AFTER UPDATE OF user_id, disease_detected ON analyses WHEN old.user_id IS NOT NULL
+        BEGIN
+            {_user_stats_remove_analysis_sql('old')}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER trg_analyses_stats_update_new AFTER UPDATE OF user_id, disease_detected ON analyses WHEN new.user_id IS NOT NULL
+        BEGIN
+            {_user_stats_add_analysis_sql('new')}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER trg_follow_ups_stats_insert AFTER INSERT ON follow_ups
+        BEGIN
+            {_follow_up_delta_sql('new', '+')}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER trg_follow_ups_stats_delete AFTER DELETE ON follow_ups
+        BEGIN
+            {_follow_up_delta_sql('old', '-')}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER trg_follow_ups_stats_update AFTER UPDATE OF status, analysis_id ON follow_ups
+        BEGIN
+            {_follow_up_delta_sql('old', '-')}
+            {_follow_up_delta_sql('new', '+')}
+        END
+    """)
+    rebuild_user_stats(cursor)
+
+
+def _migration_7_daily_disease_rollup(cursor: sqlite3.Cursor):
+    """Adds per-user daily analysis counts by disease, kept current by triggers, for the Dashboard trend charts."""
+    cursor.execute("""
+        CREATE TABLE analysis_daily (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            disease_detected TEXT NOT NULL,
+            analysis_count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, day, disease_detected)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        INSERT INTO analysis_daily (user_id, day, disease_detected, analysis_count)
+        SELECT user_id, date(analysis_date), COALESCE(disease_detected, 'Unknown'), COUNT(*) FROM analyses
+        WHERE user_id IS NOT NULL
+        GROUP BY user_id, date(analysis_date), COALESCE(disease_detected, 'Unknown')
+    """)
+    add_sql = """
+        INSERT INTO analysis_daily (user_id, day, disease_detected, analysis_count)
+            VALUES (new.user_id, date(new.analysis_date), COALESCE(new.disease_detected, 'Unknown'), 1)
+            ON CONFLICT (user_id, day, disease_detected) DO UPDATE SET analysis_count = analysis_count + 1;
+    """
+    remove_sql = """
+        UPDATE analysis_daily SET analysis_count = analysis_count - 1
+            WHERE user_id = old.user_id AND day = date(old.analysis_date) AND disease_detected = COALESCE(old.disease_detected, 'Unknown');
+        DELETE FROM analysis_daily
+            WHERE user_id = old.user_id AND day = date(old.analysis_date) AND disease_detected = COALESCE(old.disease_detected, 'Unknown')
+            AND analysis_count <= 0;
+    """
+    cursor.execute(f"CREATE TRIGGER trg_analyses_daily_insert AFTER INSERT ON analyses WHEN new.user_id IS NOT NULL BEGIN {add_sql} END")
+    cursor.execute(f"CREATE TRIGGER trg_analyses_daily_delete AFTER DELETE ON analyses WHEN old.user_id IS NOT NULL BEGIN {remove_sql} END")
+    cursor.execute(f"CREATE TRIGGER trg_analyses_daily_update_old AFTER UPDATE OF user_id, disease_detected, analysis_date ON analyses WHEN old.user_id IS NOT NULL BEGIN {remove_sql} END")
+    cursor.execute(f"CREATE TRIGGER trg_analyses_daily_update_new AFTER UPDATE OF user_id, disease_detected, analysis_date ON analyses WHEN new.user_id IS NOT NULL BEGIN {add_sql} END")
+
+
+def _migration_8_image_path_index(cursor: sqlite3.Cursor):
+    """Lets the content-addressed image store count references to a file without scanning analyses."""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_analyses_image_path ON analyses (image_path)")
+
+
+def _migration_9_gemini_response_cache(cursor: sqlite3.Cursor):
+    """Adds the persistent cache of Gemini image analyses used by services.response_cache."""
+    cursor.execute("""
+        CREATE TABLE gemini_response_cache (
+            image_digest TEXT NOT NULL,
+            prompt_version TEXT NOT NULL,
+            model_name TEXT NOT NULL,
+            raw_response TEXT NOT NULL,
+            parsed_result TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_hit_at TIMESTAMP,
+            hit_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (image_digest, prompt_version, model_name)
+        )
+    """)
+    cursor.execute("CREATE INDEX idx_gemini_cache_created ON gemini_response_cache (created_at)")
+    cursor.execute("CREATE INDEX idx_gemini_cache_recency ON gemini_response_cache (COALESCE(last_hit_at, created_at))")
+
+
+def _migration_10_analysis_images(cursor: sqlite3.Cursor):
+    """
+    Links an analysis to every photo it was made from (e.g. leaf top, underside and cluster of one vine).
+    analyses.image_path keeps the first photo, so single-image views are unchanged; existing analyses get a position 0 row.
+    """
+    cursor.execute("""
+        CREATE TABLE analysis_images (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            analysis_id INTEGER NOT NULL,
+            image_path TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            FOREIGN KEY (analysis_id) REFERENCES analyses (id) ON DELETE CASCADE,
+            UNIQUE (analysis_id, position)
+        )
+    """)
+    cursor.execute("CREATE INDEX idx_analysis_images_image_path ON analysis_images (image_path)")
+    cursor.execute("""
+        INSERT INTO analysis_images (analysis_id, image_path, position)
+        SELECT id, image_path, 0 FROM analyses WHERE image_path IS NOT NULL
+    """)
+
+
+def _migration_11_healthy_label_stats(cursor: sqlite3.Cursor):
+    """
+    Stops counting 'Sağlıklı' (the label Gemini actually uses for healthy plants) as a disease in user_disease_counts.
+    The triggers that add analyses embed the label list, so they are recreated before the rollups are rebuilt.
+    analysis_daily keeps every label; the trend query filters NON_DISEASE_LABELS when reading.
+    """
+    cursor.execute("DROP TRIGGER IF EXISTS trg_analyses_stats_insert")
+    cursor.execute("DROP TRIGGER IF EXISTS trg_analyses_stats_update_new")
+    cursor.execute(f"""
+        CREATE TRIGGER trg_analyses_stats_insert AFTER INSERT ON analyses WHEN new.user_id IS NOT NULL
+        BEGIN
+            {_user_stats_add_analysis_sql('new')}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER trg_analyses_stats_update_new AFTER UPDATE OF user_id, disease_detected ON analyses WHEN new.user_id IS NOT NULL
+        BEGIN
+            {_user_stats_add_analysis_sql('new')}
+        END
+    """)
+    rebuild_user_stats(cursor)
+
+
+# Applied in order; a database at PRAGMA user_version N has run the first N entries.
+# Never edit a released migration, append a new one instead.
+MIGRATIONS = [
+    _migration_1_base_schema,
+    _migration_2_cascading_foreign_keys,
+    _migration_3_lookup_indexes,
+    _migration_4_question_activity,
+    _migration_5_forum_search,
+    _migration_6_user_stats,
+    _migration_7_daily_disease_rollup,
+    _migration_8_image_path_index,
+    _migration_9_gemini_response_cache,
+    _migration_10_analysis_images,
+    _migration_11_healthy_label_stats,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
 def init_db():
-    """Initializes the SQLite database and creates tables if they don't exist."""
+    """Brings the SQLite database up to SCHEMA_VERSION, doing nothing if it is already current."""
     conn = None
     try:
-        conn = sqlite3.connect(DATABASE_NAME)
+        conn = sqlite3.connect(DATABASE_NAME, timeout=BUSY_TIMEOUT_MS / 1000)
+        conn.isolation_level = None # Transactions are managed explicitly below
         cursor = conn.cursor()
 
-        # Users table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                email TEXT UNIQUE,
-                password_hash TEXT,
-                phone TEXT,
-                location TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        # Add new columns if they don't exist using PRAGMA to check existence
-        cursor.execute("PRAGMA table_info(users);")
-        columns = [col[1] for col in cursor.fetchall()]
-        if 'receive_email_notifications' not in columns:
-            cursor.execute("ALTER TABLE users ADD COLUMN receive_email_notifications BOOLEAN DEFAULT 1;")
-            print("Database: Added 'receive_email_notifications' to users table.")
-
-        print("Database: users table checked/created.")
-
-        # Analyses table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS analyses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                image_path TEXT NOT NULL,
-                disease_detected TEXT,
-                confidence_score REAL,
-                analysis_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                gemini_response TEXT,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        """)
-        print("Database: analyses table checked/created.")
-
-        # Recommendations table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS recommendations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                analysis_id INTEGER,
-                recommendation_type TEXT NOT NULL,
-                description TEXT NOT NULL,
-                priority INTEGER,
-                implementation_date TEXT,
-                FOREIGN KEY (analysis_id) REFERENCES analyses (id)
-            )
-        """)
-        cursor.execute("PRAGMA table_info(recommendations);")
-        rec_columns = [col[1] for col in cursor.fetchall()]
-        if 'estimated_cost' not in rec_columns:
-            cursor.execute("ALTER TABLE recommendations ADD COLUMN estimated_cost REAL;")
-            print("Database: Added 'estimated_cost' to recommendations table.")
-
-        print("Database: recommendations table checked/created.")
-
-        # Follow-ups table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS follow_ups (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                analysis_id INTEGER,
-                status TEXT,
-                notes TEXT,
-                follow_up_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (analysis_id) REFERENCES analyses (id)
-            )
-        """)
-        print("Database: follow_ups table checked/created.")
-
-        # Questions table for community forum
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS questions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                title TEXT NOT NULL,
-                question_text TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        """)
-        print("Database: questions table checked/created.")
-
-        # Answers table for community forum
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS answers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                question_id INTEGER NOT NULL,
-                user_id INTEGER NOT NULL,
-                answer_text TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (question_id) REFERENCES questions (id),
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        """)
-        print("Database: answers table checked/created.")
-
-        conn.commit()
-        print(f"Database '{DATABASE_NAME}' initialization process completed.")
+        current_version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        if current_version >= SCHEMA_VERSION:
+            return
+
+        # Table rebuilds must not trigger cascades; this can only be toggled outside a transaction
+        cursor.execute("PRAGMA foreign_keys = OFF")
+        for version in range(current_version + 1, SCHEMA_VERSION + 1):
+            migration = MIGRATIONS[version - 1]
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                # Another process may have migrated while we waited for the write lock
+                if cursor.execute("PRAGMA user_version").fetchone()[0] >= version:
+                    cursor.execute("ROLLBACK")
+                    continue
+                migration(cursor)
+                cursor.execute(f"PRAGMA user_version = {version}")
+                cursor.execute("COMMIT")
+            except sqlite3.Error:
+                cursor.execute("ROLLBACK")
+                raise
+            print(f"Database: applied migration {version} ({migration.__name__}).")
     except sqlite3.Error as e:
         print(f"Database Error during initialization: {e}")
     finally:
         if conn:
             conn.close()
-            print("Database connection closed.")
 
 if __name__ == '__main__':
     # Ensure the data directory exists
     os.makedirs(os.path.dirname(DATABASE_NAME), exist_ok=True)
     init_db()
+    if '--rebuild-stats' in sys.argv:
+        # Consistency check: recompute the Dashboard rollups and report drift
+        conn = sqlite3.connect(DATABASE_NAME, timeout=BUSY_TIMEOUT_MS / 1000)
+        try:
+            with conn:
+                drifted_users = rebuild_user_stats(conn.cursor())
+        finally:
+            conn.close()
+        print(f"Database: user stats rebuilt, {drifted_users} user(s) had drifted.")
     print(f"Database '{DATABASE_NAME}' script finished execution.")
-
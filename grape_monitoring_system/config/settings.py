@@ -10,6 +10,55 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 APP_TITLE = "Üzüm Takip Destek Öneri Sistemi"
 APP_ICON = "🍇"
 
+# Diagnosis labels
+HEALTHY_LABELS = ('Sağlıklı', 'Healthy') # Labels Gemini uses for a plant without disease (the prompt asks for 'Sağlıklı')
+
+# Pagination
+HISTORY_PAGE_SIZE = 20 # Analyses per page on the History page
+DASHBOARD_RECENT_ANALYSES = 5 # Analyses listed under "Son Analizler"
+FORUM_PAGE_SIZE = 15 # Questions per page in the community forum
+
+# Gemini response cache (repeat analyses of the same image skip the API call)
+GEMINI_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60 # Entries older than a week are treated as missing
+GEMINI_CACHE_MAX_ENTRIES = 5000 # Least recently used entries beyond this are evicted
+GEMINI_CACHE_HIT_FLUSH_SIZE = 20 # Cache hits buffered in memory before their counts and recency are written
+
+# Multi-image and batch analysis
+MAX_IMAGES_PER_ANALYSIS = 4 # Photos of one plant sent together in a single Gemini request
+MAX_BATCH_IMAGES = 200 # Photos accepted in one batch upload, each analyzed separately
+BATCH_ANALYSIS_WORKERS = 4 # Photos analyzed concurrently in batch mode (bounded by Gemini rate limits)
+PIPELINE_STAGE_WORKERS = 3 * BATCH_ANALYSIS_WORKERS # Weather, image saving and similar-case tasks overlapping the vision calls
+
+# Similar past cases (image feature index kept next to the uploads)
+SIMILARITY_INDEX_DIR = "grape_monitoring_system/data/similarity"
+SIMILAR_CASES_COUNT = 4 # Similar analyses shown after a new analysis
+
+# Upload limits (checked from the file header before any pixels are decoded)
+MAX_UPLOAD_BYTES = 20 * 1024 * 1024 # Larger files are rejected outright
+MAX_IMAGE_PIXELS = 40_000_000 # Width x height ceiling; a 12MP phone photo is ~12M pixels
+UPLOAD_PREVIEW_SIZE = 480 # Longest side of the upload previews; well under the page width, so Streamlit never rescales them
+
+# Local quality gate (photos failing it are not sent to Gemini)
+QUALITY_CHECK_SIZE = 256 # Longest side of the downscaled copy the checks run on
+MIN_SHARPNESS = 40.0 # Laplacian variance below this is treated as blurry
+MIN_MEAN_BRIGHTNESS = 40 # Mean grey level (0-255) below this is underexposed
+MAX_MEAN_BRIGHTNESS = 225 # Mean grey level above this is overexposed
+MAX_CLIPPED_FRACTION = 0.5 # Share of near-black or near-white pixels tolerated
+MIN_VEGETATION_RATIO = 0.05 # Share of green/yellow leaf pixels required
+
+# Tiled high-resolution analysis
+TILE_SIZE = 1024 # Side of the full-resolution crops sent to Gemini
+TILE_OVERLAP = 128 # Overlap between neighbouring tiles, so lesions on a tile edge are seen whole
+MAX_ANALYSIS_TILES = 6 # Most lesion-like tiles analyzed per photo
+MIN_TILE_SCORE = 0.0005 # Tiles with a smaller share of lesion pixels are skipped (the best tile is always kept)
+TILE_ANALYSIS_WORKERS = 4 # Concurrent Gemini requests per tiled analysis
+
+# Upload encoding (images sent to Gemini are re-encoded to fit a byte budget)
+GEMINI_UPLOAD_TARGET_BYTES = 200 * 1024 # Upper bound for the JPEG payload of one image
+GEMINI_UPLOAD_MIN_SIDE = 640 # Never shrink the shorter side below this to meet the budget
+JPEG_MIN_QUALITY = 40 # Lowest quality the budget search may pick
+JPEG_MAX_QUALITY = 90 # Quality used when the image already fits the budget
+
 # --- External API Keys ---
 OPENWEATHER_API_KEY = "your_openweather_api_key_here" # Get your key from https://openweathermap.org/api"
 
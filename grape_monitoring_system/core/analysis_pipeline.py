@@ -0,0 +1,264 @@
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, Optional
+from core.disease_analyzer import DiseaseAnalyzer
+from core.recommendation_engine import RecommendationEngine
+from services.database_service import DatabaseService
+from services.image_service import ImageService
+from services.similarity_index import SimilarityIndex
+from models.analysis import Analysis
+from models.recommendation import Recommendation
+from config.settings import GEMINI_UPLOAD_TARGET_BYTES, SIMILAR_CASES_COUNT, BATCH_ANALYSIS_WORKERS, PIPELINE_STAGE_WORKERS
+
+
+@dataclass(slots=True)
+class AnalysisOutcome:
+    """Result of running one set of photos through the pipeline; exactly one of analysis, quality_issues or error is set."""
+    image_name: str
+    analysis: Optional[Analysis] = None
+    recommendations: list[Recommendation] = field(default_factory=list)
+    raw_recommendation_response: Optional[str] = None
+    similar_cases: list[tuple[Analysis, float]] = field(default_factory=list)
+    quality_issues: list[str] = field(default_factory=list)
+    error: Optional[str] = None
+    timings: dict = field(default_factory=dict) # Foreground stage name -> milliseconds, plus 'total'; frozen when run() returns
+    persistence: Optional[Future] = None # Resolves to True once the analysis is stored
+    persist_ms: Optional[float] = None # Set by the background save
+
+    def wait_persisted(self) -> bool:
+        """Blocks until the background save finishes. On failure the analysis is dropped and error is set."""
+        if self.persistence is None:
+            return self.analysis is not None
+        try:
+            persisted = self.persistence.result()
+        except Exception as e:
+            # _persist handles its own errors; this only guards the promise that outcomes never raise
+            print(f"Error persisting {self.image_name}: {e}")
+            persisted = False
+        if persisted:
+            return True
+        self.analysis = None
+        self.error = self.error or "Analiz veritabanına kaydedilemedi."
+        return False
+
+    def sequential_ms(self) -> float:
+        """What the foreground stages would have taken back to back, i.e. the latency of a fully serial flow."""
+        return sum(ms for stage, ms in self.timings.items() if stage != 'total')
+
+
+class AnalysisPipeline:
+    """
+    Runs photos of one plant from upload to stored analysis: preprocessing, quality gate and diagnosis,
+    image storage, recommendations, persistence and the similar-case lookup.
+    Stages that do not depend on each other overlap: the weather fetch, image storage and similar-case
+    query run while Gemini looks at the photos, and the database write happens after the result is returned.
+    Safe to call from several threads at once; every service it uses is thread-safe.
+    """
+
+    def __init__(self, disease_analyzer: DiseaseAnalyzer, recommendation_engine: RecommendationEngine,
+                 image_service: ImageService, db_service: DatabaseService, similarity_index: Optional[SimilarityIndex] = None):
+        self.disease_analyzer = disease_analyzer
+        self.recommendation_engine = recommendation_engine
+        self.image_service = image_service
+        self.db_service = db_service
+        self.similarity_index = similarity_index
+        # Stage tasks never submit further work to these pools, so they cannot deadlock on each other
+        self._stage_executor = ThreadPoolExecutor(max_workers=PIPELINE_STAGE_WORKERS, thread_name_prefix="analysis-stage")
+        self._persistence_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="analysis-persist")
+        # Stage threads may still report timings after run() has returned (e.g. the weather fetch after a rejection)
+        self._timings_lock = threading.Lock()
+        # Stored images still needed by an analysis in flight, path -> number of analyses using it; guarded by _images_lock
+        self._pending_images = {}
+        self._images_lock = threading.Lock()
+
+    def _timed(self, timings: dict, stage: str, function, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            with self._timings_lock:
+                timings[stage] = (time.perf_counter() - start) * 1000
+
+    def run(self, user_id: int, images: list[tuple[bytes, str]], skip_quality_check: bool = False, tiled: bool = False, fused: bool = False,
+            on_recommendation: Optional[Callable[[Recommendation], None]] = None) -> AnalysisOutcome:
+        """
+        Analyzes images (pairs of image_data and image_name) as one analysis.
+        With fused=True the diagnosis and recommendations come from a single Gemini request (ignored in tiled mode).
+        on_recommendation is called on the calling thread with each recommendation as it streams in, so a UI can show it right away.
+        Returns as soon as the diagnosis and recommendations are ready; call wait_persisted() on the outcome
+        before relying on the stored rows. Never raises: failures are reported in the outcome's error so one
+        bad photo cannot stop a batch.
+        """
+        outcome = AnalysisOutcome(image_name=", ".join(image_name for _, image_name in images))
+        timings = {}
+        start = time.perf_counter()
+        saved_paths_future = None
+        try:
+            # Weather does not depend on the photo at all, so it is fetched from the very start
+            weather_future = self._stage_executor.submit(self._timed, timings, 'weather', self.recommendation_engine.fetch_weather_info)
+
+            # Single decode/resize/encode pass per photo; the metadata carries the digest of the JPEG bytes
+            # and the decoded image, which the quality gate and the similarity features reuse
+            processed_images = self._timed(timings, 'preprocess', lambda: [
+                self.image_service.preprocess_image(image_data, max_size=(1024, 1024), target_bytes=GEMINI_UPLOAD_TARGET_BYTES)
+                for image_data, _ in images
+            ])
+            decoded_images = [image_metadata["image"] for _, image_metadata in processed_images]
+            # Stored under their content hash, so re-uploading the same photo reuses the existing file
+            saved_paths_future = self._stage_executor.submit(self._timed, timings, 'save_images', self._store_images, [
+                (processed, image_metadata["digest"]) for processed, image_metadata in processed_images
+            ])
+            similar_future = None
+            if self.similarity_index is not None:
+                similar_future = self._stage_executor.submit(self._timed, timings, 'similar_cases', self._find_similar_cases, decoded_images[0])
+
+            use_tiles = tiled and len(images) == 1
+            if use_tiles:
+                # Tiles are cut from the original upload, not the downscaled copy
+                analysis_result, raw_analysis_response = self._timed(timings, 'vision', self.disease_analyzer.analyze_grape_image_tiled, images[0][0], skip_quality_check=skip_quality_check, decoded_image=decoded_images[0])
+            elif fused:
+                # One request for diagnosis and recommendations; the prompt needs the weather up front
+                analysis_result, raw_analysis_response = self._timed(
+                    timings, 'vision', self.disease_analyzer.analyze_grape_images_fused,
+                    [processed for processed, _ in processed_images], weather_future.result(), skip_quality_check=skip_quality_check,
+                    decoded_images=decoded_images
+                )
+            else:
+                # All photos of the plant go to Gemini in one request
+                analysis_result, raw_analysis_response = self._timed(timings, 'vision', self.disease_analyzer.analyze_grape_images, [processed for processed, _ in processed_images], skip_quality_check=skip_quality_check, decoded_images=decoded_images)
+            if analysis_result.get('quality_issues'):
+                # Rejected locally; the speculatively stored photos are dropped again
+                outcome.quality_issues = analysis_result['quality_issues']
+                self._finish_images(saved_paths_future.result(), release=True)
+                return outcome
+
+            analysis = Analysis(
+                user_id=user_id,
+                image_path=None, # Filled in once the concurrent save has finished
+                disease_detected=str(analysis_result.get('disease_detected', "Unknown")),
+                confidence_score=float(analysis_result.get('confidence_score', 0.0)),
+                gemini_response=raw_analysis_response
+            )
+            if fused and not use_tiles and isinstance(analysis_result.get('recommendations'), list) and analysis_result['recommendations']:
+                recommendations = self.recommendation_engine.recommendations_from_items(analysis, analysis_result['recommendations'])
+                raw_recommendation_response = raw_analysis_response
+            else:
+                # Also the retry for a fused answer whose recommendations field was unusable
+                recommendations, raw_recommendation_response = self._timed(timings, 'recommendations', self.recommendation_engine.generate_recommendations, analysis, weather_info=weather_future.result(), on_recommendation=on_recommendation)
+            saved_images = saved_paths_future.result()
+            saved_image_paths = [image_path for image_path, _ in saved_images]
+            analysis.image_path = saved_image_paths[0]
+
+            outcome.analysis = analysis
+            outcome.recommendations = recommendations
+            outcome.raw_recommendation_response = raw_recommendation_response
+            if similar_future is not None:
+                outcome.similar_cases = similar_future.result()
+            # The caller can show the result while the transaction commits
+            outcome.persistence = self._persistence_executor.submit(self._persist, outcome, recommendations, saved_images, decoded_images[0])
+        except Exception as e:
+            print(f"Error analyzing {outcome.image_name}: {e}")
+            outcome.analysis = None
+            outcome.error = str(e)
+            if saved_paths_future is not None and saved_paths_future.exception() is None:
+                self._finish_images(saved_paths_future.result(), release=True)
+        finally:
+            with self._timings_lock:
+                timings['total'] = (time.perf_counter() - start) * 1000
+                # Stages still running now were not waited for and are left out
+                outcome.timings = dict(timings)
+            print(f"Analysis pipeline for {outcome.image_name}: {outcome.timings['total']:.0f} ms (stages back to back: {outcome.sequential_ms():.0f} ms) {outcome.timings}")
+        return outcome
+
+    def _persist(self, outcome: AnalysisOutcome, recommendations: list[Recommendation], saved_images: list[tuple[str, bool]], image) -> bool:
+        start = time.perf_counter()
+        analysis = outcome.analysis
+        saved = False
+        try:
+            # Analysis and recommendations are written in one transaction
+            saved_ids = self.db_service.save_analysis_bundle(analysis, recommendations, image_paths=[image_path for image_path, _ in saved_images])
+            saved = saved_ids is not None
+            if saved and self.similarity_index is not None:
+                try:
+                    self.similarity_index.add(saved_ids["analysis_id"], image)
+                except Exception as e:
+                    # The analysis is stored; it is only missing from similar-case suggestions until the next rebuild
+                    print(f"Warning: Could not add analysis {saved_ids['analysis_id']} to the similarity index: {e}")
+            return saved
+        except Exception as e:
+            print(f"Error persisting {outcome.image_name}: {e}")
+            outcome.error = f"Analiz veritabanına kaydedilemedi: {e}"
+            return False
+        finally:
+            self._finish_images(saved_images, release=not saved)
+            outcome.persist_ms = (time.perf_counter() - start) * 1000
+
+    def _store_images(self, images: list[tuple[bytes, str]]) -> list[tuple[str, bool]]:
+        """
+        Stores (image_data, digest) pairs and marks them as in use until _finish_images.
+        Returns (image_path, created) pairs; created is False when the file was already in the store.
+        """
+        # Writing happens outside the lock, so one slow disk write does not hold up every other analysis
+        saved_images = [self.image_service.store_image(image_data, "analysis.jpg", digest=digest) for image_data, digest in images]
+        with self._images_lock:
+            for index, ((image_path, created), (image_data, digest)) in enumerate(zip(saved_images, images)):
+                if not os.path.exists(image_path):
+                    # Another analysis released the file after we stored or found it; once marked in use it cannot go again
+                    image_path, rewritten = self.image_service.store_image(image_data, "analysis.jpg", digest=digest)
+                    saved_images[index] = (image_path, created or rewritten)
+                self._pending_images[image_path] = self._pending_images.get(image_path, 0) + 1
+        return saved_images
+
+    def _finish_images(self, saved_images: list[tuple[str, bool]], release: bool):
+        """
+        Marks stored images as no longer in use by this analysis. With release=True, files this analysis created
+        are deleted again unless another analysis in flight uses them or a stored analysis references them.
+        """
+        with self._images_lock:
+            for image_path, created in saved_images:
+                remaining = self._pending_images.get(image_path, 1) - 1
+                if remaining > 0:
+                    self._pending_images[image_path] = remaining
+                    continue
+                self._pending_images.pop(image_path, None)
+                if not (release and created):
+                    continue
+                try:
+                    self.image_service.release_image(image_path, self.db_service.count_image_references(image_path))
+                except Exception as e:
+                    # Leaving an unreferenced file behind is harmless; deleting a referenced one is not
+                    print(f"Warning: Could not release image {image_path}: {e}")
+
+    def _find_similar_cases(self, image) -> list[tuple[Analysis, float]]:
+        # Runs before the new analysis is indexed, so it cannot match itself
+        similar = self.similarity_index.query(image, k=SIMILAR_CASES_COUNT * 2)
+        similarity_by_id = dict(similar)
+        similar_analyses = self.db_service.get_analyses_by_ids([similar_id for similar_id, _ in similar])[:SIMILAR_CASES_COUNT]
+        return [(a, similarity_by_id[a.id]) for a in similar_analyses]
+
+
+class BatchAnalyzer:
+    """
+    Analyzes many photos, each as its own analysis, on a bounded thread pool.
+    Results are yielded as soon as each photo finishes, so the caller can show progress live.
+    """
+
+    def __init__(self, pipeline: AnalysisPipeline, max_workers: int = BATCH_ANALYSIS_WORKERS):
+        self.pipeline = pipeline
+        self.max_workers = max_workers
+
+    def _run_one(self, user_id: int, image: tuple[bytes, str], skip_quality_check: bool, fused: bool) -> AnalysisOutcome:
+        outcome = self.pipeline.run(user_id, [image], skip_quality_check, fused=fused)
+        # A batch row only counts as done once it is stored
+        outcome.wait_persisted()
+        return outcome
+
+    def run(self, user_id: int, images: list[tuple[bytes, str]], skip_quality_check: bool = False, fused: bool = False) -> Iterator[AnalysisOutcome]:
+        """Yields one AnalysisOutcome per photo, in completion order."""
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self._run_one, user_id, image, skip_quality_check, fused) for image in images]
+            for future in as_completed(futures):
+                yield future.result()
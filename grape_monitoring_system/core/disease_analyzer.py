@@ -1,17 +1,44 @@
-from core.gemini_client import GeminiClient
+from core.gemini_client import get_gemini_client
+from services.response_cache import ResponseCache
+from utils.image_quality import assess_image_quality
+from utils.image_tiles import select_candidate_tiles
+from config.settings import TILE_ANALYSIS_WORKERS, HEALTHY_LABELS
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from core.response_parser import diagnosis_schema, parse_diagnosis
+import hashlib
 import json
 from typing import Optional
-import re # Added for regex extraction
+
+# Bump whenever the analysis prompt below changes, so cached answers to the old prompt are not reused
+ANALYSIS_PROMPT_VERSION = "2"
+MULTI_IMAGE_PROMPT_VERSION = "multi-2"
+FUSED_PROMPT_VERSION = "fused-2"
 
 class DiseaseAnalyzer:
     def __init__(self):
-        self.gemini_client = GeminiClient()
+        self.gemini_client = get_gemini_client()
+        self.response_cache = ResponseCache()
 
-    def analyze_grape_image(self, image_data: bytes) -> Optional[dict]:
+    def analyze_grape_image(self, image_data: bytes, skip_quality_check: bool = False, decoded_image=None) -> Optional[dict]:
         """
         Analyzes a grape image for diseases using the Gemini API.
         Returns a dictionary with disease detection results and confidence score.
+        Results for identical image bytes are served from the persistent response cache.
+        Photos failing the local quality gate are not sent; the result then carries
+        'quality_issues' (Turkish feedback) and the raw response is None. Pass decoded_image, the PIL image
+        the bytes were encoded from, to let the gate skip decoding them again.
         """
+        image_digest = hashlib.sha256(image_data).hexdigest()
+        cached = self.response_cache.get(image_digest, ANALYSIS_PROMPT_VERSION, self.gemini_client.vision_model_name)
+        if cached is not None:
+            return cached
+
+        if not skip_quality_check:
+            rejection = self._quality_rejection([image_data], None if decoded_image is None else [decoded_image])
+            if rejection is not None:
+                return rejection, None
+
         json_example = {
             "disease_detected": "Powdery Mildew",
             "confidence_score": 0.95,
@@ -28,39 +55,215 @@ class DiseaseAnalyzer:
             f"YANITINIZ SADECE JSON NESNESİ OLMALIDIR. BAŞKA HİÇBİR METİN VEYA MARKDOWN KOD BLOĞU İŞARETİ KULLANMAYIN. Örnek: {json_example_str}"
         )
 
-        gemini_response = self.gemini_client.analyze_image(image_data, prompt)
-        analysis_result = {"disease_detected": "Unknown", "confidence_score": 0.0, "explanation": "Failed to get response from AI."} # Default in case of no response
+        gemini_response = self.gemini_client.analyze_image(image_data, prompt, response_schema=diagnosis_schema())
+        analysis_result, parsed_ok = self._parse_analysis_response(gemini_response, [image_data])
+        # Only well-formed answers are worth replaying; failures should be retried against the API
+        if parsed_ok:
+            self.response_cache.put(image_digest, ANALYSIS_PROMPT_VERSION, self.gemini_client.vision_model_name, analysis_result, gemini_response)
+        return analysis_result, gemini_response # Always return raw response
+
+    def _quality_rejection(self, images: list[bytes], decoded_images: Optional[list] = None) -> Optional[dict]:
+        """
+        Runs the local quality gate on every photo, on decoded_images instead of the bytes when given.
+        Returns the rejected result (with 'quality_issues') if any photo fails, or None if all of them
+        can be sent. Issues are prefixed with the photo number when there is more than one photo.
+        """
+        issues = []
+        for number, image_data in enumerate(decoded_images or images, start=1):
+            quality = assess_image_quality(image_data)
+            if quality["issues"]:
+                print(f"Debugging: Image {number} rejected by quality gate: {quality}")
+                prefix = f"Fotoğraf {number}: " if len(images) > 1 else ""
+                issues.extend(prefix + issue for issue in quality["issues"])
+        if not issues:
+            return None
+        return {
+            "disease_detected": "Unknown",
+            "confidence_score": 0.0,
+            "explanation": " ".join(issues),
+            "quality_issues": issues
+        }
+
+    def _parse_analysis_response(self, gemini_response: Optional[str], images: list[bytes]) -> tuple[dict, bool]:
+        """
+        Turns Gemini's answer into the analysis dict via the shared response parser.
+        Fields that are missing or invalid are asked for again, alone, for the same images.
+        Returns (analysis_result, parsed_ok); parsed_ok is False when a default error result was used.
+        """
+        def retry_fields(fields: list[str]) -> Optional[str]:
+            prompt = (
+                f"You are an expert viticulturist AI. For your diagnosis of the provided grape plant image(s), give ONLY these fields: {', '.join(fields)}. "
+                f"'disease_detected' is the disease name (or 'Sağlıklı' if there is no disease), 'confidence_score' is a number from 0.0 to 1.0 "
+                f"and 'explanation' is a brief explanation."
+            )
+            return self.gemini_client.analyze_images(images, prompt, response_schema=diagnosis_schema(fields))
 
         if gemini_response:
             print(f"Debugging: Raw Gemini Response: {gemini_response}")
-            cleaned_response = gemini_response.strip()
-
-            # First attempt: Try to parse the response directly after stripping common markdown wrappers
-            if cleaned_response.startswith('```json'):
-                cleaned_response = cleaned_response[7:].strip()
-            if cleaned_response.endswith('```'):
-                cleaned_response = cleaned_response[:-3].strip()
-
-            try:
-                analysis_result = json.loads(cleaned_response)
-                print(f"Debugging: Successfully parsed JSON directly: {cleaned_response}")
-            except json.JSONDecodeError as e:
-                print(f"Error parsing response directly as JSON: {e}. Trying regex extraction...")
-                # Fallback to regex if direct parsing fails
-                json_match = re.search(r'\{.*\}', cleaned_response, re.DOTALL)
-                if json_match:
-                    try:
-                        extracted_json_str = json_match.group(0).strip()
-                        analysis_result = json.loads(extracted_json_str)
-                        print(f"Debugging: Successfully parsed JSON with regex: {extracted_json_str}")
-                    except json.JSONDecodeError as e_regex:
-                        print(f"Error parsing regex extracted JSON: {e_regex}. Sticking with default error result.")
-                        analysis_result = {"disease_detected": "Unknown", "confidence_score": 0.0, "explanation": f"AI yanıtı ayrıştırılamadı (regex de başarısız). Ham yanıt: {gemini_response}"}
-                else:
-                    print("Debugging: No JSON object found with regex. Sticking with default error result.")
-                    analysis_result = {"disease_detected": "Unknown", "confidence_score": 0.0, "explanation": f"AI yanıtı ayrıştırılamadı. Ham yanıt: {gemini_response}"}
-        else:
-            print("Debugging: Gemini API returned None response.")
+        return parse_diagnosis(gemini_response, retry_fields=retry_fields)
 
-        return analysis_result, gemini_response # Always return raw response
+    def analyze_grape_images(self, images: list[bytes], skip_quality_check: bool = False, decoded_images: Optional[list] = None):
+        """
+        Analyzes several photos of the same plant (e.g. leaf top, leaf underside and cluster) in a single
+        Gemini request and returns one combined verdict, as (analysis_result, raw_response).
+        A single photo goes through analyze_grape_image. decoded_images, the PIL images the photos were
+        encoded from, are used for the quality gate instead of decoding the bytes again.
+        """
+        if len(images) == 1:
+            return self.analyze_grape_image(images[0], skip_quality_check=skip_quality_check, decoded_image=decoded_images[0] if decoded_images else None)
+
+        # The set of photos, in order, identifies the request in the response cache
+        combined_digest = hashlib.sha256("".join(hashlib.sha256(image_data).hexdigest() for image_data in images).encode()).hexdigest()
+        cached = self.response_cache.get(combined_digest, MULTI_IMAGE_PROMPT_VERSION, self.gemini_client.vision_model_name)
+        if cached is not None:
+            return cached
+
+        if not skip_quality_check:
+            rejection = self._quality_rejection(images, decoded_images)
+            if rejection is not None:
+                return rejection, None
+
+        json_example = {
+            "disease_detected": "Downy Mildew",
+            "confidence_score": 0.9,
+            "explanation": "Leaf top shows yellow oil spots and the underside has white downy growth."
+        }
+        json_example_str = json.dumps(json_example)
+
+        prompt = (
+            f"You are an expert viticulturist AI. The following {len(images)} images all show the SAME grape plant from different views "
+            f"(for example the upper side of a leaf, the underside of a leaf and a grape cluster). "
+            f"Examine all of them together and give ONE diagnosis for the plant: identify the disease, provide a confidence score (0.0 to 1.0), "
+            f"and a brief explanation that mentions which image shows which symptom. "
+            f"Respond in STRICT JSON format with double quotes for keys and string values. ALL internal double quotes within string values MUST be escaped. Fields: 'disease_detected', 'confidence_score', 'explanation'."
+            f"Eğer hastalık tespit edilmezse, 'disease_detected' alanını 'Sağlıklı', 'confidence_score' alanını 1.0 ve 'explanation' alanını 'Hastalık belirtisi tespit edilmedi.' olarak ayarlayın."
+            f"YANITINIZ SADECE JSON NESNESİ OLMALIDIR. BAŞKA HİÇBİR METİN VEYA MARKDOWN KOD BLOĞU İŞARETİ KULLANMAYIN. Örnek: {json_example_str}"
+        )
+
+        gemini_response = self.gemini_client.analyze_images(images, prompt, response_schema=diagnosis_schema())
+        analysis_result, parsed_ok = self._parse_analysis_response(gemini_response, images)
+        if parsed_ok:
+            self.response_cache.put(combined_digest, MULTI_IMAGE_PROMPT_VERSION, self.gemini_client.vision_model_name, analysis_result, gemini_response)
+        return analysis_result, gemini_response
+
+    def analyze_grape_images_fused(self, images: list[bytes], weather_info: str, skip_quality_check: bool = False, decoded_images: Optional[list] = None):
+        """
+        Fused mode: asks for the diagnosis and 3-5 structured recommendations in one multimodal request,
+        instead of a vision call followed by a separate recommendation call.
+        Returns (analysis_result, raw_response) where analysis_result also carries a 'recommendations' list
+        of {'type', 'description', 'priority', 'implementation_date'} objects.
+        decoded_images are used for the quality gate as in analyze_grape_images.
+        """
+        # Weather is part of the prompt, so it is part of the cache key too
+        combined_digest = hashlib.sha256(("".join(hashlib.sha256(image_data).hexdigest() for image_data in images) + weather_info).encode()).hexdigest()
+        cached = self.response_cache.get(combined_digest, FUSED_PROMPT_VERSION, self.gemini_client.vision_model_name)
+        if cached is not None:
+            return cached
+
+        if not skip_quality_check:
+            rejection = self._quality_rejection(images, decoded_images)
+            if rejection is not None:
+                return rejection, None
+
+        json_example = {
+            "disease_detected": "Powdery Mildew",
+            "confidence_score": 0.9,
+            "explanation": "Leaves are covered with a white powdery coating.",
+            "recommendations": [
+                {"type": "tedavi", "description": "Kükürt bazlı fungisit uygulayın.", "priority": 5, "implementation_date": str(date.today())},
+                {"type": "önleme", "description": "Uygun hava sirkülasyonu sağlayın.", "priority": 3, "implementation_date": str(date.today())}
+            ]
+        }
+        json_example_str = json.dumps(json_example, ensure_ascii=False)
+
+        views = "image" if len(images) == 1 else f"{len(images)} images (all of the SAME grape plant, from different views)"
+        prompt = (
+            f"You are an expert viticulturist AI. Analyze the provided {views} for any signs of diseases or health issues. "
+            f"Identify the disease, provide a confidence score (0.0 to 1.0), and a brief explanation. "
+            f"Mevcut hava durumu: {weather_info}. "
+            f"Ardından, bir uzman bağcı olarak, tespit ettiğiniz duruma göre 3-5 pratik ve uygulanabilir tedavi, budama veya önleme önerisi sunun. "
+            f"Önerilerde spesifik ticari ürün isimleri yerine, aktif madde türleri (örn: 'Bakır bazlı fungisitler', 'Kükürt içerikli ürünler') veya genel ilaç kategorilerini belirtin. "
+            f"Respond in STRICT JSON format with double quotes for keys and string values. ALL internal double quotes within string values MUST be escaped. "
+            f"Fields: 'disease_detected', 'confidence_score', 'explanation', 'recommendations'. 'recommendations' bir nesne dizisidir; her nesnenin 'type' (tür: 'tedavi', 'budama', 'önleme' gibi), 'description' (detaylı açıklama), 'priority' (1-5 arası bir tam sayı, 5 en yüksek) ve 'implementation_date' (YYYY-MM-DD formatında) alanları OLMALIDIR."
+            f"Eğer hastalık tespit edilmezse, 'disease_detected' alanını 'Sağlıklı', 'confidence_score' alanını 1.0 ve 'explanation' alanını 'Hastalık belirtisi tespit edilmedi.' olarak ayarlayın ve koruyucu öneriler verin."
+            f"YANITINIZ SADECE JSON NESNESİ OLMALIDIR. BAŞKA HİÇBİR METİN VEYA MARKDOWN KOD BLOĞU İŞARETİ KULLANMAYIN. Örnek: {json_example_str}"
+        )
+
+        gemini_response = self.gemini_client.analyze_images(images, prompt, response_schema=diagnosis_schema(with_recommendations=True))
+        analysis_result, parsed_ok = self._parse_analysis_response(gemini_response, images)
+        # A diagnosis without its recommendations is not a complete fused answer; do not replay it
+        if parsed_ok and isinstance(analysis_result.get('recommendations'), list):
+            self.response_cache.put(combined_digest, FUSED_PROMPT_VERSION, self.gemini_client.vision_model_name, analysis_result, gemini_response)
+        return analysis_result, gemini_response
+
+    def analyze_grape_image_tiled(self, image_data: bytes, skip_quality_check: bool = False, decoded_image=None):
+        """
+        High-resolution mode: analyzes the most lesion-like full-resolution tiles of the photo in parallel
+        instead of one downscaled image, so small early lesions are not lost to resizing.
+        Per-tile verdicts are merged into one result; see _merge_tile_results.
+        Returns (analysis_result, raw_response) like analyze_grape_image, where raw_response is a JSON
+        document holding the merged explanation and every tile's raw answer.
+        decoded_image, a downscaled decode of the same photo, lets the quality gate skip decoding image_data.
+        """
+        if not skip_quality_check:
+            rejection = self._quality_rejection([image_data], None if decoded_image is None else [decoded_image])
+            if rejection is not None:
+                return rejection, None
+
+        tiles = select_candidate_tiles(image_data)
+        # Tiles are crops of an image that already passed the gate; a single tile may legitimately be mostly lesion
+        with ThreadPoolExecutor(max_workers=TILE_ANALYSIS_WORKERS) as executor:
+            tile_outputs = list(executor.map(lambda tile: self.analyze_grape_image(tile["image_data"], skip_quality_check=True), tiles))
+
+        tile_results = []
+        for tile, (result, raw_response) in zip(tiles, tile_outputs):
+            tile_results.append({
+                "box": list(tile["box"]),
+                "score": round(tile["score"], 4),
+                "disease_detected": str(result.get("disease_detected", "Unknown")),
+                "confidence_score": float(result.get("confidence_score", 0.0)),
+                "explanation": result.get("explanation"),
+                "raw_response": raw_response
+            })
+
+        analysis_result = self._merge_tile_results(tile_results)
+        raw_response = json.dumps({"explanation": analysis_result["explanation"], "tiles": tile_results}, ensure_ascii=False)
+        return analysis_result, raw_response
+
+    def _merge_tile_results(self, tile_results: list[dict]) -> dict:
+        """
+        Combines per-tile verdicts. A disease seen on any tile wins over healthy tiles, since lesions are local;
+        when several diseases appear, the one with the highest combined confidence is reported.
+        Confidence for a disease seen on several tiles is combined as 1 - prod(1 - c), so independent sightings
+        reinforce each other. Healthy verdicts use the lowest tile confidence.
+        """
+        confidences_by_disease = {}
+        healthy_confidences = []
+        for tile in tile_results:
+            label, confidence = tile["disease_detected"], max(0.0, min(1.0, tile["confidence_score"]))
+            if label in HEALTHY_LABELS:
+                healthy_confidences.append(confidence)
+            elif label != "Unknown":
+                confidences_by_disease.setdefault(label, []).append(confidence)
 
+        if confidences_by_disease:
+            combined = {}
+            for label, confidences in confidences_by_disease.items():
+                miss_probability = 1.0
+                for confidence in confidences:
+                    miss_probability *= 1.0 - confidence
+                combined[label] = 1.0 - miss_probability
+            disease = max(combined, key=combined.get)
+            explanations = [tile["explanation"] for tile in tile_results if tile["disease_detected"] == disease and tile["explanation"]]
+            return {
+                "disease_detected": disease,
+                "confidence_score": round(combined[disease], 4),
+                "explanation": f"{len(tile_results)} bölgeden {len(confidences_by_disease[disease])} tanesinde tespit edildi. " + " ".join(explanations[:2])
+            }
+        if healthy_confidences:
+            return {
+                "disease_detected": HEALTHY_LABELS[0],
+                "confidence_score": min(healthy_confidences),
+                "explanation": f"İncelenen {len(tile_results)} bölgenin hiçbirinde hastalık belirtisi tespit edilmedi."
+            }
+        return {"disease_detected": "Unknown", "confidence_score": 0.0, "explanation": "Bölgelerin hiçbiri için AI yanıtı alınamadı."}
@@ -1,35 +1,234 @@
 import google.generativeai
+import hashlib
+import json
 import os
+import threading
+from concurrent.futures import Future
+from typing import Optional
 from config.settings import GEMINI_API_KEY
 
 google.generativeai.configure(api_key=GEMINI_API_KEY)
 
+VISION_MODEL_NAME = 'gemini-1.5-flash' # Updated model for image analysis
+TEXT_MODEL_NAME = 'gemini-1.5-flash' # Updated model for text-only generation (consistency)
+
+class _SharedStream:
+    """
+    One streaming Gemini response read by several callers. Whichever reader needs the next chunk pulls it
+    from the upstream response; chunks are kept so readers that joined late replay them from the start.
+    Every caller holds its own reader from the moment it is handed out. Only once all of them have stopped early
+    (e.g. Streamlit reruns interrupted every page) is the upstream stream closed; the request is then no longer
+    joinable, so later identical prompts make a fresh call.
+    """
+
+    def __init__(self, response, on_finished):
+        self._source = iter(response)
+        self._chunks = []
+        self._finished = False
+        self._abandoned = False
+        self._error = None
+        self._holders = 0
+        self._lock = threading.Lock()
+        self._on_finished = on_finished
+
+    def open_reader(self) -> Optional['_StreamReader']:
+        """A new reader replaying the stream from the start, or None if the stream was already abandoned."""
+        with self._lock:
+            if self._abandoned:
+                return None
+            self._holders += 1
+        return _StreamReader(self)
+
+    def _read(self):
+        index = 0
+        while True:
+            with self._lock:
+                if index == len(self._chunks) and not self._finished:
+                    try:
+                        self._chunks.append(next(self._source))
+                    except StopIteration:
+                        self._finish()
+                    except Exception as e:
+                        self._error = e
+                        self._finish()
+                if index < len(self._chunks):
+                    chunk = self._chunks[index]
+                elif self._error is not None:
+                    raise self._error
+                else:
+                    return
+            index += 1
+            yield chunk
+
+    def _release(self):
+        with self._lock:
+            self._holders -= 1
+            abandoned = self._holders == 0 and not self._finished
+            if abandoned:
+                self._abandoned = True
+                self._finish()
+        if abandoned:
+            close = getattr(self._source, 'close', None)
+            if close is not None:
+                close()
+
+    def _finish(self):
+        self._finished = True
+        self._on_finished()
+
+
+class _StreamReader:
+    """One caller's handle on a _SharedStream; it keeps the stream alive until it is exhausted, closed or collected."""
+
+    def __init__(self, stream: _SharedStream):
+        self._stream = stream
+        self._released = False
+
+    def __iter__(self):
+        try:
+            yield from self._stream._read()
+        finally:
+            self.close()
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._stream._release()
+
+    def __del__(self):
+        self.close()
+
+
 class GeminiClient:
+    """
+    Thin wrapper around the Gemini models. Identical requests that are in flight at the same time
+    (same model, prompt, schema and image bytes) are coalesced into one upstream call whose result is shared.
+    Use get_gemini_client() for the process-wide instance.
+    """
+
     def __init__(self):
         if not GEMINI_API_KEY:
             raise ValueError("GEMINI_API_KEY is not set in environment variables.")
-        self.vision_model = google.generativeai.GenerativeModel('gemini-1.5-flash') # Updated model for image analysis
-        self.text_model = google.generativeai.GenerativeModel('gemini-1.5-flash') # Updated model for text-only generation (consistency)
+        self.vision_model_name = VISION_MODEL_NAME
+        self.text_model_name = TEXT_MODEL_NAME
+        self.vision_model = google.generativeai.GenerativeModel(VISION_MODEL_NAME)
+        # Both roles currently use the same model, so one GenerativeModel serves both
+        self.text_model = self.vision_model if TEXT_MODEL_NAME == VISION_MODEL_NAME else google.generativeai.GenerativeModel(TEXT_MODEL_NAME)
+        self._in_flight = {} # Request key -> Future of the shared result
+        self._lock = threading.Lock()
+        self._upstream_calls = 0
+        self._coalesced_calls = 0
+
+    def _generation_config(self, response_schema: Optional[dict]) -> Optional[dict]:
+        # With a schema Gemini returns bare JSON of that shape instead of free text
+        if response_schema is None:
+            return None
+        return {"response_mime_type": "application/json", "response_schema": response_schema}
+
+    def _request_key(self, model_name: str, prompt: str, images: list[bytes], response_schema: Optional[dict]) -> str:
+        key = hashlib.sha256()
+        for part in (model_name, prompt, json.dumps(response_schema, sort_keys=True)):
+            key.update(part.encode())
+            key.update(b'\0')
+        for image_data in images:
+            key.update(hashlib.sha256(image_data).digest())
+        return key.hexdigest()
+
+    def _join_or_lead(self, key: str) -> tuple[Future, bool]:
+        """Returns the in-flight Future for key and whether the caller has to produce its result."""
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self._coalesced_calls += 1
+                print(f"GeminiClient: coalesced an identical in-flight request ({self._coalesced_calls} upstream calls saved so far)")
+                return future, False
+            future = Future()
+            self._in_flight[key] = future
+            self._upstream_calls += 1
+            return future, True
+
+    def _forget(self, key: str):
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+    def stats(self) -> dict:
+        """Upstream/coalesced request counters for this process."""
+        with self._lock:
+            requests = self._upstream_calls + self._coalesced_calls
+            return {
+                "upstream_calls": self._upstream_calls,
+                "coalesced_calls": self._coalesced_calls,
+                "in_flight": len(self._in_flight),
+                "saved_rate": self._coalesced_calls / requests if requests else 0.0
+            }
+
+    def analyze_image(self, image_data: bytes, prompt: str, response_schema: Optional[dict] = None):
+        return self.analyze_images([image_data], prompt, response_schema=response_schema)
 
-    def analyze_image(self, image_data: bytes, prompt: str):
+    def analyze_images(self, images: list[bytes], prompt: str, response_schema: Optional[dict] = None):
+        """Sends several images as separate parts of one request, so they cost a single round trip."""
+        key = self._request_key(self.vision_model_name, prompt, images, response_schema)
+        future, is_leader = self._join_or_lead(key)
+        if not is_leader:
+            return future.result()
+        result = None
         try:
-            # Assuming image_data is raw bytes of the image
-            image_part = {
+            # Assuming every entry is raw bytes of a JPEG image
+            image_parts = [{
                 'mime_type': 'image/jpeg', # Or image/png, etc., depending on actual image type
                 'data': image_data
-            }
-            response = self.vision_model.generate_content([prompt, image_part])
+            } for image_data in images]
+            response = self.vision_model.generate_content([prompt, *image_parts], generation_config=self._generation_config(response_schema))
             # You might need to parse response.text or response.parts based on the expected output format
-            return response.text
+            result = response.text
         except Exception as e:
             print(f"Error analyzing image with Gemini API in GeminiClient: {e}")
-            return None
+        finally:
+            # Waiting callers get the same answer, including a failed one
+            self._forget(key)
+            future.set_result(result)
+        return result
 
-    def generate_text_stream(self, prompt: str):
+    def generate_text_stream(self, prompt: str, response_schema: Optional[dict] = None):
+        """
+        Returns an iterable of response chunks (each with .text), or None if the request failed.
+        Iterating it raises if the upstream stream fails part way through.
+        """
+        key = self._request_key(self.text_model_name, prompt, [], response_schema)
+        while True:
+            future, is_leader = self._join_or_lead(key)
+            if is_leader:
+                break
+            stream = future.result()
+            if stream is None:
+                return None
+            reader = stream.open_reader()
+            if reader is not None:
+                return reader
+            # Every other reader gave up on that stream before we got to it; it is forgotten, so start a new one
+        stream = None
+        reader = None
         try:
-            response = self.text_model.generate_content(prompt, stream=True)
-            return response
+            response = self.text_model.generate_content(prompt, stream=True, generation_config=self._generation_config(response_schema))
+            # Stays joinable until the last chunk has arrived or every reader has stopped
+            stream = _SharedStream(response, on_finished=lambda: self._forget(key))
+            reader = stream.open_reader() # Held before anyone can join, so joiners never see it abandoned by us alone
         except Exception as e:
             print(f"Error generating text with Gemini API in GeminiClient: {e}")
-            return None
+        finally:
+            if stream is None:
+                self._forget(key)
+            future.set_result(stream)
+        return reader
+
+
+_shared_client = None
+_shared_client_lock = threading.Lock()
 
+def get_gemini_client() -> GeminiClient:
+    """The process-wide GeminiClient, so every caller shares its models and its in-flight request table."""
+    global _shared_client
+    with _shared_client_lock:
+        if _shared_client is None:
+            _shared_client = GeminiClient()
+        return _shared_client
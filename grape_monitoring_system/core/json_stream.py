@@ -0,0 +1,110 @@
+import json
+from typing import Iterable, Iterator
+
+
+class JsonArrayStreamParser:
+    """
+    Incremental parser for a top-level JSON array arriving in arbitrary text chunks.
+    feed() returns every array element whose closing bracket has arrived, without waiting for the rest
+    of the array. The array is the first '[' that is not nested inside a JSON object and is followed by '{' or ']',
+    so a leading ```json fence or prose (even one quoting a "[") is skipped, while a wrapper like
+    {"recommendations": [...]} is not mistaken for the array (it yields nothing and is left to a full parse
+    of the response). Apart from the whitespace looked at after a '[', each character is scanned once,
+    so the total cost stays linear in the response length.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._position = 0 # Next unscanned character in _buffer
+        self._outer_depth = 0 # Nesting of {...} / [...] seen before the array, e.g. a wrapping object
+        self._depth = 0 # 0 = not in the array, 1 = between elements, >1 = inside an element
+        self._element_start = None
+        self._elements_seen = 0 # Elements completed in the current array
+        self._in_string = False
+        self._escaped = False
+        self.finished = False # Set once the array's closing ']' has been seen
+
+    def feed(self, text: str) -> list:
+        """Adds a chunk and returns the elements it completed, in order. Elements that are not valid JSON are skipped."""
+        if self.finished or not text:
+            return []
+        self._buffer += text
+        elements = []
+        buffer = self._buffer
+        position = self._position
+        while position < len(buffer):
+            char = buffer[position]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                # Quotes in prose outside any JSON value are just text
+                self._in_string = self._depth > 0 or self._outer_depth > 0
+            elif self._depth == 0:
+                if char == '[' and self._outer_depth == 0:
+                    following = self._next_non_space(buffer, position + 1)
+                    if following is None:
+                        break # Decide once the next chunk shows what follows this '['
+                    if following in '{]':
+                        self._depth = 1
+                        self._elements_seen = 0
+                    # Otherwise it is prose (e.g. a quoted "[" or "[1]"), not an array of objects
+                elif char in '[{':
+                    self._outer_depth += 1
+                elif char in ']}' and self._outer_depth > 0:
+                    self._outer_depth -= 1
+            elif char in '[{':
+                self._depth += 1
+                if self._depth == 2:
+                    self._element_start = position
+            elif char in ']}':
+                if self._depth == 2:
+                    element = self._decode(buffer[self._element_start:position + 1])
+                    if element is not None:
+                        elements.append(element)
+                    self._elements_seen += 1
+                    self._element_start = None
+                self._depth -= 1
+                if self._depth == 0:
+                    if self._elements_seen:
+                        self.finished = True
+                        position += 1
+                        break
+                    # An empty bracket pair in prose (e.g. "[1]" or "[]"); keep looking for the real array
+            position += 1
+
+        # Keep only the element still being received, so the buffer does not grow with the whole response
+        keep_from = self._element_start if self._element_start is not None else position
+        self._buffer = buffer[keep_from:]
+        self._position = position - keep_from
+        if self._element_start is not None:
+            self._element_start = 0
+        return elements
+
+    @staticmethod
+    def _next_non_space(buffer: str, position: int):
+        while position < len(buffer):
+            if not buffer[position].isspace():
+                return buffer[position]
+            position += 1
+        return None
+
+    def _decode(self, text: str):
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as e:
+            print(f"Warning: Skipping malformed streamed JSON element: {e}")
+            return None
+
+
+def iter_json_array(chunks: Iterable[str]) -> Iterator:
+    """Yields the elements of a JSON array as soon as each one is complete in the chunk stream."""
+    parser = JsonArrayStreamParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+        if parser.finished:
+            return
@@ -1,12 +1,14 @@
-from core.gemini_client import GeminiClient
+from core.gemini_client import get_gemini_client
 from models.analysis import Analysis
 from models.recommendation import Recommendation
 from datetime import date
 import json
 import re # Import regex module
-from typing import Optional, List
+from typing import Callable, Generator, Optional, List
+from core.json_stream import JsonArrayStreamParser
+from core.response_parser import RECOMMENDATIONS_SCHEMA, normalize_recommendation, parse_recommendation_items
 from services.weather_service import WeatherService # Import WeatherService
-from config.settings import OPENWEATHER_API_KEY # Import OPENWEATHER_API_KEY
+from config.settings import HEALTHY_LABELS, OPENWEATHER_API_KEY # Import OPENWEATHER_API_KEY
 
 class RecommendationEngine:
     # Define a dictionary for chemical drug recommendations based on disease
@@ -39,23 +41,109 @@ class RecommendationEngine:
     }
 
     def __init__(self):
-        self.gemini_client = GeminiClient()
+        self.gemini_client = get_gemini_client()
         self.weather_service = WeatherService(OPENWEATHER_API_KEY) # Initialize WeatherService
 
-    def generate_recommendations(self, analysis: Analysis) -> List[Recommendation]:
+    def fetch_weather_info(self) -> str:
+        """
+        Fetches and formats the current weather for the recommendation prompt.
+        Independent of the analysis, so callers can start it before the diagnosis is known.
+        """
+        city = "Izmir" # TODO: Make city dynamic (e.g., from user profile or image metadata)
+        current_weather_data = self.weather_service.get_current_weather(city)
+        return self.weather_service.parse_weather_data(current_weather_data)
+
+    def generate_recommendations(self, analysis: Analysis, weather_info: Optional[str] = None,
+                                 on_recommendation: Optional[Callable[[Recommendation], None]] = None) -> tuple[List[Recommendation], Optional[str]]:
         """
         Generates recommendations based on the analysis results.
         Prioritizes structured JSON from Gemini, falls back to text parsing if needed.
+        weather_info is fetched here unless the caller already has it (see fetch_weather_info).
+        on_recommendation, if given, is called with each recommendation as soon as it has streamed in.
+        Returns the recommendations and the raw Gemini response.
         """
-        if analysis.disease_detected == "Healthy":
-            return [Recommendation(
+        stream = self.stream_recommendations(analysis, weather_info)
+        recommendations = []
+        try:
+            while True:
+                try:
+                    recommendation = next(stream)
+                except StopIteration as stop:
+                    return recommendations, stop.value
+                recommendations.append(recommendation)
+                if on_recommendation is not None:
+                    on_recommendation(recommendation)
+        finally:
+            # If on_recommendation raised (e.g. a Streamlit rerun), release the upstream stream right away
+            stream.close()
+
+    def stream_recommendations(self, analysis: Analysis, weather_info: Optional[str] = None) -> Generator[Recommendation, None, Optional[str]]:
+        """
+        Generator version of generate_recommendations: yields each recommendation as soon as its JSON object
+        has fully streamed in from Gemini, instead of waiting for the whole response.
+        If nothing could be parsed incrementally, the complete response goes through the usual fallbacks at the end.
+        The raw Gemini response is the generator's return value.
+        """
+        if analysis.disease_detected in HEALTHY_LABELS:
+            yield Recommendation(
                 analysis_id=analysis.id,
                 recommendation_type="prevention",
                 description="Üzüm bitkiniz sağlıklı. Sağlığını korumak için düzenli gözlem ve iyi kültürel uygulamalara devam edin.",
                 priority=1,
                 implementation_date=date.today()
-            )]
+            )
+            return None
 
+        # Fetch weather data
+        if weather_info is None:
+            weather_info = self.fetch_weather_info()
+
+        prompt = self._recommendation_prompt(analysis, weather_info)
+        gemini_response = ""
+        streamed_count = 0
+        for attempt in range(2):
+            response_chunks = []
+            stream_failed = False
+            gemini_response_stream = self.gemini_client.generate_text_stream(prompt, response_schema=RECOMMENDATIONS_SCHEMA)
+            if gemini_response_stream:
+                parser = JsonArrayStreamParser()
+                try:
+                    for chunk in gemini_response_stream:
+                        response_chunks.append(chunk.text)
+                        for rec_data in parser.feed(chunk.text):
+                            if not isinstance(rec_data, dict):
+                                # Not a recommendation object (e.g. a nested list); the full-response fallback gets a chance instead
+                                print(f"Warning: Skipping streamed non-object element: {rec_data}")
+                                continue
+                            streamed_count += 1
+                            yield self._recommendation_from_item(rec_data, analysis)
+                except Exception as e:
+                    # Keep what already streamed in; the fallbacks below handle the rest
+                    print(f"Error reading recommendation stream from Gemini: {e}")
+                    stream_failed = True
+            gemini_response = "".join(response_chunks)
+            if streamed_count:
+                break
+            if stream_failed:
+                if attempt == 0:
+                    print("Warning: Recommendation stream failed before any recommendation arrived, retrying once")
+                continue
+            # One retry when an answer arrived but held no recommendation array at all
+            if not gemini_response or parse_recommendation_items(gemini_response) is not None:
+                break
+            if attempt == 0:
+                print(f"Warning: No recommendation array in response, retrying once: {gemini_response}")
+
+        if streamed_count == 0:
+            # Not a JSON array after all (or no response); parse the complete text with the fallbacks
+            yield from self._parse_recommendation_response(gemini_response, analysis)
+
+        # Add chemical drug recommendations if applicable
+        yield from self._chemical_recommendations(analysis)
+
+        return gemini_response # Return raw response here
+
+    def _recommendation_prompt(self, analysis: Analysis, weather_info: str) -> str:
         # Define the desired JSON structure for recommendations
         recommendation_example = [
             {
@@ -79,11 +167,6 @@ class RecommendationEngine:
         ]
         recommendation_example_str = json.dumps(recommendation_example, indent=2, ensure_ascii=False)
 
-        # Fetch weather data
-        city = "Izmir" # TODO: Make city dynamic (e.g., from user profile or image metadata)
-        current_weather_data = self.weather_service.get_current_weather(city)
-        weather_info = self.weather_service.parse_weather_data(current_weather_data)
-
         prompt = (
             f"Analiz sonucu: Tespit Edilen Hastalık - {analysis.disease_detected} (Güven: {analysis.confidence_score * 100:.2f}%). " if analysis.confidence_score is not None else f"Analiz sonucu: Tespit Edilen Hastalık - {analysis.disease_detected} (Güven: Bilinmiyor). "
             f"Mevcut hava durumu: {weather_info}. " # Add weather info to the prompt
@@ -93,105 +176,83 @@ class RecommendationEngine:
             f"Örnek: {recommendation_example_str}"
         )
 
-        gemini_response_stream = self.gemini_client.generate_text_stream(prompt)
-        gemini_response = ""
-        if gemini_response_stream:
-            for chunk in gemini_response_stream:
-                gemini_response += chunk.text
-
-        recommendations = []
-        if gemini_response:
-            try:
-                print(f"Debugging (RecommendationEngine): Raw Gemini Response: {gemini_response}")
-                cleaned_response = gemini_response.strip()
-
-                # First attempt: Try to parse the response directly after stripping common markdown wrappers
-                if cleaned_response.startswith('```json'):
-                    cleaned_response = cleaned_response[7:].strip()
-                if cleaned_response.endswith('```'):
-                    cleaned_response = cleaned_response[:-3].strip()
+        return prompt
 
-                try:
-                    parsed_recommendations = json.loads(cleaned_response)
-                    print(f"Debugging: Successfully parsed JSON directly: {cleaned_response}")
-                except json.JSONDecodeError as e:
-                    print(f"Error parsing response directly as JSON: {e}. Trying regex extraction...")
-                    # Fallback to regex if direct parsing fails
-                    json_match = re.search(r'\[.*\]', cleaned_response, re.DOTALL)
-                    if json_match:
-                        try:
-                            extracted_json_str = json_match.group(0).strip()
-                            parsed_recommendations = json.loads(extracted_json_str)
-                            print(f"Debugging: Successfully parsed JSON with regex: {extracted_json_str}")
-                        except json.JSONDecodeError as e_regex:
-                            print(f"Error parsing regex extracted JSON: {e_regex}. Proceeding with plain text parsing fallback.")
-                            parsed_recommendations = [] # Set to empty to trigger plain text fallback
-                    else:
-                        print("Debugging: No JSON array found with regex. Proceeding with plain text parsing fallback.")
-                        parsed_recommendations = [] # Set to empty to trigger plain text fallback
+    def _parse_recommendation_response(self, gemini_response: str, analysis: Analysis) -> List[Recommendation]:
+        if not gemini_response:
+            return [Recommendation(
+                analysis_id=analysis.id,
+                recommendation_type="hata",
+                description="Yapay Zekadan yanıt alınamadı. API bağlantısını kontrol edin.",
+                priority=5,
+                implementation_date=date.today()
+            )]
 
-                if not isinstance(parsed_recommendations, list):
-                    parsed_recommendations = [parsed_recommendations]
+        print(f"Debugging (RecommendationEngine): Raw Gemini Response: {gemini_response}")
+        items = parse_recommendation_items(gemini_response)
+        if items:
+            return [self._recommendation_from_item(rec_data, analysis) for rec_data in items]
 
-                for rec_data in parsed_recommendations:
-                    if all(k in rec_data for k in ['type', 'description', 'priority', 'implementation_date']):
-                        try:
-                            impl_date = date.fromisoformat(rec_data['implementation_date'])
-                        except ValueError:
-                            impl_date = date.today()
+        print("Attempting fallback plain text parsing for recommendations...")
+        fallback_recommendations = self._parse_plain_text_recommendations(gemini_response, analysis.id)
+        if fallback_recommendations:
+            return fallback_recommendations
+        return [Recommendation(
+            analysis_id=analysis.id,
+            recommendation_type="hata",
+            description="Öneriler oluşturulamadı. Lütfen tekrar deneyin veya bir uzmana danışın.",
+            priority=5,
+            implementation_date=date.today()
+        )]
 
-                        recommendations.append(Recommendation(
-                            analysis_id=analysis.id,
-                            recommendation_type=rec_data['type'],
-                            description=rec_data['description'],
-                            priority=int(rec_data['priority']),
-                            implementation_date=impl_date
-                        ))
-                    else:
-                        print(f"Warning: Malformed recommendation object received: {rec_data}")
-                        recommendations.append(Recommendation(
-                            analysis_id=analysis.id,
-                            recommendation_type="hata",
-                            description="Yapay Zekadan hatalı öneri alındı. Eksik alanlar var veya format yanlış.",
-                            priority=1,
-                            implementation_date=date.today()
-                        ))
-            except (json.JSONDecodeError, ValueError, SyntaxError) as e:
-                print(f"Error decoding JSON from Gemini recommendations: {e}")
-                print(f"Problematic Gemini Response (Recommendations): {gemini_response}")
-                print("Attempting fallback plain text parsing for recommendations...")
-                fallback_recommendations = self._parse_plain_text_recommendations(gemini_response, analysis.id)
-                if fallback_recommendations:
-                    recommendations.extend(fallback_recommendations)
-                else:
-                    recommendations.append(Recommendation(
-                        analysis_id=analysis.id,
-                        recommendation_type="hata",
-                        description=f"Öneriler oluşturulamadı. Lütfen tekrar deneyin veya bir uzmana danışın. Detay: {e}",
-                        priority=5,
-                        implementation_date=date.today()
-                    ))
+    def recommendations_from_items(self, analysis: Analysis, items) -> List[Recommendation]:
+        """
+        Builds recommendations from objects Gemini already returned in structured form
+        (e.g. the 'recommendations' array of a fused diagnosis), plus the chemical drug recommendations.
+        """
+        if isinstance(items, list) and items:
+            recommendations = [self._recommendation_from_item(rec_data, analysis) for rec_data in items]
         else:
-            recommendations.append(Recommendation(
+            print(f"Warning: No recommendation array in fused response: {items}")
+            recommendations = [Recommendation(
                 analysis_id=analysis.id,
                 recommendation_type="hata",
-                description="Yapay Zekadan yanıt alınamadı. API bağlantısını kontrol edin.",
+                description="Yapay Zekadan öneri alınamadı. Lütfen tekrar deneyin veya bir uzmana danışın.",
                 priority=5,
                 implementation_date=date.today()
-            ))
+            )]
+        recommendations.extend(self._chemical_recommendations(analysis))
+        return recommendations
 
-        # Add chemical drug recommendations if applicable
-        if analysis.disease_detected in self.CHEMICAL_DRUG_RECOMMENDATIONS and analysis.disease_detected != "Healthy":
-            for drug_rec in self.CHEMICAL_DRUG_RECOMMENDATIONS[analysis.disease_detected]:
-                recommendations.append(Recommendation(
-                    analysis_id=analysis.id,
-                    recommendation_type="kimyasal_ilac",
-                    description=f"{drug_rec['name']}: {drug_rec['description']}",
-                    priority=5, # High priority for chemical recommendations
-                    implementation_date=date.today()
-                ))
+    def _recommendation_from_item(self, rec_data, analysis: Analysis) -> Recommendation:
+        normalized = normalize_recommendation(rec_data)
+        if normalized is not None:
+            return Recommendation(
+                analysis_id=analysis.id,
+                recommendation_type=normalized['type'],
+                description=normalized['description'],
+                priority=normalized['priority'],
+                implementation_date=normalized['implementation_date']
+            )
+        print(f"Warning: Malformed recommendation object received: {rec_data}")
+        return Recommendation(
+            analysis_id=analysis.id,
+            recommendation_type="hata",
+            description="Yapay Zekadan hatalı öneri alındı. Eksik alanlar var veya format yanlış.",
+            priority=1,
+            implementation_date=date.today()
+        )
 
-        return recommendations, gemini_response # Return raw response here
+    def _chemical_recommendations(self, analysis: Analysis) -> List[Recommendation]:
+        if analysis.disease_detected not in self.CHEMICAL_DRUG_RECOMMENDATIONS or analysis.disease_detected in HEALTHY_LABELS:
+            return []
+        return [Recommendation(
+            analysis_id=analysis.id,
+            recommendation_type="kimyasal_ilac",
+            description=f"{drug_rec['name']}: {drug_rec['description']}",
+            priority=5, # High priority for chemical recommendations
+            implementation_date=date.today()
+        ) for drug_rec in self.CHEMICAL_DRUG_RECOMMENDATIONS[analysis.disease_detected]]
 
     def _parse_plain_text_recommendations(self, text: str, analysis_id: Optional[int]) -> List[Recommendation]:
         """
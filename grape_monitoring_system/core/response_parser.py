@@ -0,0 +1,251 @@
+import json
+import sys
+import time
+from datetime import date
+from typing import Callable, Optional
+
+# Response schemas for Gemini's JSON output mode (OpenAPI subset understood by generation_config.response_schema)
+DIAGNOSIS_FIELD_SCHEMAS = {
+    "disease_detected": {"type": "STRING"},
+    "confidence_score": {"type": "NUMBER"},
+    "explanation": {"type": "STRING"},
+}
+RECOMMENDATION_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "type": {"type": "STRING"},
+        "description": {"type": "STRING"},
+        "priority": {"type": "INTEGER"},
+        "implementation_date": {"type": "STRING"},
+    },
+    "required": ["type", "description", "priority", "implementation_date"],
+}
+RECOMMENDATIONS_SCHEMA = {"type": "ARRAY", "items": RECOMMENDATION_SCHEMA}
+
+MIN_BARE_PERCENTAGE = 5 # A confidence above 1 without a '%' is read as a percentage only from this value up
+
+
+def diagnosis_schema(fields: Optional[list[str]] = None, with_recommendations: bool = False) -> dict:
+    """Schema for a diagnosis object, optionally restricted to some fields (used when retrying only those)."""
+    fields = list(fields or DIAGNOSIS_FIELD_SCHEMAS)
+    properties = {field: DIAGNOSIS_FIELD_SCHEMAS[field] for field in fields}
+    if with_recommendations:
+        properties["recommendations"] = RECOMMENDATIONS_SCHEMA
+    return {"type": "OBJECT", "properties": properties, "required": list(properties)}
+
+
+def extract_json(text: str, expected: type = dict):
+    """
+    Finds the first balanced {...} (or [...] for expected=list) in free text that parses as JSON.
+    Brackets inside strings are ignored. A balanced candidate that is not valid JSON is skipped as a whole;
+    an opening bracket that is never closed (e.g. prose like "note {oops") is skipped on its own and the scan
+    resumes right after it, so a valid object following it is still found.
+    """
+    opening, closing = ('{', '}') if expected is dict else ('[', ']')
+    search_from = 0
+    while True:
+        start = text.find(opening, search_from)
+        if start == -1:
+            return None
+        depth = 0
+        in_string = False
+        escaped = False
+        for position in range(start, len(text)):
+            char = text[position]
+            if start is None:
+                if char == opening:
+                    start, depth = position, 1
+                continue
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == '\\':
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char == opening:
+                depth += 1
+            elif char == closing:
+                depth -= 1
+                if depth == 0:
+                    try:
+                        value = json.loads(text[start:position + 1])
+                        if isinstance(value, expected):
+                            return value
+                    except json.JSONDecodeError:
+                        pass
+                    start = None # Not valid JSON; look for the next candidate after this one
+        if start is None:
+            return None
+        search_from = start + 1 # This candidate never closed; retry from the character after its bracket
+
+
+def parse_json_response(text: Optional[str], expected: type = dict):
+    """Parses a Gemini answer as JSON of the expected type, tolerating Markdown fences and surrounding prose."""
+    if not text:
+        return None
+    cleaned = text.strip()
+    if cleaned.startswith('```'):
+        cleaned = cleaned.split('\n', 1)[1] if '\n' in cleaned else cleaned[3:]
+    if cleaned.endswith('```'):
+        cleaned = cleaned[:-3]
+    try:
+        value = json.loads(cleaned)
+        if isinstance(value, expected):
+            return value
+    except json.JSONDecodeError:
+        pass
+    return extract_json(cleaned, expected)
+
+
+def validate_diagnosis(data: dict) -> tuple[dict, list[str]]:
+    """
+    Normalizes the diagnosis fields of data. Returns (result, failed_fields); failed fields are missing or unusable
+    and are left out of result. Other keys (e.g. 'recommendations') are kept as they are.
+    """
+    result = dict(data)
+    failed = []
+
+    disease = data.get("disease_detected")
+    if isinstance(disease, str) and disease.strip():
+        result["disease_detected"] = disease.strip()
+    else:
+        result.pop("disease_detected", None)
+        failed.append("disease_detected")
+
+    confidence = data.get("confidence_score")
+    percentage = False
+    if isinstance(confidence, str):
+        text = confidence.strip()
+        percentage = text.endswith('%')
+        try:
+            confidence = float(text.rstrip('%'))
+        except ValueError:
+            confidence = None
+    if isinstance(confidence, (int, float)) and not isinstance(confidence, bool):
+        confidence = float(confidence)
+        # Some answers give a percentage instead of a fraction. Without a '%' only values that are clearly
+        # percentages are converted; something like 1.5 is neither and goes to the retry instead
+        if not percentage and 0 <= confidence <= 1:
+            result["confidence_score"] = confidence
+        elif (percentage and 0 <= confidence <= 100) or MIN_BARE_PERCENTAGE <= confidence <= 100:
+            result["confidence_score"] = confidence / 100
+        else:
+            confidence = None
+    else:
+        confidence = None
+    if confidence is None:
+        result.pop("confidence_score", None)
+        failed.append("confidence_score")
+
+    explanation = data.get("explanation")
+    if isinstance(explanation, str):
+        result["explanation"] = explanation
+    else:
+        result.pop("explanation", None)
+        failed.append("explanation")
+    return result, failed
+
+
+def parse_diagnosis(gemini_response: Optional[str], retry_fields: Optional[Callable[[list[str]], Optional[str]]] = None) -> tuple[dict, bool]:
+    """
+    Turns a diagnosis answer into the analysis dict. If some fields are missing or invalid and retry_fields is given,
+    it is called once with just those field names and should return a new answer containing only them.
+    Returns (analysis_result, parsed_ok); parsed_ok is False when defaults had to fill in a field.
+    """
+    if not gemini_response:
+        print("Debugging: Gemini API returned None response.")
+        return {"disease_detected": "Unknown", "confidence_score": 0.0, "explanation": "Failed to get response from AI."}, False
+
+    result, failed = validate_diagnosis(parse_json_response(gemini_response, dict) or {})
+    if failed and retry_fields is not None:
+        print(f"Debugging: Retrying invalid diagnosis fields {failed}")
+        retried = parse_json_response(retry_fields(failed), dict) or {}
+        patch, _ = validate_diagnosis({field: retried.get(field) for field in failed})
+        result.update(patch)
+        result, failed = validate_diagnosis(result)
+
+    if not failed:
+        return result, True
+    print(f"Error: Diagnosis fields {failed} could not be parsed from: {gemini_response}")
+    defaults = {"disease_detected": "Unknown", "confidence_score": 0.0, "explanation": f"AI yanıtı ayrıştırılamadı. Ham yanıt: {gemini_response}"}
+    if "disease_detected" in failed:
+        # A diagnosis without its label is not usable, whatever else was parsed
+        return defaults, False
+    return {**result, **{field: defaults[field] for field in failed}}, False
+
+
+def normalize_recommendation(item) -> Optional[dict]:
+    """
+    Validates one recommendation object. Only the description is essential; a missing type, priority or date
+    gets a sensible default instead of discarding the advice. Returns None when nothing usable is left.
+    """
+    if not isinstance(item, dict):
+        return None
+    description = item.get("description")
+    if not isinstance(description, str) or not description.strip():
+        return None
+
+    recommendation_type = item.get("type")
+    if not isinstance(recommendation_type, str) or not recommendation_type.strip():
+        recommendation_type = "genel_oneri"
+
+    try:
+        priority = min(5, max(1, int(item.get("priority"))))
+    except (TypeError, ValueError):
+        priority = 3
+
+    try:
+        implementation_date = date.fromisoformat(item.get("implementation_date"))
+    except (TypeError, ValueError):
+        implementation_date = date.today()
+
+    return {
+        "type": recommendation_type.strip(),
+        "description": description.strip(),
+        "priority": priority,
+        "implementation_date": implementation_date,
+    }
+
+
+def parse_recommendation_items(gemini_response: Optional[str]) -> Optional[list]:
+    """
+    Returns the recommendation objects of an answer (a bare array, a single recommendation object, or an object
+    wrapping a 'recommendations' array), or None. Any other JSON object is not a recommendation answer.
+    """
+    items = parse_json_response(gemini_response, list)
+    if items is not None:
+        return items
+    data = parse_json_response(gemini_response, dict)
+    if data is None:
+        return None
+    if isinstance(data.get("recommendations"), list):
+        return data["recommendations"]
+    if "description" in data:
+        return [data]
+    return None
+
+
+if __name__ == '__main__':
+    # Replays every stored analyses.gemini_response through the parser: parse rate per outcome and timing
+    if '--check-stored' in sys.argv:
+        from config.database import init_db
+        from services.database_service import DatabaseService
+
+        init_db()
+        responses = DatabaseService().get_gemini_responses()
+        outcomes = {}
+        start = time.perf_counter()
+        for response in responses:
+            data = parse_json_response(response, dict)
+            if data is None:
+                outcome = "unparseable"
+            elif "tiles" in data:
+                outcome = "tiled"
+            else:
+                outcome = "ok" if not validate_diagnosis(data)[1] else "missing fields"
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"Parsed {len(responses)} stored response(s) in {elapsed_ms:.1f} ms: {outcomes}")
@@ -2,7 +2,7 @@ from dataclasses import dataclass
 from datetime import datetime
 from typing import Optional
 
-@dataclass
+@dataclass(slots=True)
 class Analysis:
     id: Optional[int] = None
     user_id: Optional[int] = None
@@ -2,7 +2,7 @@ from dataclasses import dataclass
 from datetime import date
 from typing import Optional
 
-@dataclass
+@dataclass(slots=True)
 class Recommendation:
     id: Optional[int] = None
     analysis_id: Optional[int] = None
@@ -2,7 +2,7 @@ from dataclasses import dataclass
 from datetime import datetime
 from typing import Optional
 
-@dataclass
+@dataclass(slots=True)
 class User:
     id: Optional[int] = None
     name: Optional[str] = None
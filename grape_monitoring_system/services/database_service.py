@@ -1,33 +1,86 @@
 import sqlite3
-from config.database import DATABASE_NAME
+import re
+from config.database import connection_manager, rebuild_user_stats, NON_DISEASE_LABELS
 from models.user import User
 from models.analysis import Analysis
 from models.recommendation import Recommendation
-from datetime import datetime, date
+from datetime import date
 from typing import Optional, List
+import pandas as pd
 
-class DatabaseService:
-    def __init__(self):
-        self.conn = None
+# Maximum number of ids bound into a single IN (...) clause
+IN_CLAUSE_BATCH_SIZE = 500
+
+# Everything except gemini_response, for list views that never show the raw AI answer
+ANALYSIS_SUMMARY_COLUMNS = "id, user_id, image_path, disease_detected, confidence_score, analysis_date"
+
+# SQLite expressions mapping a 'YYYY-MM-DD' day to the first day of its chart bucket
+TREND_BUCKETS = {
+    "week": "date(day, 'weekday 0', '-6 days')", # Monday of the week
+    "month": "strftime('%Y-%m-01', day)",
+}
+
+# bm25 column weights for forum_search (title, body): title matches count ten times more
+FORUM_SEARCH_WEIGHTS = (10.0, 1.0)
+
+
+def _build_forum_search_query(query: str) -> Optional[str]:
+    """
+    Turns free user text into a safe FTS5 expression: every word becomes a quoted prefix term, all required.
+    Dotless ı is folded like the indexed text; the tokenizer handles case and the other diacritics.
+    """
+    terms = re.findall(r"\w+", query.replace('ı', 'i'))
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def _parse_date(value):
+    """implementation_date is a TEXT column, so it is not covered by the TIMESTAMP converter."""
+    if isinstance(value, str) and value:
+        try:
+            return date.fromisoformat(value[:10])
+        except ValueError:
+            return value
+    return value
+
+
+def _model_row_factory(model_cls, converters: Optional[dict] = None):
+    """
+    Builds a cursor row factory that turns rows straight into model_cls instances.
+    Timestamps are already decoded by the connection's converters; `converters` handles any remaining columns.
+    Column names are worked out once per result set rather than once per row.
+    """
+    converters = converters or {}
+    state = [(None, ())] # (cursor.description, column names), replaced as a whole so threads never see a half update
 
+    def factory(cursor: sqlite3.Cursor, row: tuple):
+        description, names = state[0]
+        if description is not cursor.description:
+            description = cursor.description
+            names = tuple(column[0] for column in description)
+            state[0] = (description, names)
+        values = dict(zip(names, row))
+        for column, convert in converters.items():
+            if column in values:
+                values[column] = convert(values[column])
+        return model_cls(**values)
+
+    return factory
+
+
+USER_ROW_FACTORY = _model_row_factory(User)
+ANALYSIS_ROW_FACTORY = _model_row_factory(Analysis)
+RECOMMENDATION_ROW_FACTORY = _model_row_factory(Recommendation, {'implementation_date': _parse_date})
+
+
+class DatabaseService:
     def _get_connection(self) -> sqlite3.Connection:
-        if self.conn is None:
-            self.conn = sqlite3.connect(DATABASE_NAME)
-            self.conn.row_factory = sqlite3.Row # Allows accessing columns by name
-        else:
-            # Check if the connection is still open/valid by trying a simple operation
-            try:
-                self.conn.execute("SELECT 1").fetchone()
-            except (sqlite3.ProgrammingError, sqlite3.OperationalError):
-                # If connection is closed or invalid, reopen it
-                self.conn = sqlite3.connect(DATABASE_NAME)
-                self.conn.row_factory = sqlite3.Row
-        return self.conn
+        # Connections are owned by the process-wide manager, one per thread
+        return connection_manager.get_connection()
 
     def close_connection(self):
-        if self.conn:
-            self.conn.close()
-            self.conn = None
+        connection_manager.close_connection()
 
     # User Operations
     def add_user(self, user: User) -> Optional[int]:
@@ -45,26 +98,16 @@ class DatabaseService:
     def get_user_by_id(self, user_id: int) -> Optional[User]:
         conn = self._get_connection()
         cursor = conn.cursor()
+        cursor.row_factory = USER_ROW_FACTORY
         cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
-        row = cursor.fetchone()
-        if row:
-            user_data = dict(row)
-            if 'created_at' in user_data and user_data['created_at']:
-                user_data['created_at'] = datetime.strptime(user_data['created_at'], '%Y-%m-%d %H:%M:%S')
-            return User(**user_data)
-        return None
+        return cursor.fetchone()
 
     def get_user_by_email(self, email: str) -> Optional[User]:
         conn = self._get_connection()
         cursor = conn.cursor()
+        cursor.row_factory = USER_ROW_FACTORY
         cursor.execute("SELECT * FROM users WHERE email = ?", (email,))
-        row = cursor.fetchone()
-        if row:
-            user_data = dict(row)
-            if 'created_at' in user_data and user_data['created_at']:
-                user_data['created_at'] = datetime.strptime(user_data['created_at'], '%Y-%m-%d %H:%M:%S')
-            return User(**user_data)
-        return None
+        return cursor.fetchone()
 
     def update_user_settings(self, user_id: int, name: str, email: str, phone: Optional[str], location: Optional[str], receive_email_notifications: bool) -> bool:
         conn = self._get_connection()
@@ -92,30 +135,185 @@ class DatabaseService:
         conn.commit()
         return cursor.lastrowid
 
+    def save_analysis_bundle(self, analysis: Analysis, recommendations: List[Recommendation], follow_ups: Optional[List[dict]] = None, image_paths: Optional[List[str]] = None) -> Optional[dict]:
+        """
+        Persists an analysis together with its recommendations and follow-ups in a single transaction.
+        follow_ups are dicts with 'status' and 'notes' keys.
+        image_paths lists every photo of a multi-image analysis in order; it defaults to analysis.image_path.
+        Returns the assigned ids, or None if nothing was written.
+        """
+        if image_paths is None:
+            image_paths = [analysis.image_path] if analysis.image_path else []
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        try:
+            with conn: # Commits once at the end, rolls back everything on error
+                cursor.execute(
+                    "INSERT INTO analyses (user_id, image_path, disease_detected, confidence_score, gemini_response) VALUES (?, ?, ?, ?, ?)",
+                    (analysis.user_id, analysis.image_path, analysis.disease_detected, analysis.confidence_score, analysis.gemini_response)
+                )
+                analysis_id = cursor.lastrowid
+                cursor.executemany(
+                    "INSERT INTO analysis_images (analysis_id, image_path, position) VALUES (?, ?, ?)",
+                    [(analysis_id, image_path, position) for position, image_path in enumerate(image_paths)]
+                )
+                cursor.executemany(
+                    "INSERT INTO recommendations (analysis_id, recommendation_type, description, priority, estimated_cost, implementation_date) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(analysis_id, rec.recommendation_type, rec.description, rec.priority, rec.estimated_cost, rec.implementation_date) for rec in recommendations]
+                )
+                cursor.executemany(
+                    "INSERT INTO follow_ups (analysis_id, status, notes) VALUES (?, ?, ?)",
+                    [(analysis_id, fu.get('status'), fu.get('notes')) for fu in follow_ups or []]
+                )
+                # The analysis is brand new, so every child row belonging to it was inserted above
+                cursor.execute("SELECT id FROM recommendations WHERE analysis_id = ? ORDER BY id", (analysis_id,))
+                recommendation_ids = [row[0] for row in cursor.fetchall()]
+                cursor.execute("SELECT id FROM follow_ups WHERE analysis_id = ? ORDER BY id", (analysis_id,))
+                follow_up_ids = [row[0] for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            print(f"Error saving analysis bundle: {e}")
+            return None
+
+        analysis.id = analysis_id
+        for rec, rec_id in zip(recommendations, recommendation_ids):
+            rec.analysis_id = analysis_id
+            rec.id = rec_id
+        return {
+            "analysis_id": analysis_id,
+            "recommendation_ids": recommendation_ids,
+            "follow_up_ids": follow_up_ids
+        }
+
     def get_analysis_by_id(self, analysis_id: int) -> Optional[Analysis]:
         conn = self._get_connection()
         cursor = conn.cursor()
+        cursor.row_factory = ANALYSIS_ROW_FACTORY
         cursor.execute("SELECT * FROM analyses WHERE id = ?", (analysis_id,))
-        row = cursor.fetchone()
-        if row:
-            analysis_data = dict(row)
-            if 'analysis_date' in analysis_data and analysis_data['analysis_date']:
-                analysis_data['analysis_date'] = datetime.strptime(analysis_data['analysis_date'], '%Y-%m-%d %H:%M:%S')
-            return Analysis(**analysis_data)
-        return None
+        return cursor.fetchone()
 
     def get_analyses_by_user_id(self, user_id: int) -> List[Analysis]:
         conn = self._get_connection()
         cursor = conn.cursor()
+        cursor.row_factory = ANALYSIS_ROW_FACTORY
         cursor.execute("SELECT * FROM analyses WHERE user_id = ? ORDER BY analysis_date DESC", (user_id,))
-        rows = cursor.fetchall()
-        converted_analyses = []
-        for row in rows:
-            analysis_data = dict(row)
-            if 'analysis_date' in analysis_data and analysis_data['analysis_date']:
-                analysis_data['analysis_date'] = datetime.strptime(analysis_data['analysis_date'], '%Y-%m-%d %H:%M:%S')
-            converted_analyses.append(Analysis(**analysis_data))
-        return converted_analyses
+        return cursor.fetchall()
+
+    def get_analysis_details(self, analysis_ids: List[int]) -> tuple[dict, dict]:
+        """
+        Loads recommendations and follow-ups for many analyses at once.
+        Returns two dicts keyed by analysis id: recommendations and follow-ups.
+        """
+        recommendations_by_analysis = {analysis_id: [] for analysis_id in analysis_ids}
+        follow_ups_by_analysis = {analysis_id: [] for analysis_id in analysis_ids}
+        conn = self._get_connection()
+        rec_cursor = conn.cursor()
+        rec_cursor.row_factory = RECOMMENDATION_ROW_FACTORY
+        fu_cursor = conn.cursor()
+        # Stay below SQLite's bound-parameter limit on older builds
+        for start in range(0, len(analysis_ids), IN_CLAUSE_BATCH_SIZE):
+            batch = analysis_ids[start:start + IN_CLAUSE_BATCH_SIZE]
+            placeholders = ", ".join("?" * len(batch))
+
+            rec_cursor.execute(f"SELECT * FROM recommendations WHERE analysis_id IN ({placeholders}) ORDER BY analysis_id, priority DESC", batch)
+            for rec in rec_cursor.fetchall():
+                recommendations_by_analysis[rec.analysis_id].append(rec)
+
+            fu_cursor.execute(f"SELECT * FROM follow_ups WHERE analysis_id IN ({placeholders}) ORDER BY analysis_id, follow_up_date DESC", batch)
+            for row in fu_cursor.fetchall():
+                follow_ups_by_analysis[row['analysis_id']].append(dict(row))
+        return recommendations_by_analysis, follow_ups_by_analysis
+
+    def get_analyses_page(self, user_id: int, page_size: int = 20, cursor: Optional[tuple] = None, summary: bool = False) -> tuple[List[Analysis], Optional[tuple]]:
+        """
+        Returns one page of a user's analyses, newest first, using keyset pagination on (analysis_date, id).
+        cursor is the value returned for the previous page (None for the first page).
+        With summary=True the large gemini_response column is not loaded.
+        Returns the page and the cursor of the next page, or None when this is the last page.
+        """
+        columns = ANALYSIS_SUMMARY_COLUMNS if summary else "*"
+        conn = self._get_connection()
+        db_cursor = conn.cursor()
+        db_cursor.row_factory = ANALYSIS_ROW_FACTORY
+        # Fetch one extra row to learn whether another page follows
+        if cursor is None:
+            db_cursor.execute(
+                f"SELECT {columns} FROM analyses WHERE user_id = ? ORDER BY analysis_date DESC, id DESC LIMIT ?",
+                (user_id, page_size + 1)
+            )
+        else:
+            db_cursor.execute(
+                f"SELECT {columns} FROM analyses WHERE user_id = ? AND (analysis_date, id) < (?, ?) ORDER BY analysis_date DESC, id DESC LIMIT ?",
+                (user_id, cursor[0], cursor[1], page_size + 1)
+            )
+        analyses = db_cursor.fetchall()
+        next_cursor = (analyses[page_size - 1].analysis_date, analyses[page_size - 1].id) if len(analyses) > page_size else None
+        return analyses[:page_size], next_cursor
+
+    def get_analyses_page_with_details(self, user_id: int, page_size: int = 20, cursor: Optional[tuple] = None) -> tuple[List[tuple[Analysis, List[Recommendation], List[dict]]], Optional[tuple]]:
+        """
+        Returns (analysis, recommendations, follow_ups) for one page of a user's analyses,
+        using a constant number of queries instead of two per analysis, plus the next page cursor.
+        """
+        analyses, next_cursor = self.get_analyses_page(user_id, page_size, cursor)
+        recommendations_by_analysis, follow_ups_by_analysis = self.get_analysis_details([a.id for a in analyses])
+        return [(a, recommendations_by_analysis[a.id], follow_ups_by_analysis[a.id]) for a in analyses], next_cursor
+
+    def get_analyses_by_ids(self, analysis_ids: List[int]) -> List[Analysis]:
+        """
+        Loads summary rows for the given ids, in the order given. Ids that no longer exist are skipped.
+        """
+        analyses_by_id = {}
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.row_factory = ANALYSIS_ROW_FACTORY
+        for start in range(0, len(analysis_ids), IN_CLAUSE_BATCH_SIZE):
+            batch = analysis_ids[start:start + IN_CLAUSE_BATCH_SIZE]
+            placeholders = ", ".join("?" * len(batch))
+            cursor.execute(f"SELECT {ANALYSIS_SUMMARY_COLUMNS} FROM analyses WHERE id IN ({placeholders})", batch)
+            for analysis in cursor.fetchall():
+                analyses_by_id[analysis.id] = analysis
+        return [analyses_by_id[analysis_id] for analysis_id in analysis_ids if analysis_id in analyses_by_id]
+
+    def get_analysis_image_paths(self) -> List[tuple[int, str]]:
+        """Returns (id, image_path) for every analysis, oldest first, e.g. to rebuild the similarity index."""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, image_path FROM analyses ORDER BY id")
+        return [(row['id'], row['image_path']) for row in cursor.fetchall()]
+
+    def get_gemini_responses(self) -> List[str]:
+        """Returns every stored raw Gemini analysis response, e.g. to check the response parser against real answers."""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT gemini_response FROM analyses WHERE gemini_response IS NOT NULL ORDER BY id")
+        return [row['gemini_response'] for row in cursor.fetchall()]
+
+    def count_analyses(self, user_id: int) -> int:
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT total_analyses FROM user_stats WHERE user_id = ?", (user_id,))
+        row = cursor.fetchone()
+        return row[0] if row else 0
+
+    def get_analysis_images(self, analysis_id: int) -> List[str]:
+        """Returns the image paths of an analysis in upload order."""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT image_path FROM analysis_images WHERE analysis_id = ? ORDER BY position", (analysis_id,))
+        return [row['image_path'] for row in cursor.fetchall()]
+
+    def count_image_references(self, image_path: str) -> int:
+        """
+        Returns how many references to a stored image file remain, from analyses.image_path and analysis_images.
+        Only zero is meaningful: the first photo of an analysis is referenced from both tables.
+        """
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT (SELECT COUNT(*) FROM analyses WHERE image_path = ?) + (SELECT COUNT(*) FROM analysis_images WHERE image_path = ?)",
+            (image_path, image_path)
+        )
+        return cursor.fetchone()[0]
 
     # Recommendation Operations
     def add_recommendation(self, recommendation: Recommendation) -> Optional[int]:
@@ -131,16 +329,9 @@ class DatabaseService:
     def get_recommendations_by_analysis_id(self, analysis_id: int) -> List[Recommendation]:
         conn = self._get_connection()
         cursor = conn.cursor()
+        cursor.row_factory = RECOMMENDATION_ROW_FACTORY
         cursor.execute("SELECT * FROM recommendations WHERE analysis_id = ? ORDER BY priority DESC", (analysis_id,))
-        rows = cursor.fetchall()
-        converted_recommendations = []
-        for row in rows:
-            rec_data = dict(row)
-            if 'implementation_date' in rec_data and rec_data['implementation_date']:
-                # Assuming DATE is stored as YYYY-MM-DD
-                rec_data['implementation_date'] = datetime.strptime(rec_data['implementation_date'], '%Y-%m-%d').date()
-            converted_recommendations.append(Recommendation(**rec_data))
-        return converted_recommendations
+        return cursor.fetchall()
 
     # Follow-up Operations
     def add_follow_up(self, analysis_id: int, status: str, notes: str) -> Optional[int]:
@@ -157,24 +348,14 @@ class DatabaseService:
         conn = self._get_connection()
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM follow_ups WHERE analysis_id = ? ORDER BY follow_up_date DESC", (analysis_id,))
-        rows = cursor.fetchall()
-        converted_follow_ups = []
-        for row in rows:
-            fu_data = dict(row)
-            if 'follow_up_date' in fu_data and fu_data['follow_up_date']:
-                fu_data['follow_up_date'] = datetime.strptime(fu_data['follow_up_date'], '%Y-%m-%d %H:%M:%S')
-            converted_follow_ups.append(fu_data)
-        return converted_follow_ups
+        # follow_up_date is decoded by the connection's TIMESTAMP converter
+        return [dict(row) for row in cursor.fetchall()]
 
     def delete_analysis(self, analysis_id: int) -> bool:
         conn = self._get_connection()
         cursor = conn.cursor()
         try:
-            # Delete related recommendations first
-            cursor.execute("DELETE FROM recommendations WHERE analysis_id = ?", (analysis_id,))
-            # Delete related follow-ups
-            cursor.execute("DELETE FROM follow_ups WHERE analysis_id = ?", (analysis_id,))
-            # Then delete the analysis itself
+            # Recommendations and follow-ups are removed by ON DELETE CASCADE
             cursor.execute("DELETE FROM analyses WHERE id = ?", (analysis_id,))
             conn.commit()
             print(f"Analysis {analysis_id} and its related data deleted successfully.")
@@ -233,26 +414,136 @@ class DatabaseService:
         rows = cursor.fetchall()
         return [dict(row) for row in rows]
 
-    def get_dashboard_stats(self, user_id: int) -> dict:
+    def get_questions_page(self, page_size: int = 20, cursor: Optional[tuple] = None) -> tuple[List[dict], Optional[tuple]]:
+        """
+        Returns one page of forum questions, newest first, using keyset pagination on (created_at, id).
+        Each question carries its answer_count and last_activity_at.
+        Returns the page and the cursor of the next page, or None when this is the last page.
+        """
         conn = self._get_connection()
-        cursor = conn.cursor()
-
-        # Total analyses
-        cursor.execute("SELECT COUNT(*) FROM analyses WHERE user_id = ?", (user_id,))
-        total_analyses = cursor.fetchone()[0]
+        db_cursor = conn.cursor()
+        # Fetch one extra row to learn whether another page follows
+        if cursor is None:
+            db_cursor.execute(
+                "SELECT q.*, u.name as user_name FROM questions q JOIN users u ON q.user_id = u.id ORDER BY q.created_at DESC, q.id DESC LIMIT ?",
+                (page_size + 1,)
+            )
+        else:
+            db_cursor.execute(
+                "SELECT q.*, u.name as user_name FROM questions q JOIN users u ON q.user_id = u.id WHERE (q.created_at, q.id) < (?, ?) ORDER BY q.created_at DESC, q.id DESC LIMIT ?",
+                (cursor[0], cursor[1], page_size + 1)
+            )
+        rows = db_cursor.fetchall()
+        next_cursor = (rows[page_size - 1]['created_at'], rows[page_size - 1]['id']) if len(rows) > page_size else None
+        return [dict(row) for row in rows[:page_size]], next_cursor
 
-        # Unique diseases detected
-        cursor.execute("SELECT COUNT(DISTINCT disease_detected) FROM analyses WHERE user_id = ? AND disease_detected IS NOT NULL AND disease_detected != 'Unknown' AND disease_detected != 'Healthy'", (user_id,))
-        unique_diseases = cursor.fetchone()[0]
+    def get_answers_for_questions(self, question_ids: List[int]) -> dict:
+        """
+        Loads the answers of many questions at once, oldest first.
+        Returns a dict keyed by question id.
+        """
+        answers_by_question = {question_id: [] for question_id in question_ids}
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        for start in range(0, len(question_ids), IN_CLAUSE_BATCH_SIZE):
+            batch = question_ids[start:start + IN_CLAUSE_BATCH_SIZE]
+            placeholders = ", ".join("?" * len(batch))
+            cursor.execute(
+                f"SELECT a.*, u.name as user_name FROM answers a JOIN users u ON a.user_id = u.id WHERE a.question_id IN ({placeholders}) ORDER BY a.question_id, a.created_at ASC",
+                batch
+            )
+            for row in cursor.fetchall():
+                answers_by_question[row['question_id']].append(dict(row))
+        return answers_by_question
 
-        # Placeholder for active follow-ups (requires a 'status' like 'pending' or 'in_progress')
-        # This query assumes 'follow_ups' table has a 'status' column and we want to count specific statuses
-        cursor.execute("SELECT COUNT(*) FROM follow_ups WHERE analysis_id IN (SELECT id FROM analyses WHERE user_id = ?) AND status IN ('pending', 'in_progress')", (user_id,))
-        active_follow_ups = cursor.fetchone()[0]
+    def search_forum(self, query: str, limit: int = 20, offset: int = 0) -> List[dict]:
+        """
+        Full-text search over question titles, question texts and answers, best matches first (BM25).
+        A question matched through several of its answers is returned once, ranked by its best hit.
+        Returns question dicts like get_questions_page, plus a 'score' (lower is better).
+        """
+        match_expression = _build_forum_search_query(query)
+        if match_expression is None:
+            return []
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        try:
+            # MATERIALIZED keeps bm25() inside the full-text query, where SQLite allows it
+            cursor.execute(f"""
+                WITH hits AS MATERIALIZED (
+                    SELECT question_id, bm25(forum_search, {FORUM_SEARCH_WEIGHTS[0]}, {FORUM_SEARCH_WEIGHTS[1]}) AS score
+                    FROM forum_search WHERE forum_search MATCH ?
+                )
+                SELECT q.*, u.name as user_name, best.score
+                FROM (SELECT question_id, MIN(score) AS score FROM hits GROUP BY question_id) best
+                JOIN questions q ON q.id = best.question_id
+                JOIN users u ON q.user_id = u.id
+                ORDER BY best.score, q.id DESC
+                LIMIT ? OFFSET ?
+            """, (match_expression, limit, offset))
+        except sqlite3.Error as e:
+            print(f"Error searching forum for '{query}': {e}")
+            return []
+        return [dict(row) for row in cursor.fetchall()]
 
+    def get_dashboard_stats(self, user_id: int) -> dict:
+        """
+        Reads the Dashboard counters from the user_stats rollup, which triggers keep current on every write.
+        """
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT total_analyses, unique_diseases, active_follow_ups FROM user_stats WHERE user_id = ?", (user_id,))
+        row = cursor.fetchone()
+        if row is None: # No analyses yet
+            return {"total_analyses": 0, "unique_diseases": 0, "active_follow_ups": 0}
         return {
-            "total_analyses": total_analyses,
-            "unique_diseases": unique_diseases,
-            "active_follow_ups": active_follow_ups
+            "total_analyses": row['total_analyses'],
+            "unique_diseases": row['unique_diseases'],
+            "active_follow_ups": row['active_follow_ups']
         }
 
+    def get_disease_trend(self, user_id: int, period: str = "week", since: Optional[date] = None) -> pd.DataFrame:
+        """
+        Returns analysis counts per disease bucketed by 'week' or 'month', read from the analysis_daily rollup.
+        The frame is indexed by bucket start date with one integer column per disease, ready for st.line_chart.
+        """
+        if period not in TREND_BUCKETS:
+            raise ValueError(f"Unsupported trend period: {period}")
+        placeholders = ", ".join("?" * len(NON_DISEASE_LABELS))
+        params = [user_id, *NON_DISEASE_LABELS]
+        since_clause = ""
+        if since is not None:
+            since_clause = "AND day >= ?"
+            params.append(since.isoformat())
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT {TREND_BUCKETS[period]} AS bucket, disease_detected, SUM(analysis_count) AS analysis_count
+            FROM analysis_daily
+            WHERE user_id = ? AND disease_detected NOT IN ({placeholders}) {since_clause}
+            GROUP BY bucket, disease_detected
+            ORDER BY bucket
+        """, params)
+        rows = cursor.fetchall()
+        if not rows:
+            return pd.DataFrame()
+        buckets, diseases, counts = zip(*((row['bucket'], row['disease_detected'], row['analysis_count']) for row in rows))
+        trend = pd.DataFrame({"bucket": pd.to_datetime(buckets), "disease": diseases, "count": counts})
+        return trend.pivot(index="bucket", columns="disease", values="count").fillna(0).astype(int)
+
+    def rebuild_user_stats(self) -> Optional[int]:
+        """
+        Recomputes the Dashboard rollups from the base tables.
+        Returns the number of users whose stored stats had drifted, or None on error.
+        """
+        conn = self._get_connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            drifted_users = rebuild_user_stats(conn.cursor())
+            conn.commit()
+            return drifted_users
+        except sqlite3.Error as e:
+            print(f"Error rebuilding user stats: {e}")
+            conn.rollback()
+            return None
+
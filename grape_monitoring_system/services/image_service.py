@@ -1,21 +1,77 @@
 import os
-from PIL import Image
+import hashlib
+import tempfile
+import time
+from typing import Optional
+from PIL import Image, ImageOps
 import io
+from config.settings import GEMINI_UPLOAD_MIN_SIDE, JPEG_MIN_QUALITY, JPEG_MAX_QUALITY, MAX_IMAGE_PIXELS
+from utils.validators import validate_image_upload
+
+# PIL's own decompression-bomb check, as a backstop for callers that skip validate_image_upload
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
 
 class ImageService:
     def __init__(self):
         self.upload_dir = "grape_monitoring_system/data/uploads"
         os.makedirs(self.upload_dir, exist_ok=True)
 
-    def save_image(self, image_data: bytes, filename: str) -> str:
+    def _content_path(self, digest: str, extension: str) -> str:
+        # Two levels of 256-way sharding keep every directory small, e.g. uploads/3f/a2/3fa2....jpg
+        return os.path.join(self.upload_dir, digest[:2], digest[2:4], f"{digest}{extension}")
+
+    def save_image(self, image_data: bytes, filename: str, digest: Optional[str] = None) -> str:
+        """
+        Saves image data in the content-addressed store, keyed by its SHA-256 digest.
+        Identical images are stored once; filename only supplies the extension.
+        Pass digest when it is already known (e.g. from preprocess_image) to skip rehashing.
+        Returns the path to the stored image.
+        """
+        return self.store_image(image_data, filename, digest=digest)[0]
+
+    def store_image(self, image_data: bytes, filename: str, digest: Optional[str] = None) -> tuple[str, bool]:
         """
-        Saves image data to the uploads directory.
-        Returns the path to the saved image.
+        Like save_image, but also tells whether this call wrote the file (False when it was already stored),
+        so a caller that stores speculatively only cleans up files it created itself.
         """
-        filepath = os.path.join(self.upload_dir, filename)
-        with open(filepath, "wb") as f:
-            f.write(image_data)
-        return filepath
+        digest = digest or hashlib.sha256(image_data).hexdigest()
+        extension = os.path.splitext(filename)[1].lower() or ".jpg"
+        filepath = self._content_path(digest, extension)
+        if os.path.exists(filepath):
+            return filepath, False
+
+        directory = os.path.dirname(filepath)
+        os.makedirs(directory, exist_ok=True)
+        # Write to a temp file in the same directory and rename it into place, so readers never see a partial image
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(image_data)
+            os.replace(temp_path, filepath)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return filepath, True
+
+    def release_image(self, image_path: str, reference_count: int) -> bool:
+        """
+        Deletes a stored image once no analysis references it any more.
+        Only files inside the content-addressed store are removed.
+        Returns True if the file was deleted.
+        """
+        if reference_count > 0 or not image_path:
+            return False
+        store_root = os.path.abspath(self.upload_dir)
+        absolute_path = os.path.abspath(image_path)
+        # Legacy uploads live directly in upload_dir; content-addressed ones are two shard levels deeper
+        if os.path.dirname(os.path.dirname(os.path.dirname(absolute_path))) != store_root:
+            return False
+        try:
+            os.remove(absolute_path)
+            return True
+        except FileNotFoundError:
+            return False
 
     def get_image_bytes(self, image_path: str) -> bytes:
         """
@@ -24,6 +80,106 @@ class ImageService:
         with open(image_path, "rb") as f:
             return f.read()
 
+    def _encode_jpeg(self, image: Image.Image, quality: Optional[int] = None) -> bytes:
+        output_buffer = io.BytesIO()
+        if quality is None:
+            image.save(output_buffer, format='JPEG')
+        else:
+            image.save(output_buffer, format='JPEG', quality=quality, optimize=True)
+        return output_buffer.getvalue()
+
+    def _encode_jpeg_to_budget(self, image: Image.Image, target_bytes: int) -> tuple[bytes, Image.Image, int, int]:
+        """
+        Encodes at the highest quality that fits target_bytes, binary searching between
+        JPEG_MIN_QUALITY and JPEG_MAX_QUALITY. If even the lowest quality is too large, the image is
+        shrunk step by step, but its shorter side is kept at GEMINI_UPLOAD_MIN_SIDE or more.
+        Returns (jpeg_bytes, encoded_image, quality, baseline_size), where baseline_size is
+        the size at JPEG_MAX_QUALITY and the original resolution.
+        """
+        baseline = self._encode_jpeg(image, JPEG_MAX_QUALITY)
+        if len(baseline) <= target_bytes:
+            return baseline, image, JPEG_MAX_QUALITY, len(baseline)
+
+        current = image
+        while True:
+            low, high = JPEG_MIN_QUALITY, JPEG_MAX_QUALITY - 1
+            best = None
+            smallest = None
+            while low <= high:
+                quality = (low + high) // 2
+                data = self._encode_jpeg(current, quality)
+                if len(data) <= target_bytes:
+                    best = (data, quality)
+                    low = quality + 1
+                else:
+                    smallest = (data, quality)
+                    high = quality - 1
+            if best is not None:
+                return best[0], current, best[1], len(baseline)
+
+            shorter_side = min(current.size)
+            if shorter_side <= GEMINI_UPLOAD_MIN_SIDE:
+                # Resolution floor reached; send the smallest encoding we have rather than degrade further
+                return smallest[0], current, smallest[1], len(baseline)
+            scale = max(0.75, GEMINI_UPLOAD_MIN_SIDE / shorter_side)
+            new_size = (max(1, round(current.width * scale)), max(1, round(current.height * scale)))
+            current = current.resize(new_size, Image.Resampling.LANCZOS)
+
+    def preprocess_image(self, image_data: bytes, max_size=(1024, 1024), target_bytes: Optional[int] = None) -> tuple[bytes, dict]:
+        """
+        Decodes an upload once and returns (jpeg_bytes, metadata) ready for storage and analysis.
+        Uploads failing validate_image_upload raise ValueError before any pixels are decoded.
+        JPEGs are downscaled during decoding via draft mode, EXIF orientation is applied,
+        and the result is encoded as JPEG exactly once, or, with target_bytes, searched for the
+        best quality/resolution that fits that many bytes.
+        metadata holds width, height, original_width, original_height, quality, bytes_saved,
+        encode_ms, the SHA-256 digest of jpeg_bytes and "image", the RGB PIL image jpeg_bytes was encoded from,
+        so the quality gate and feature extraction do not have to decode the JPEG again.
+        """
+        upload_error = validate_image_upload(image_data)
+        if upload_error:
+            raise ValueError(upload_error)
+        image = Image.open(io.BytesIO(image_data))
+        original_width, original_height = image.size
+        # draft() only picks a DCT scale that still covers the requested box, so the thumbnail below stays exact.
+        # The box is square because EXIF rotation may swap width and height after decoding.
+        longest_side = max(max_size)
+        image.draft('RGB', (longest_side, longest_side))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(max_size, Image.Resampling.LANCZOS)
+        if image.mode != 'RGB':
+            # JPEG has no alpha channel; flatten transparent areas onto white instead of black
+            if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            else:
+                image = image.convert('RGB')
+
+        encode_start = time.perf_counter()
+        if target_bytes:
+            jpeg_bytes, image, quality, baseline_size = self._encode_jpeg_to_budget(image, target_bytes)
+        else:
+            jpeg_bytes = self._encode_jpeg(image)
+            quality, baseline_size = None, len(jpeg_bytes)
+        encode_ms = (time.perf_counter() - encode_start) * 1000
+        metadata = {
+            "width": image.width,
+            "height": image.height,
+            "original_width": original_width,
+            "original_height": original_height,
+            "quality": quality,
+            "bytes_saved": baseline_size - len(jpeg_bytes),
+            "encode_ms": encode_ms,
+            "digest": hashlib.sha256(jpeg_bytes).hexdigest(),
+            "image": image
+        }
+        if target_bytes:
+            print(f"Encoded upload to {len(jpeg_bytes)} bytes at {image.width}x{image.height}, quality {quality}: "
+                  f"saved {metadata['bytes_saved']} bytes in {encode_ms:.1f} ms")
+        return jpeg_bytes, metadata
+
     def resize_image(self, image_data: bytes, max_size=(1024, 1024)) -> bytes:
         """
         Resizes an image if it exceeds max_size, maintaining aspect ratio.
@@ -0,0 +1,132 @@
+import sqlite3
+import json
+import threading
+from typing import Optional
+from config.database import connection_manager
+from config.settings import GEMINI_CACHE_TTL_SECONDS, GEMINI_CACHE_MAX_ENTRIES, GEMINI_CACHE_HIT_FLUSH_SIZE
+
+class ResponseCache:
+    """
+    Persistent cache of Gemini image analyses in SQLite, keyed by (image digest, prompt version, model name).
+    Entries expire after ttl_seconds; beyond max_entries the least recently used ones are evicted.
+    Lookups are plain reads; hit counts and recency are buffered in memory and written in batches
+    (on the next put, or every hit_flush_size hits), so a lookup never takes the database write lock.
+    """
+
+    def __init__(self, ttl_seconds: int = GEMINI_CACHE_TTL_SECONDS, max_entries: int = GEMINI_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._pending_hits = {} # (image_digest, prompt_version, model_name) -> hits not yet written; guarded by _lock
+        self.hit_flush_size = GEMINI_CACHE_HIT_FLUSH_SIZE
+
+    def get(self, image_digest: str, prompt_version: str, model_name: str) -> Optional[tuple[dict, str]]:
+        """
+        Returns (parsed_result, raw_response) for a fresh entry, or None on a miss.
+        """
+        conn = connection_manager.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"""
+                SELECT parsed_result, raw_response FROM gemini_response_cache
+                WHERE image_digest = ? AND prompt_version = ? AND model_name = ?
+                AND created_at >= datetime('now', '-{int(self.ttl_seconds)} seconds')
+                """,
+                (image_digest, prompt_version, model_name)
+            )
+            row = cursor.fetchone()
+        except sqlite3.Error as e:
+            print(f"Error reading Gemini response cache: {e}")
+            row = None
+
+        key = (image_digest, prompt_version, model_name)
+        with self._lock:
+            if row is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._pending_hits[key] = self._pending_hits.get(key, 0) + 1
+            flush_due = sum(self._pending_hits.values()) >= self.hit_flush_size
+        if flush_due:
+            try:
+                with conn:
+                    self._flush_hits(conn.cursor())
+            except sqlite3.Error as e:
+                print(f"Error writing Gemini response cache hit counts: {e}")
+        return json.loads(row['parsed_result']), row['raw_response']
+
+    def _flush_hits(self, cursor: sqlite3.Cursor):
+        """Writes the buffered hit counts and recency inside the caller's transaction."""
+        with self._lock:
+            pending_hits, self._pending_hits = self._pending_hits, {}
+        if not pending_hits:
+            return
+        try:
+            cursor.executemany(
+                """
+                UPDATE gemini_response_cache
+                SET hit_count = hit_count + ?, last_hit_at = CURRENT_TIMESTAMP
+                WHERE image_digest = ? AND prompt_version = ? AND model_name = ?
+                """,
+                [(hits, *key) for key, hits in pending_hits.items()]
+            )
+        except sqlite3.Error:
+            # Keep the counts for the next attempt
+            with self._lock:
+                for key, hits in pending_hits.items():
+                    self._pending_hits[key] = self._pending_hits.get(key, 0) + hits
+            raise
+
+    def put(self, image_digest: str, prompt_version: str, model_name: str, parsed_result: dict, raw_response: str):
+        """
+        Stores an analysis, then drops expired entries and trims the cache to max_entries.
+        """
+        conn = connection_manager.get_connection()
+        try:
+            with conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    INSERT OR REPLACE INTO gemini_response_cache (image_digest, prompt_version, model_name, raw_response, parsed_result)
+                    VALUES (?, ?, ?, ?, ?)
+                    """,
+                    (image_digest, prompt_version, model_name, raw_response, json.dumps(parsed_result, ensure_ascii=False))
+                )
+                # Recency has to be current before the least recently used entries are picked for eviction
+                self._flush_hits(cursor)
+                cursor.execute(
+                    f"DELETE FROM gemini_response_cache WHERE created_at < datetime('now', '-{int(self.ttl_seconds)} seconds')"
+                )
+                evicted = cursor.rowcount
+                cursor.execute(
+                    """
+                    DELETE FROM gemini_response_cache WHERE rowid IN (
+                        SELECT rowid FROM gemini_response_cache
+                        ORDER BY COALESCE(last_hit_at, created_at) DESC
+                        LIMIT -1 OFFSET ?
+                    )
+                    """,
+                    (self.max_entries,)
+                )
+                evicted += cursor.rowcount
+        except sqlite3.Error as e:
+            print(f"Error writing Gemini response cache: {e}")
+            return
+
+        with self._lock:
+            self._evictions += evicted
+
+    def stats(self) -> dict:
+        """Hit/miss/eviction counters for this process."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": self._hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,209 @@
+import os
+import sys
+import threading
+import numpy as np
+from PIL import Image
+from typing import Iterable, Optional, Union
+from config.settings import SIMILARITY_INDEX_DIR
+from utils.image_utils import downscaled_rgb
+
+FEATURE_THUMBNAIL_SIZE = 128 # Longest side of the copy features are computed on
+HSV_BINS = (8, 4, 4) # Hue x saturation x value colour histogram
+TEXTURE_GRID = 4 # Gradient-orientation histograms over a 4x4 grid of cells
+TEXTURE_ORIENTATIONS = 4
+FEATURE_DIM = HSV_BINS[0] * HSV_BINS[1] * HSV_BINS[2] + TEXTURE_GRID * TEXTURE_GRID * TEXTURE_ORIENTATIONS
+DELETED_ID = -1 # Written over the id of a row whose analysis was deleted
+
+
+def extract_features(image_data: Union[bytes, Image.Image]) -> np.ndarray:
+    """
+    Describes an image by its colour distribution (HSV histogram) and leaf texture
+    (magnitude-weighted gradient orientations per grid cell).
+    image_data is the encoded image or an already decoded PIL image, which is not decoded again.
+    Returns a unit-length float32 vector, so the dot product of two vectors is their cosine similarity.
+    """
+    image = downscaled_rgb(image_data, FEATURE_THUMBNAIL_SIZE)
+
+    hsv = np.asarray(image.convert('HSV'), dtype=np.int32)
+    h_bins, s_bins, v_bins = HSV_BINS
+    bin_index = ((hsv[..., 0] * h_bins) >> 8) * s_bins * v_bins + ((hsv[..., 1] * s_bins) >> 8) * v_bins + ((hsv[..., 2] * v_bins) >> 8)
+    colour = np.bincount(bin_index.ravel(), minlength=h_bins * s_bins * v_bins).astype(np.float32)
+    colour = np.sqrt(colour / colour.sum()) # Hellinger mapping keeps a few dominant bins from swamping the rest
+
+    gray = np.asarray(image.convert('L'), dtype=np.float32)
+    gx = gray[1:-1, 2:] - gray[1:-1, :-2]
+    gy = gray[2:, 1:-1] - gray[:-2, 1:-1]
+    magnitude = np.hypot(gx, gy)
+    orientation = ((np.arctan2(gy, gx) % np.pi) / np.pi * TEXTURE_ORIENTATIONS).astype(np.int32) % TEXTURE_ORIENTATIONS
+    rows = np.arange(gray.shape[0] - 2) * TEXTURE_GRID // max(gray.shape[0] - 2, 1)
+    cols = np.arange(gray.shape[1] - 2) * TEXTURE_GRID // max(gray.shape[1] - 2, 1)
+    cell = rows[:, None] * TEXTURE_GRID + cols[None, :]
+    texture = np.bincount((cell * TEXTURE_ORIENTATIONS + orientation).ravel(), weights=magnitude.ravel(),
+                          minlength=TEXTURE_GRID * TEXTURE_GRID * TEXTURE_ORIENTATIONS).astype(np.float32)
+    texture_norm = np.linalg.norm(texture)
+    if texture_norm > 0:
+        texture /= texture_norm
+
+    features = np.concatenate([colour, texture])
+    return features / np.linalg.norm(features)
+
+
+class SimilarityIndex:
+    """
+    Append-only index of image feature vectors, aligned row by row with analysis ids.
+    Vectors live in features.f32 (float32, FEATURE_DIM per row) and ids in ids.i64; both are memory-mapped
+    for queries, so the index is not held in Python memory and new rows are just appended to the files.
+    remove() marks the rows of a deleted analysis in place instead of rewriting the files; rebuild() compacts them away.
+    """
+
+    def __init__(self, index_dir: str = SIMILARITY_INDEX_DIR):
+        os.makedirs(index_dir, exist_ok=True)
+        self.features_path = os.path.join(index_dir, "features.f32")
+        self.ids_path = os.path.join(index_dir, "ids.i64")
+        self._lock = threading.Lock()
+        self._count = None
+        self._features = None
+        self._ids = None
+
+    def _stored_count(self) -> int:
+        # A crash between the two appends can leave one file a row ahead; only complete rows count
+        features_rows = os.path.getsize(self.features_path) // (FEATURE_DIM * 4) if os.path.exists(self.features_path) else 0
+        id_rows = os.path.getsize(self.ids_path) // 8 if os.path.exists(self.ids_path) else 0
+        return min(features_rows, id_rows)
+
+    def _load(self):
+        """(Re)maps the files when they have grown since the last query. Caller holds the lock."""
+        count = self._stored_count()
+        if count == self._count:
+            return
+        if count == 0:
+            self._features = np.empty((0, FEATURE_DIM), dtype=np.float32)
+            self._ids = np.empty(0, dtype=np.int64)
+        else:
+            self._features = np.memmap(self.features_path, dtype=np.float32, mode='r', shape=(count, FEATURE_DIM))
+            self._ids = np.memmap(self.ids_path, dtype=np.int64, mode='r', shape=(count,))
+        self._count = count
+
+    def _unmap(self):
+        """
+        Drops this process' memory maps, so the files can be truncated or replaced (Windows refuses both while
+        a file is mapped). Queries only use the maps under the lock, so no other reference survives. Caller holds the lock.
+        """
+        self._features = None
+        self._ids = None
+        self._count = None
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._load()
+            return self._count
+
+    def add(self, analysis_id: int, image_data: Union[bytes, Image.Image]) -> bool:
+        """Appends one analysis to the index. Returns False if the image could not be read."""
+        try:
+            features = extract_features(image_data)
+        except Exception as e:
+            print(f"Error extracting features for analysis {analysis_id}: {e}")
+            return False
+        with self._lock:
+            count = self._stored_count()
+            # Drop any partial row left by an interrupted append before writing the next one
+            for path, row_size in ((self.features_path, FEATURE_DIM * 4), (self.ids_path, 8)):
+                if os.path.exists(path) and os.path.getsize(path) != count * row_size:
+                    self._unmap()
+                    os.truncate(path, count * row_size)
+            with open(self.features_path, "ab") as f:
+                f.write(features.astype(np.float32).tobytes())
+            with open(self.ids_path, "ab") as f:
+                f.write(np.array([analysis_id], dtype=np.int64).tobytes())
+        return True
+
+    def query(self, image_data: Union[bytes, Image.Image], k: int = 5, exclude_ids: Optional[Iterable[int]] = None) -> list[tuple[int, float]]:
+        """
+        Returns up to k (analysis_id, similarity) pairs for the stored images closest to image_data,
+        most similar first. Similarity is cosine similarity in [0, 1] for these non-negative features.
+        """
+        query_features = extract_features(image_data)
+        excluded = set(exclude_ids or ())
+        excluded.add(DELETED_ID)
+        with self._lock:
+            # The maps are only touched under the lock, so add() and rebuild() can safely drop them
+            self._load()
+            if len(self._ids) == 0 or k <= 0:
+                return []
+            scores = self._features @ query_features
+            scores[self._ids == DELETED_ID] = -np.inf
+            # Over-fetch to leave room for excluded and duplicate ids, then sort only the candidates
+            candidates = min(len(scores), k + len(excluded) + k)
+            top = np.argpartition(-scores, candidates - 1)[:candidates]
+            top = top[np.argsort(-scores[top])]
+            top_ids = self._ids[top].tolist()
+
+        results = []
+        seen = set()
+        for row, analysis_id in zip(top, top_ids):
+            if analysis_id in excluded or analysis_id in seen:
+                continue
+            seen.add(analysis_id)
+            results.append((analysis_id, float(scores[row])))
+            if len(results) == k:
+                break
+        return results
+
+    def remove(self, analysis_id: int) -> int:
+        """Marks every row of analysis_id as deleted, so queries stop returning it. Returns the number of rows marked."""
+        with self._lock:
+            self._load()
+            rows = np.flatnonzero(self._ids == analysis_id)
+            if len(rows) == 0:
+                return 0
+            # Written through the file, not the read-only map; the map sees the change on the next query
+            with open(self.ids_path, "r+b") as f:
+                for row in rows:
+                    f.seek(int(row) * 8)
+                    f.write(np.array([DELETED_ID], dtype=np.int64).tobytes())
+        return len(rows)
+
+    def rebuild(self, items: Iterable[tuple[int, bytes]]) -> int:
+        """
+        Replaces the index with features for the given (analysis_id, image_data) pairs.
+        The new files are written aside and swapped in, so concurrent queries keep seeing the old index.
+        Returns the number of indexed images.
+        """
+        features_tmp = self.features_path + ".tmp"
+        ids_tmp = self.ids_path + ".tmp"
+        indexed = 0
+        with open(features_tmp, "wb") as features_file, open(ids_tmp, "wb") as ids_file:
+            for analysis_id, image_data in items:
+                try:
+                    features = extract_features(image_data)
+                except Exception as e:
+                    print(f"Error extracting features for analysis {analysis_id}: {e}")
+                    continue
+                features_file.write(features.astype(np.float32).tobytes())
+                ids_file.write(np.array([analysis_id], dtype=np.int64).tobytes())
+                indexed += 1
+        with self._lock:
+            self._unmap()
+            os.replace(features_tmp, self.features_path)
+            os.replace(ids_tmp, self.ids_path)
+        return indexed
+
+
+if __name__ == '__main__':
+    if '--rebuild' in sys.argv:
+        from config.database import init_db
+        from services.database_service import DatabaseService
+        from services.image_service import ImageService
+
+        init_db()
+        db_service = DatabaseService()
+        image_service = ImageService()
+
+        def stored_images():
+            for analysis_id, image_path in db_service.get_analysis_image_paths():
+                if image_path and os.path.exists(image_path):
+                    yield analysis_id, image_service.get_image_bytes(image_path)
+
+        indexed = SimilarityIndex().rebuild(stored_images())
+        print(f"Similarity index rebuilt with {indexed} image(s).")
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The application imports its packages from the project directory (e.g. "from config.settings import ..."),
+# the same way `streamlit run app.py` does from there
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
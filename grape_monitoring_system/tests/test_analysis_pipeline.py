@@ -0,0 +1,71 @@
+import os
+import threading
+
+import pytest
+
+pytest.importorskip("google.generativeai")
+pytest.importorskip("requests")
+
+from core.analysis_pipeline import AnalysisPipeline
+from services.image_service import ImageService
+
+
+class RacingImageService(ImageService):
+    """Deletes the file right after the first store, like another analysis releasing it at that moment."""
+
+    def __init__(self, upload_dir):
+        self.upload_dir = upload_dir
+        self.stores = 0
+
+    def store_image(self, image_data, filename, digest=None):
+        self.stores += 1
+        image_path, created = super().store_image(image_data, filename, digest=digest)
+        if self.stores == 1:
+            os.remove(image_path)
+        return image_path, created
+
+
+class NoReferences:
+    def count_image_references(self, image_path):
+        return 0
+
+
+def make_pipeline(image_service):
+    pipeline = AnalysisPipeline.__new__(AnalysisPipeline)
+    pipeline.image_service = image_service
+    pipeline.db_service = NoReferences()
+    pipeline._pending_images = {}
+    pipeline._images_lock = threading.Lock()
+    return pipeline
+
+
+def test_image_released_before_registration_is_written_again(tmp_path):
+    image_service = RacingImageService(str(tmp_path))
+    pipeline = make_pipeline(image_service)
+
+    [(image_path, created)] = pipeline._store_images([(b"jpeg bytes", "ab" * 32)])
+    assert os.path.exists(image_path)
+    assert created
+    assert image_service.stores == 2
+    assert pipeline._pending_images == {image_path: 1}
+
+    pipeline._finish_images([(image_path, created)], release=True)
+    assert not os.path.exists(image_path)
+    assert pipeline._pending_images == {}
+
+
+def test_shared_image_is_kept_until_the_last_analysis_finishes(tmp_path):
+    image_service = ImageService.__new__(ImageService)
+    image_service.upload_dir = str(tmp_path)
+    pipeline = make_pipeline(image_service)
+
+    first = pipeline._store_images([(b"jpeg bytes", "cd" * 32)])
+    second = pipeline._store_images([(b"jpeg bytes", "cd" * 32)])
+    image_path = first[0][0]
+    assert second == [(image_path, False)]
+
+    pipeline._finish_images(first, release=True)
+    assert os.path.exists(image_path)
+    pipeline._finish_images(second, release=True) # Not created by the second analysis, so it stays
+    assert os.path.exists(image_path)
+    assert pipeline._pending_images == {}
@@ -0,0 +1,153 @@
+import sqlite3
+
+import pytest
+
+from config import database
+from models.analysis import Analysis
+from models.recommendation import Recommendation
+from models.user import User
+from services import database_service
+from services.database_service import DatabaseService
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "database.db")
+    monkeypatch.setattr(database, "DATABASE_NAME", path)
+    database.init_db()
+    return path
+
+
+@pytest.fixture
+def service(db_path, monkeypatch):
+    manager = database.ConnectionManager(db_path)
+    monkeypatch.setattr(database_service, "connection_manager", manager)
+    yield DatabaseService()
+    manager.close_connection()
+
+
+def schema(path):
+    conn = sqlite3.connect(path)
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        objects = conn.execute("SELECT type, name, sql FROM sqlite_master ORDER BY type, name").fetchall()
+        return version, objects
+    finally:
+        conn.close()
+
+
+def populate(service):
+    user_id = service.add_user(User(name="Ayşe", email="ayse@example.com", password_hash="x"))
+    bundle = service.save_analysis_bundle(
+        Analysis(user_id=user_id, image_path="uploads/a.jpg", disease_detected="Mildew", confidence_score=0.9, gemini_response="{}"),
+        [Recommendation(recommendation_type="tedavi", description="Fungisit", priority=4)],
+        follow_ups=[{"status": "Beklemede", "notes": ""}],
+        image_paths=["uploads/a.jpg", "uploads/b.jpg"],
+    )
+    question_id = service.add_question(user_id, "Yapraklarda leke", "Ne yapmalıyım?")
+    service.add_answer(question_id, user_id, "Fungisit uygulayın")
+    return user_id, bundle["analysis_id"], question_id
+
+
+def populate_second_page(service):
+    user_id = service.get_user_by_email("ayse@example.com").id
+    service.save_analysis_bundle(
+        Analysis(user_id=user_id, image_path="uploads/c.jpg", disease_detected="Sağlıklı", confidence_score=0.8, gemini_response="{}"),
+        [Recommendation(recommendation_type="prevention", description="Gözleme devam", priority=1)],
+    )
+    question_id = service.add_question(user_id, "Sulama", "Ne sıklıkla?")
+    service.add_answer(question_id, user_id, "Haftada bir")
+
+
+def test_init_db_reaches_current_version_and_rerun_is_a_no_op(db_path, capsys):
+    version, objects = schema(db_path)
+    assert version == database.SCHEMA_VERSION
+    capsys.readouterr()
+
+    database.init_db()
+    assert capsys.readouterr().out == ""
+    assert schema(db_path) == (version, objects)
+
+
+def test_foreign_keys_are_consistent(service):
+    populate(service)
+    conn = service._get_connection()
+    assert conn.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+    assert conn.execute("PRAGMA foreign_key_check").fetchall() == []
+
+
+def test_deleting_an_analysis_cascades_to_its_children(service):
+    user_id, analysis_id, _ = populate(service)
+    conn = service._get_connection()
+
+    assert service.delete_analysis(analysis_id)
+    for table in ("recommendations", "follow_ups", "analysis_images"):
+        assert conn.execute(f"SELECT COUNT(*) FROM {table} WHERE analysis_id = ?", (analysis_id,)).fetchone()[0] == 0
+    assert service.get_dashboard_stats(user_id)["total_analyses"] == 0
+    assert conn.execute("PRAGMA foreign_key_check").fetchall() == []
+
+
+def test_deleting_a_question_cascades_to_its_answers(service):
+    _, _, question_id = populate(service)
+    conn = service._get_connection()
+
+    with conn:
+        conn.execute("DELETE FROM questions WHERE id = ?", (question_id,))
+    assert conn.execute("SELECT COUNT(*) FROM answers WHERE question_id = ?", (question_id,)).fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM forum_search").fetchone()[0] == 0
+
+
+def query_plans(service, run):
+    """Runs run(service) and returns {sql: plan details} for every SELECT it issued."""
+    conn = service._get_connection()
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        run(service)
+    finally:
+        conn.set_trace_callback(None)
+    return {
+        sql: [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+        for sql in statements if sql.lstrip().upper().startswith("SELECT")
+    }
+
+
+def history_pages(service):
+    user_id = service.get_user_by_email("ayse@example.com").id
+    _, next_cursor = service.get_analyses_page_with_details(user_id, page_size=1)
+    service.get_analyses_page(user_id, page_size=1, cursor=next_cursor, summary=True)
+
+
+def forum_pages(service):
+    questions, next_cursor = service.get_questions_page(page_size=1)
+    service.get_answers_for_questions([question["id"] for question in questions])
+    service.get_questions_page(page_size=1, cursor=next_cursor)
+
+
+def dashboard(service):
+    user_id = service.get_user_by_email("ayse@example.com").id
+    service.get_dashboard_stats(user_id)
+    service.get_analyses_page(user_id, page_size=5, summary=True)
+    service.get_disease_trend(user_id, period="week")
+
+
+@pytest.mark.parametrize("run, indexes", [
+    (history_pages, {"idx_analyses_user_date", "idx_recommendations_analysis", "idx_follow_ups_analysis"}),
+    (forum_pages, {"idx_questions_created", "idx_answers_question"}),
+    (dashboard, {"idx_analyses_user_date"}),
+])
+def test_page_queries_use_indexes(service, run, indexes):
+    populate(service)
+    populate_second_page(service)
+    plans = query_plans(service, run)
+    assert plans
+
+    used = set()
+    for sql, details in plans.items():
+        for detail in details:
+            # Every table access is an index search/scan, never a full table scan
+            if detail.startswith("SCAN") and "INDEX" not in detail and "VIRTUAL TABLE" not in detail:
+                pytest.fail(f"Full table scan in {sql!r}: {details}")
+            used.update(word for word in detail.split() if word.startswith("idx_"))
+    assert indexes <= used
+
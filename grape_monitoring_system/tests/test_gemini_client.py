@@ -0,0 +1,114 @@
+import threading
+
+import pytest
+
+pytest.importorskip("google.generativeai")
+
+from core import gemini_client as gemini_client_module
+
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeTextModel:
+    """Streams the given chunks; fail_after makes the upstream response raise after that many chunks."""
+
+    def __init__(self, chunks, fail_after=None):
+        self.chunks = chunks
+        self.fail_after = fail_after
+        self.calls = 0
+        self.closed = 0
+
+    def generate_content(self, prompt, stream=False, generation_config=None):
+        self.calls += 1
+
+        def response():
+            try:
+                for index, text in enumerate(self.chunks):
+                    if index == self.fail_after:
+                        raise ConnectionError("stream reset")
+                    yield FakeChunk(text)
+            finally:
+                self.closed += 1
+        return response()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(gemini_client_module, "GEMINI_API_KEY", "test-key")
+    return gemini_client_module.GeminiClient()
+
+
+def read_all(stream):
+    return "".join(chunk.text for chunk in stream)
+
+
+def test_joiner_reads_full_answer_after_leader_stops_early(client):
+    client.text_model = FakeTextModel(["a", "b", "c"])
+    leader = client.generate_text_stream("prompt")
+    joiner = client.generate_text_stream("prompt")
+
+    first = iter(leader)
+    assert next(first).text == "a"
+    first.close() # The leader's page was rerun
+
+    assert read_all(joiner) == "abc"
+    assert client.text_model.calls == 1
+    assert client.stats()["coalesced_calls"] == 1
+    assert client.stats()["in_flight"] == 0
+
+
+def test_late_joiner_replays_chunks_already_read(client):
+    client.text_model = FakeTextModel(["a", "b", "c"])
+    leader = iter(client.generate_text_stream("prompt"))
+    assert next(leader).text == "a"
+    assert next(leader).text == "b"
+
+    joiner = client.generate_text_stream("prompt")
+    assert read_all(joiner) == "abc"
+    assert "".join(chunk.text for chunk in leader) == "c"
+    assert client.text_model.calls == 1
+
+
+def test_abandoned_stream_is_not_joined(client):
+    client.text_model = FakeTextModel(["a", "b", "c"])
+    leader = iter(client.generate_text_stream("prompt"))
+    next(leader)
+    leader.close()
+    assert client.text_model.closed == 1
+
+    assert read_all(client.generate_text_stream("prompt")) == "abc"
+    assert client.text_model.calls == 2
+
+
+def test_joiner_started_from_another_thread_gets_every_chunk(client):
+    client.text_model = FakeTextModel([str(n) for n in range(50)])
+    streams = [client.generate_text_stream("prompt") for _ in range(4)]
+    results = [None] * len(streams)
+
+    def read(index):
+        results[index] = read_all(streams[index])
+
+    threads = [threading.Thread(target=read, args=(index,)) for index in range(len(streams))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["".join(str(n) for n in range(50))] * len(streams)
+    assert client.text_model.calls == 1
+
+
+def test_upstream_error_reaches_every_reader(client):
+    client.text_model = FakeTextModel(["a", "b", "c"], fail_after=1)
+    leader = client.generate_text_stream("prompt")
+    joiner = client.generate_text_stream("prompt")
+
+    for stream in (leader, joiner):
+        chunks = []
+        with pytest.raises(ConnectionError):
+            for chunk in stream:
+                chunks.append(chunk.text)
+        assert chunks == ["a"]
+    assert client.stats()["in_flight"] == 0
@@ -0,0 +1,83 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw, ImageFilter
+
+from utils.image_quality import assess_image_quality
+
+SIZE = (640, 480)
+
+
+def leaf_photo() -> Image.Image:
+    """A textured green leaf with darker veins filling most of the frame, on a brown soil background."""
+    rng = np.random.default_rng(7)
+    pixels = np.empty((SIZE[1], SIZE[0], 3), dtype=np.float32)
+    pixels[:] = (110, 80, 50)
+    image = Image.fromarray(pixels.astype(np.uint8))
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((60, 40, 580, 440), fill=(70, 140, 45))
+    for offset in range(-200, 201, 40):
+        draw.line((320, 240, 320 + offset, 40 if offset % 80 else 440), fill=(40, 95, 30), width=3)
+    pixels = np.asarray(image, dtype=np.float32) + rng.normal(0, 12, (SIZE[1], SIZE[0], 3))
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+def exposed(image: Image.Image, factor: float, offset: float = 0, noise: float = 6) -> Image.Image:
+    """Compresses the tonal range like a badly exposed shot; sensor noise keeps the detail a sharp photo has."""
+    rng = np.random.default_rng(11)
+    pixels = np.asarray(image, dtype=np.float32) * factor + offset + rng.normal(0, noise, (SIZE[1], SIZE[0], 3))
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+def grey_wall() -> Image.Image:
+    """A sharp, well exposed photo without any plant: grey bricks."""
+    image = Image.new("RGB", SIZE, (130, 130, 135))
+    draw = ImageDraw.Draw(image)
+    for y in range(0, SIZE[1], 30):
+        draw.line((0, y, SIZE[0], y), fill=(70, 70, 75), width=2)
+        for x in range((y // 30) % 2 * 30, SIZE[0], 60):
+            draw.line((x, y, x, y + 30), fill=(70, 70, 75), width=2)
+    return image
+
+
+def jpeg(image: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+FIXTURES = {
+    "sharp leaf": lambda: leaf_photo(),
+    "blurred": lambda: leaf_photo().filter(ImageFilter.GaussianBlur(8)),
+    "under-exposed": lambda: exposed(leaf_photo(), 0.12, 6, noise=10),
+    "over-exposed": lambda: exposed(leaf_photo(), 0.2, 210, noise=10),
+    "no green": lambda: grey_wall(),
+}
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("sharp leaf", []),
+    ("blurred", ["bulanık"]),
+    ("under-exposed", ["karanlık"]),
+    ("over-exposed", ["aşırı pozlanmış"]),
+    ("no green", ["yaprak veya bitki bulunamadı"]),
+])
+def test_quality_verdicts(name, expected):
+    quality = assess_image_quality(jpeg(FIXTURES[name]()))
+    assert len(quality["issues"]) == len(expected), quality
+    for issue, keyword in zip(quality["issues"], expected):
+        assert keyword in issue
+
+
+def test_measurements_are_reported():
+    quality = assess_image_quality(jpeg(leaf_photo()))
+    assert quality["vegetation_ratio"] > 0.5
+    assert 0 <= quality["dark_fraction"] <= 1 and 0 <= quality["bright_fraction"] <= 1
+
+
+@pytest.mark.parametrize("name", list(FIXTURES))
+def test_decoded_image_gets_the_same_verdict_as_its_bytes(name):
+    image = FIXTURES[name]()
+    assert assess_image_quality(image)["issues"] == assess_image_quality(jpeg(image))["issues"]
+    assert image.size == SIZE # The caller's image is left untouched
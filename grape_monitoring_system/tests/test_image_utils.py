@@ -0,0 +1,55 @@
+import io
+import struct
+
+import pytest
+from PIL import Image
+
+from utils.image_utils import preview_thumbnail, probe_image_header
+
+
+def encoded(image_format: str, size=(48, 32), **options) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (60, 140, 50)).save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+def with_app_segments(jpeg: bytes, total_bytes: int) -> bytes:
+    """Inserts APP2 segments (max 64 KiB each, like a large ICC profile) between SOI and the frame header."""
+    segments = []
+    while total_bytes > 0:
+        payload = min(total_bytes, 65533)
+        segments.append(b"\xff\xe2" + struct.pack(">H", payload + 2) + b"\0" * payload)
+        total_bytes -= payload
+    return jpeg[:2] + b"".join(segments) + jpeg[2:]
+
+
+@pytest.mark.parametrize("image_format", ["PNG", "JPEG", "WEBP"])
+def test_probe_reads_dimensions(image_format):
+    assert probe_image_header(encoded(image_format)) == {"format": image_format, "width": 48, "height": 32}
+
+
+def test_probe_finds_jpeg_frame_after_large_metadata():
+    data = with_app_segments(encoded("JPEG", size=(640, 480)), 1024 * 1024)
+    assert probe_image_header(data) == {"format": "JPEG", "width": 640, "height": 480}
+
+
+def test_progressive_jpeg():
+    assert probe_image_header(encoded("JPEG", progressive=True)) == {"format": "JPEG", "width": 48, "height": 32}
+
+
+@pytest.mark.parametrize("data", [
+    b"",
+    b"GIF89a" + b"\0" * 32,
+    b"\xff\xd8\xff\xe0\x00\x10JFIF",
+    b"\x89PNG\r\n\x1a\n" + b"\0" * 8,
+])
+def test_probe_rejects_unreadable_data(data):
+    assert probe_image_header(data) is None
+
+
+def test_preview_thumbnail_is_small_and_upright():
+    exif = Image.Exif()
+    exif[0x0112] = 6 # Stored sideways, shown rotated by 90 degrees
+    thumbnail = preview_thumbnail(encoded("JPEG", size=(1600, 1200), exif=exif), 400)
+    assert thumbnail.size == (300, 400)
+    assert thumbnail.mode == "RGB"
@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+from core.json_stream import JsonArrayStreamParser, iter_json_array
+
+ITEMS = [
+    {"type": "tedavi", "description": "Köşeli [parantez] ve {süslü} içerir", "priority": 4},
+    {"type": "önleme", "description": "Tırnak \" ve ters bölü \\ içerir", "priority": 2},
+]
+ARRAY = json.dumps(ITEMS, ensure_ascii=False)
+
+
+def feed_in_chunks(text, size):
+    parser = JsonArrayStreamParser()
+    elements = []
+    for start in range(0, len(text), size):
+        elements.extend(parser.feed(text[start:start + size]))
+    return elements, parser
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1000])
+def test_chunks_split_anywhere_inside_strings_and_escapes(size):
+    elements, parser = feed_in_chunks(ARRAY, size)
+    assert elements == ITEMS
+    assert parser.finished
+
+
+def test_elements_are_returned_as_soon_as_they_close():
+    parser = JsonArrayStreamParser()
+    first, rest = ARRAY.split("}, ", 1)
+    assert parser.feed(first + "}, ") == ITEMS[:1]
+    assert parser.feed(rest) == ITEMS[1:]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("```json\n" + ARRAY + "\n```", ITEMS),
+    ("İşte öneriler: " + ARRAY, ITEMS),
+    ('Use "[" carefully [{"a": 1}]', [{"a": 1}]),
+    ("Notlar [1] ve [] sonra " + ARRAY, ITEMS),
+    ('Sonuç:\n[\n  {"a": 1}\n]', [{"a": 1}]),
+    ('{"recommendations": ' + ARRAY + "}", []),
+    ('{"note": "x"} ' + ARRAY, ITEMS),
+    ("[]", []),
+    ("no array at all", []),
+])
+def test_where_the_array_starts(text, expected):
+    for size in (1, len(text)):
+        assert feed_in_chunks(text, size)[0] == expected
+
+
+def test_non_object_elements():
+    text = '[{"a": 1}, 2, "x ] {", [3, 4], null, {"b": 2}]'
+    elements, parser = feed_in_chunks(text, 4)
+    # Scalars are skipped, nested arrays come through for the caller to reject
+    assert elements == [{"a": 1}, [3, 4], {"b": 2}]
+    assert parser.finished
+
+
+def test_malformed_element_is_skipped():
+    assert feed_in_chunks('[{"a": 1}, {"b": }, {"c": 3}]', 5)[0] == [{"a": 1}, {"c": 3}]
+
+
+def test_text_after_the_array_is_ignored():
+    parser = JsonArrayStreamParser()
+    assert parser.feed('[{"a": 1}] ve [{"b": 2}]') == [{"a": 1}]
+    assert parser.feed('[{"c": 3}]') == []
+
+
+def test_iter_json_array_stops_at_the_end_of_the_array():
+    consumed = []
+
+    def chunks():
+        for chunk in ['[{"a"', ': 1}]', " sonra", " daha"]:
+            consumed.append(chunk)
+            yield chunk
+
+    assert list(iter_json_array(chunks())) == [{"a": 1}]
+    assert len(consumed) == 2
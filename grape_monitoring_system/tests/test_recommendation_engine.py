@@ -0,0 +1,78 @@
+import pytest
+
+pytest.importorskip("google.generativeai")
+pytest.importorskip("requests")
+
+from core.recommendation_engine import RecommendationEngine
+from models.analysis import Analysis
+
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGeminiClient:
+    """Hands out one scripted stream per call; a stream may raise after some chunks."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def generate_text_stream(self, prompt, response_schema=None):
+        chunks, error = self.responses[self.calls]
+        self.calls += 1
+
+        def stream():
+            for text in chunks:
+                yield FakeChunk(text)
+            if error is not None:
+                raise error
+        return stream()
+
+
+def make_engine(gemini_client):
+    engine = RecommendationEngine.__new__(RecommendationEngine)
+    engine.gemini_client = gemini_client
+    return engine
+
+
+def make_analysis(disease="Mildew"):
+    return Analysis(user_id=1, image_path="uploads/x.jpg", disease_detected=disease, confidence_score=0.9, gemini_response="")
+
+
+def test_stream_error_after_recommendations_keeps_them():
+    client = FakeGeminiClient((['[{"type": "tedavi", "description": "Bir"},', '{"type"'], ConnectionError("reset")))
+    recommendations, _ = make_engine(client).generate_recommendations(make_analysis(), weather_info="Güneşli")
+
+    descriptions = [recommendation.description for recommendation in recommendations]
+    assert descriptions[0] == "Bir"
+    assert len(descriptions) == 1 + len(RecommendationEngine.CHEMICAL_DRUG_RECOMMENDATIONS["Mildew"])
+    assert client.calls == 1
+
+
+def test_stream_error_before_any_recommendation_retries_once():
+    client = FakeGeminiClient(([], ConnectionError("reset")), (['[{"type": "tedavi", "description": "Bir"}]'], None))
+    recommendations, raw = make_engine(client).generate_recommendations(make_analysis(), weather_info="Güneşli")
+
+    assert recommendations[0].description == "Bir"
+    assert client.calls == 2
+    assert raw.startswith("[")
+
+
+def test_repeated_stream_errors_fall_back_to_chemical_recommendations():
+    client = FakeGeminiClient(([], ConnectionError("reset")), (['Önce'], ConnectionError("reset")))
+    recommendations, _ = make_engine(client).generate_recommendations(make_analysis(), weather_info="Güneşli")
+
+    assert client.calls == 2
+    assert [recommendation.recommendation_type for recommendation in recommendations][-1] == "kimyasal_ilac"
+
+
+@pytest.mark.parametrize("label", ["Sağlıklı", "Healthy"])
+def test_healthy_labels_skip_gemini(label):
+    client = FakeGeminiClient()
+    recommendations, raw = make_engine(client).generate_recommendations(make_analysis(label), weather_info="Güneşli")
+
+    assert [recommendation.recommendation_type for recommendation in recommendations] == ["prevention"]
+    assert raw is None
+    assert client.calls == 0
@@ -0,0 +1,101 @@
+import pytest
+
+from core.response_parser import extract_json, parse_diagnosis, parse_recommendation_items, validate_diagnosis
+
+VALID = '{"disease_detected": "Mildew", "confidence_score": 0.8, "explanation": "Lekeler"}'
+
+
+@pytest.mark.parametrize("text, expected_type, expected", [
+    (VALID, dict, {"disease_detected": "Mildew", "confidence_score": 0.8, "explanation": "Lekeler"}),
+    ("Sonuç: " + VALID + " umarım yardımcı olur", dict, {"disease_detected": "Mildew", "confidence_score": 0.8, "explanation": "Lekeler"}),
+    ('note {oops ... {"disease_detected": "Rust"}', dict, {"disease_detected": "Rust"}),
+    ('{"a": {"b": 1} {"c": 2}', dict, {"b": 1}),
+    ('{not json} {"a": 1}', dict, {"a": 1}),
+    ('{"text": "a } inside", "n": 1}', dict, {"text": "a } inside", "n": 1}),
+    ('{"text": "escaped \\" quote }", "n": 1}', dict, {"text": 'escaped " quote }', "n": 1}),
+    ('liste: [1, 2] ve [{"a": 1}]', list, [1, 2]),
+    ("[unclosed [3]", list, [3]),
+    ("no json here", dict, None),
+    ("{ never closed", dict, None),
+    ("", dict, None),
+])
+def test_extract_json(text, expected_type, expected):
+    assert extract_json(text, expected_type) == expected
+
+
+@pytest.mark.parametrize("confidence, expected", [
+    (0.85, 0.85),
+    (1, 1.0),
+    (0, 0.0),
+    (85, 0.85),
+    (5, 0.05),
+    (100, 1.0),
+    ("0.7", 0.7),
+    ("85%", 0.85),
+    ("3%", 0.03),
+    (" 92% ", 0.92),
+    (1.5, None),
+    (4.9, None),
+    (101, None),
+    (-0.2, None),
+    ("150%", None),
+    ("yüksek", None),
+    (True, None),
+    (None, None),
+])
+def test_validate_diagnosis_confidence(confidence, expected):
+    result, failed = validate_diagnosis({"disease_detected": "Mildew", "confidence_score": confidence, "explanation": ""})
+    if expected is None:
+        assert failed == ["confidence_score"]
+        assert "confidence_score" not in result
+    else:
+        assert failed == []
+        assert result["confidence_score"] == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("data, failed", [
+    ({"disease_detected": " Mildew ", "confidence_score": 0.5, "explanation": "x"}, []),
+    ({"disease_detected": "", "confidence_score": 0.5, "explanation": "x"}, ["disease_detected"]),
+    ({"confidence_score": 0.5}, ["disease_detected", "explanation"]),
+    ({}, ["disease_detected", "confidence_score", "explanation"]),
+])
+def test_validate_diagnosis_failed_fields(data, failed):
+    assert validate_diagnosis(data)[1] == failed
+
+
+@pytest.mark.parametrize("response, retry_answer, expected, ok", [
+    (VALID, None, {"disease_detected": "Mildew", "confidence_score": 0.8}, True),
+    ("```json\n" + VALID + "\n```", None, {"disease_detected": "Mildew", "confidence_score": 0.8}, True),
+    ('{"disease_detected": "Mildew", "confidence_score": 1.5, "explanation": "x"}', '{"confidence_score": 0.6}',
+     {"disease_detected": "Mildew", "confidence_score": 0.6}, True),
+    ('{"disease_detected": "Mildew", "confidence_score": 1.5, "explanation": "x"}', "bilmiyorum",
+     {"disease_detected": "Mildew", "confidence_score": 0.0}, False),
+    ('{"confidence_score": 0.9, "explanation": "x"}', '{"disease_detected": "Rust"}',
+     {"disease_detected": "Rust", "confidence_score": 0.9}, True),
+    ('{"confidence_score": 0.9, "explanation": "x"}', "{}", {"disease_detected": "Unknown", "confidence_score": 0.0}, False),
+    ("tamamen metin", None, {"disease_detected": "Unknown", "confidence_score": 0.0}, False),
+    (None, None, {"disease_detected": "Unknown", "confidence_score": 0.0}, False),
+])
+def test_parse_diagnosis(response, retry_answer, expected, ok):
+    retried = []
+
+    def retry_fields(fields):
+        retried.append(fields)
+        return retry_answer
+
+    result, parsed_ok = parse_diagnosis(response, retry_fields if retry_answer is not None else None)
+    assert parsed_ok is ok
+    assert {key: result[key] for key in expected} == expected
+    assert len(retried) <= 1
+
+
+@pytest.mark.parametrize("response, expected", [
+    ('[{"description": "a"}]', [{"description": "a"}]),
+    ('{"recommendations": [{"description": "a"}]}', [{"description": "a"}]),
+    ('{"type": "tedavi", "description": "a"}', [{"type": "tedavi", "description": "a"}]),
+    ('{"disease_detected": "Mildew"}', None),
+    ('{"recommendations": "yok"}', None),
+    ("düz metin öneriler", None),
+])
+def test_parse_recommendation_items(response, expected):
+    assert parse_recommendation_items(response) == expected
@@ -0,0 +1,67 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+from services.similarity_index import FEATURE_DIM, SimilarityIndex, extract_features
+
+
+def photo(seed: int) -> bytes:
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 256, (64, 64, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_query_returns_the_closest_analysis_first(tmp_path):
+    index = SimilarityIndex(str(tmp_path))
+    for analysis_id in range(1, 6):
+        assert index.add(analysis_id, photo(analysis_id))
+
+    results = index.query(photo(3), k=2)
+    assert results[0][0] == 3
+    assert results[0][1] > 0.99
+    assert len(results) == 2
+    assert index.query(photo(3), k=2, exclude_ids=[3])[0][0] != 3
+
+
+
+def test_decoded_image_matches_its_lossless_bytes():
+    data = photo(4)
+    assert np.allclose(extract_features(Image.open(io.BytesIO(data)).convert("RGB")), extract_features(data))
+
+def test_removed_analyses_are_not_returned(tmp_path):
+    index = SimilarityIndex(str(tmp_path))
+    for analysis_id in range(1, 4):
+        index.add(analysis_id, photo(analysis_id))
+    index.query(photo(1)) # Maps the files before the removal
+
+    assert index.remove(2) == 1
+    assert index.remove(42) == 0
+    assert 2 not in [analysis_id for analysis_id, _ in index.query(photo(2), k=3)]
+    assert len(index) == 3 # Marked rows stay until the next rebuild
+
+
+def test_partial_row_is_dropped_while_the_index_is_mapped(tmp_path):
+    index = SimilarityIndex(str(tmp_path))
+    index.add(1, photo(1))
+    index.query(photo(1))
+    with open(index.features_path, "ab") as f:
+        f.write(b"\0" * (FEATURE_DIM * 2)) # Half a row from an interrupted append
+
+    index.add(2, photo(2))
+    assert len(index) == 2
+    assert [analysis_id for analysis_id, _ in index.query(photo(2), k=2)] == [2, 1]
+
+
+def test_rebuild_replaces_the_mapped_index(tmp_path):
+    index = SimilarityIndex(str(tmp_path))
+    for analysis_id in range(1, 4):
+        index.add(analysis_id, photo(analysis_id))
+    index.remove(1)
+    index.query(photo(1))
+
+    assert index.rebuild([(2, photo(2)), (7, b"not an image")]) == 1
+    assert len(index) == 1
+    assert [analysis_id for analysis_id, _ in index.query(photo(2), k=5)] == [2]
@@ -0,0 +1,61 @@
+from PIL import Image
+import numpy as np
+from typing import Union
+from config.settings import (
+    QUALITY_CHECK_SIZE, MIN_SHARPNESS, MIN_MEAN_BRIGHTNESS, MAX_MEAN_BRIGHTNESS,
+    MAX_CLIPPED_FRACTION, MIN_VEGETATION_RATIO
+)
+from utils.image_utils import downscaled_rgb
+
+def _laplacian_variance(gray: np.ndarray) -> float:
+    # 4-neighbour Laplacian over the interior pixels; low variance means few edges, i.e. a blurry photo
+    laplacian = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]) - 4.0 * gray[1:-1, 1:-1]
+    return float(laplacian.var())
+
+def _vegetation_ratio(hsv: np.ndarray) -> float:
+    # Hue from yellow to green (PIL scales hue to 0-255), so yellowed or spotted leaves still count as leaf
+    hue, saturation, value = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+    leaf_pixels = (hue >= 25) & (hue <= 120) & (saturation >= 40) & (value >= 40)
+    return float(leaf_pixels.mean())
+
+def assess_image_quality(image_data: Union[bytes, Image.Image]) -> dict:
+    """
+    Scores a photo on a small downscaled copy: Laplacian-variance sharpness, exposure
+    (mean brightness and share of crushed/blown-out pixels) and the share of leaf-coloured pixels.
+    image_data is the encoded photo or an already decoded PIL image, which is not decoded again.
+    Returns the measurements plus "issues", a list of Turkish messages telling the user what to fix;
+    an empty list means the image can be sent for analysis.
+    """
+    image = downscaled_rgb(image_data, QUALITY_CHECK_SIZE)
+
+    gray = np.asarray(image.convert('L'), dtype=np.float32)
+    hsv = np.asarray(image.convert('HSV'), dtype=np.uint8)
+
+    sharpness = _laplacian_variance(gray)
+    mean_brightness = float(gray.mean())
+    dark_fraction = float((gray < 16).mean())
+    bright_fraction = float((gray > 240).mean())
+    vegetation_ratio = _vegetation_ratio(hsv)
+
+    issues = []
+    if sharpness < MIN_SHARPNESS:
+        issues.append("Görüntü bulanık. Telefonu sabit tutup yaprağa odaklanarak tekrar çekin.")
+    exposure_ok = False
+    if mean_brightness < MIN_MEAN_BRIGHTNESS or dark_fraction > MAX_CLIPPED_FRACTION:
+        issues.append("Görüntü çok karanlık. Daha aydınlık bir ortamda veya gün ışığında çekin.")
+    elif mean_brightness > MAX_MEAN_BRIGHTNESS or bright_fraction > MAX_CLIPPED_FRACTION:
+        issues.append("Görüntü aşırı pozlanmış. Doğrudan güneş ışığından kaçınarak, gölgede çekin.")
+    else:
+        exposure_ok = True
+    # Colours are unreliable in badly exposed photos, so only judge leaf content when exposure is fine
+    if exposure_ok and vegetation_ratio < MIN_VEGETATION_RATIO:
+        issues.append("Görüntüde yaprak veya bitki bulunamadı. Asma yaprağını ya da salkımı kadrajı dolduracak şekilde çekin.")
+
+    return {
+        "sharpness": sharpness,
+        "mean_brightness": mean_brightness,
+        "dark_fraction": dark_fraction,
+        "bright_fraction": bright_fraction,
+        "vegetation_ratio": vegetation_ratio,
+        "issues": issues
+    }
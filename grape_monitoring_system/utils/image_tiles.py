@@ -0,0 +1,81 @@
+from PIL import Image, ImageOps
+import io
+import numpy as np
+from config.settings import TILE_SIZE, TILE_OVERLAP, MAX_ANALYSIS_TILES, MIN_TILE_SCORE
+
+SCORING_SCALE = 8 # Tiles are scored on a copy downscaled by this factor
+LEAF_CONTEXT_RADIUS = 12 # Neighbourhood (in scoring-copy pixels) that must be mostly leaf around a lesion pixel
+MIN_LEAF_CONTEXT = 0.55 # Share of leaf pixels required in that neighbourhood
+
+def _tile_origins(length: int, tile: int, stride: int) -> list[int]:
+    if length <= tile:
+        return [0]
+    origins = list(range(0, length - tile, stride))
+    origins.append(length - tile) # Last tile sits flush with the edge instead of running past it
+    return origins
+
+def _anomaly_map(hsv: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Per-pixel masks on the scoring copy: leaf-coloured pixels, and pixels that look like lesions
+    (brown/rust/yellow spots, or whitish powdery coating) rather than healthy leaf or background.
+    """
+    hue = hsv[..., 0].astype(np.int32)
+    saturation = hsv[..., 1].astype(np.int32)
+    value = hsv[..., 2].astype(np.int32)
+    healthy_leaf = (hue >= 45) & (hue <= 120) & (saturation >= 50) & (value >= 40)
+    discoloured = (hue < 45) & (saturation >= 60) & (value >= 30) & (value <= 220) # Brown, rust, yellow
+    powdery = (saturation < 40) & (value >= 170) # Grey-white mildew coating
+    return healthy_leaf, discoloured | powdery
+
+def _overlap_area(a: tuple, b: tuple) -> int:
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    return max(0, width) * max(0, height)
+
+def _box_mean(mask: np.ndarray, radius: int) -> np.ndarray:
+    # Mean of mask over a (2 * radius + 1)^2 window via an integral image, clipped at the borders
+    padded = np.pad(mask.astype(np.float32), radius, mode='edge')
+    integral = np.pad(padded.cumsum(0).cumsum(1), ((1, 0), (1, 0)))
+    size = 2 * radius + 1
+    window_sum = integral[size:, size:] - integral[:-size, size:] - integral[size:, :-size] + integral[:-size, :-size]
+    return window_sum / (size * size)
+
+def select_candidate_tiles(image_data: bytes, max_tiles: int = MAX_ANALYSIS_TILES) -> list[dict]:
+    """
+    Cuts the full-resolution image into overlapping TILE_SIZE tiles and scores each one by its share of
+    lesion-coloured pixels surrounded by healthy leaf, using a downscaled copy so scoring stays cheap.
+    Returns up to max_tiles of the highest-scoring tiles as dicts with 'box' (left, top, right, bottom),
+    'score' and 'image_data' (JPEG bytes of the full-resolution crop), best first.
+    """
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(image_data))).convert('RGB')
+    width, height = image.size
+    scoring_copy = image.resize((max(1, width // SCORING_SCALE), max(1, height // SCORING_SCALE)), Image.Resampling.BOX)
+    healthy_leaf, lesion = _anomaly_map(np.asarray(scoring_copy.convert('HSV')))
+    # Lesions sit inside a leaf; brown soil or a white sky next to the leaf edge does not have leaf all around it
+    lesion_on_leaf = lesion & (_box_mean(healthy_leaf, LEAF_CONTEXT_RADIUS) >= MIN_LEAF_CONTEXT)
+
+    stride = TILE_SIZE - TILE_OVERLAP
+    scored = []
+    for top in _tile_origins(height, TILE_SIZE, stride):
+        for left in _tile_origins(width, TILE_SIZE, stride):
+            right, bottom = min(left + TILE_SIZE, width), min(top + TILE_SIZE, height)
+            rows = slice(top // SCORING_SCALE, max(bottom // SCORING_SCALE, top // SCORING_SCALE + 1))
+            cols = slice(left // SCORING_SCALE, max(right // SCORING_SCALE, left // SCORING_SCALE + 1))
+            score = float(lesion_on_leaf[rows, cols].mean())
+            leaf_fraction = float(healthy_leaf[rows, cols].mean())
+            scored.append((score, leaf_fraction, (left, top, right, bottom)))
+
+    # Without any lesion-like spots, prefer the tiles showing the most leaf
+    scored.sort(key=lambda item: (item[0], item[1]), reverse=True)
+    tiles = []
+    for score, _, box in scored:
+        if len(tiles) == max_tiles or (score < MIN_TILE_SCORE and tiles):
+            break # Always keep the best tile so there is something to analyze
+        # Neighbouring tiles around the same lesion mostly show the same pixels; one of them is enough
+        box_area = (box[2] - box[0]) * (box[3] - box[1])
+        if any(_overlap_area(box, tile["box"]) * 2 > box_area for tile in tiles):
+            continue
+        output_buffer = io.BytesIO()
+        image.crop(box).save(output_buffer, format='JPEG', quality=90)
+        tiles.append({"box": box, "score": score, "image_data": output_buffer.getvalue()})
+    return tiles
@@ -1,6 +1,8 @@
-from PIL import Image
+from PIL import Image, ImageOps
 import io
 import base64
+import struct
+from typing import Optional, Union
 
 def image_to_bytes(image: Image.Image, format: str = "JPEG") -> bytes:
     """
@@ -23,6 +25,33 @@ def get_image_dimensions(image_bytes: bytes) -> tuple[int, int]:
     img = Image.open(io.BytesIO(image_bytes))
     return img.width, img.height
 
+def downscaled_rgb(image: Union[bytes, Image.Image], size: int) -> Image.Image:
+    """
+    Returns an RGB copy of the image no larger than size x size.
+    Bytes are decoded with JPEG draft mode; an already decoded image (e.g. from preprocess_image)
+    is only copied, so callers that have one skip a second decode. The input image is not modified.
+    """
+    if isinstance(image, Image.Image):
+        copy = image.convert('RGB') if image.mode != 'RGB' else image.copy()
+    else:
+        copy = Image.open(io.BytesIO(image))
+        copy.draft('RGB', (size, size))
+        copy = copy.convert('RGB')
+    copy.thumbnail((size, size))
+    return copy
+
+def preview_thumbnail(image_bytes: bytes, size: int) -> Image.Image:
+    """
+    Small upright RGB copy of an upload for on-screen previews. JPEGs are decoded at a reduced DCT scale,
+    so a phone photo is never decoded at full resolution just to be shown in a column.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    # Square box, since EXIF rotation may swap width and height after decoding
+    image.draft('RGB', (size, size))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((size, size))
+    return image.convert('RGB') if image.mode != 'RGB' else image
+
 def encode_image_to_base64(image_bytes: bytes) -> str:
     """
     Encodes image bytes to a base64 string.
@@ -35,3 +64,75 @@ def decode_image_from_base64(base64_string: str) -> bytes:
     """
     return base64.b64decode(base64_string)
 
+
+# JPEG start-of-frame markers carry the image size; C4 (DHT), C8 (JPG) and CC (DAC) share the range but do not
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+def _probe_png(header: bytes) -> Optional[tuple[int, int]]:
+    # The IHDR chunk always comes first: 8-byte signature, 4-byte length, b'IHDR', width, height
+    if len(header) < 24 or header[12:16] != b'IHDR':
+        return None
+    return struct.unpack('>II', header[16:24])
+
+def _probe_jpeg(header: bytes) -> Optional[tuple[int, int]]:
+    # Jumps from segment to segment by their lengths, so large EXIF/ICC/XMP segments cost nothing to skip
+    offset = 2
+    while offset + 4 <= len(header):
+        if header[offset] != 0xFF:
+            return None
+        marker = header[offset + 1]
+        if marker == 0xFF: # Fill byte before a marker
+            offset += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD9: # Standalone markers without a length field
+            offset += 2
+            continue
+        segment_length = struct.unpack('>H', header[offset + 2:offset + 4])[0]
+        if marker in _JPEG_SOF_MARKERS:
+            if offset + 9 > len(header):
+                return None
+            height, width = struct.unpack('>HH', header[offset + 5:offset + 9])
+            return width, height
+        offset += 2 + segment_length
+    return None
+
+def _probe_webp(header: bytes) -> Optional[tuple[int, int]]:
+    chunk = header[12:16]
+    if chunk == b'VP8 ' and len(header) >= 30 and header[23:26] == b'\x9d\x01\x2a':
+        width, height = struct.unpack('<HH', header[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L' and len(header) >= 25 and header[20] == 0x2F:
+        bits = int.from_bytes(header[21:25], 'little')
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X' and len(header) >= 30:
+        return int.from_bytes(header[24:27], 'little') + 1, int.from_bytes(header[27:30], 'little') + 1
+    return None
+
+def _probe_with_pillow(image_bytes: bytes, image_format: str) -> Optional[tuple[int, int]]:
+    # Image.open is lazy: it parses the header and stops before the pixel data
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            return image.size if image.format == image_format else None
+    except Exception:
+        return None
+
+def probe_image_header(image_bytes: bytes) -> Optional[dict]:
+    """
+    Identifies an image from its magic bytes and reads its dimensions from the header, without decoding pixels.
+    Returns {"format", "width", "height"} for PNG, JPEG and WEBP, or None if the data is not a readable image of those types.
+    Headers the fast parsers do not understand are handed to Pillow, which also only reads the header.
+    """
+    if image_bytes.startswith(b'\x89PNG\r\n\x1a\n'):
+        image_format, dimensions = "PNG", _probe_png(image_bytes)
+    elif image_bytes.startswith(b'\xff\xd8'):
+        # The frame header can come after any number of EXIF/ICC/XMP segments, so the whole buffer is walked
+        image_format, dimensions = "JPEG", _probe_jpeg(image_bytes)
+    elif image_bytes[:4] == b'RIFF' and image_bytes[8:12] == b'WEBP':
+        image_format, dimensions = "WEBP", _probe_webp(image_bytes)
+    else:
+        return None
+    if not dimensions:
+        dimensions = _probe_with_pillow(image_bytes, image_format)
+    if not dimensions or dimensions[0] <= 0 or dimensions[1] <= 0:
+        return None
+    return {"format": image_format, "width": dimensions[0], "height": dimensions[1]}
@@ -1,4 +1,7 @@
 import re
+from typing import Optional
+from config.settings import MAX_UPLOAD_BYTES, MAX_IMAGE_PIXELS
+from utils.image_utils import probe_image_header
 
 def is_valid_email(email: str) -> bool:
     """
@@ -22,6 +25,22 @@ def is_valid_image_file(filename: str) -> bool:
     if not filename: return False
     return filename.lower().endswith(('.png', '.jpg', '.jpeg', '.webp'))
 
+def validate_image_upload(image_bytes: bytes) -> Optional[str]:
+    """
+    Checks an upload's size, format and pixel count from its header alone.
+    Returns a user-facing error message, or None if the image is safe to decode.
+    """
+    if not image_bytes:
+        return "Görüntü dosyası boş."
+    if len(image_bytes) > MAX_UPLOAD_BYTES:
+        return f"Dosya çok büyük (en fazla {MAX_UPLOAD_BYTES // (1024 * 1024)} MB)."
+    header = probe_image_header(image_bytes)
+    if header is None:
+        return "Dosya geçerli bir PNG, JPEG veya WEBP görüntüsü değil."
+    if header["width"] * header["height"] > MAX_IMAGE_PIXELS:
+        return f"Görüntü çözünürlüğü çok yüksek ({header['width']}x{header['height']})."
+    return None
+
 def is_valid_confidence_score(score: float) -> bool:
     """
     Checks if the confidence score is within the valid range (0.0 to 1.0).